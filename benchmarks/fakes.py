@@ -0,0 +1,295 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local stand-ins for the services used by the magics, so that the benchmarks run without network access.
+The S3 and EMR stand-ins answer the requests of the real boto3 clients from a botocore "before-send" hook, so that
+the magics, the client registry and the request signing are measured as they run on a cluster.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+FAKE_REGION = "us-east-1"
+FAKE_INSTANCE_ID = "i-0123456789abcdef0"
+LIST_OBJECTS_PAGE_SIZE = 1000
+
+
+class FakeIMDSServer:
+    """
+    IMDSv2 on a local port. Point AWS_EC2_METADATA_SERVICE_ENDPOINT to endpoint to use it.
+    """
+
+    def __init__(self, region=FAKE_REGION, instance_id=FAKE_INSTANCE_ID):
+        self.requests = Counter()
+        document = json.dumps({"region": region, "instanceId": instance_id}).encode("utf-8")
+        responses = {
+            "/latest/meta-data/instance-id": instance_id.encode("utf-8"),
+            "/latest/dynamic/instance-identity/document": document,
+        }
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_PUT(self):
+                server.requests[self.path] += 1
+                self._respond(200, b"fake-token") if self.path == "/latest/api/token" else self._respond(404, b"")
+
+            def do_GET(self):
+                server.requests[self.path] += 1
+                if not self.headers.get("X-aws-ec2-metadata-token"):
+                    self._respond(401, b"")
+                elif self.path in responses:
+                    self._respond(200, responses[self.path])
+                else:
+                    self._respond(404, b"")
+
+            def _respond(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = "http://127.0.0.1:{}".format(self._httpd.server_port)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeS3:
+    """
+    Objects kept in memory, served for the HeadObject, GetObject, PutObject and ListObjectsV2 requests.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, bucket, key, body):
+        with self._lock:
+            self.objects[(bucket, key)] = body
+
+    def handle(self, request):
+        url = urlsplit(request.url)
+        bucket, key = self._get_bucket_and_key(url)
+        query = parse_qs(url.query, keep_blank_values=True)
+        if request.method == "GET" and not key and query.get("list-type") == ["2"]:
+            return self._list_objects(bucket, query)
+        if request.method == "PUT":
+            body = request.body.read() if hasattr(request.body, "read") else (request.body or b"")
+            self.put(bucket, key, body)
+            return 200, {"ETag": _etag(body)}, b""
+
+        body = self.objects.get((bucket, key))
+        if body is None:
+            return 404, {}, b"" if request.method == "HEAD" else _s3_error("NoSuchKey")
+        headers = {"ETag": _etag(body), "Content-Length": str(len(body)),
+                   "Last-Modified": "Mon, 02 Jan 2023 00:00:00 GMT"}
+        return 200, headers, b"" if request.method == "HEAD" else body
+
+    def _get_bucket_and_key(self, url):
+        # Virtual hosted style requests carry the bucket in the host name
+        host_label = url.netloc.split(".")[0]
+        if any(bucket == host_label for bucket, _ in self.objects):
+            return host_label, unquote(url.path.lstrip("/"))
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        return bucket, unquote(key)
+
+    def _list_objects(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        start_after = query.get("continuation-token", [""])[0]
+        with self._lock:
+            keys = sorted(key for object_bucket, key in self.objects if object_bucket == bucket
+                          and key.startswith(prefix) and key > start_after)
+        page, truncated = keys[:LIST_OBJECTS_PAGE_SIZE], len(keys) > LIST_OBJECTS_PAGE_SIZE
+        contents = "".join(
+            "<Contents><Key>{}</Key><ETag>{}</ETag><Size>{}</Size>"
+            "<LastModified>2023-01-02T00:00:00.000Z</LastModified></Contents>".format(
+                escape(key), escape(_etag(self.objects[(bucket, key)])), len(self.objects[(bucket, key)]))
+            for key in page)
+        token = "<NextContinuationToken>{}</NextContinuationToken>".format(escape(page[-1])) if truncated else ""
+        body = ("<ListBucketResult><Name>{}</Name><Prefix>{}</Prefix><KeyCount>{}</KeyCount>"
+                "<IsTruncated>{}</IsTruncated>{}{}</ListBucketResult>").format(
+            escape(bucket), escape(prefix), len(page), "true" if truncated else "false", token, contents)
+        return 200, {}, body.encode("utf-8")
+
+
+class FakeEMR:
+    """
+    Notebook executions whose status follows a scripted sequence of (seconds after start, status) steps.
+    """
+
+    def __init__(self, status_sequence):
+        self.status_sequence = status_sequence
+        self.executions = {}
+        self._lock = threading.Lock()
+
+    def status_of(self, execution_id, now=None):
+        execution = self.executions[execution_id]
+        elapsed = (now or time.time()) - execution["start_time"]
+        status = self.status_sequence[0][1]
+        for offset, step_status in self.status_sequence:
+            if elapsed >= offset:
+                status = step_status
+        return status
+
+    def finished_at(self, execution_id):
+        return self.executions[execution_id]["start_time"] + self.status_sequence[-1][0]
+
+    def handle(self, request):
+        operation = request.headers["X-Amz-Target"].decode("utf-8").split(".")[-1]
+        params = json.loads(request.body or b"{}")
+        response = getattr(self, "_" + operation)(params)
+        return 200, {"Content-Type": "application/x-amz-json-1.1"}, json.dumps(response).encode("utf-8")
+
+    def _StartNotebookExecution(self, params):
+        execution_id = "ex-" + uuid.uuid4().hex[:20].upper()
+        with self._lock:
+            self.executions[execution_id] = {"start_time": time.time(), "params": params}
+        return {"NotebookExecutionId": execution_id}
+
+    def _DescribeNotebookExecution(self, params):
+        execution_id = params["NotebookExecutionId"]
+        return {"NotebookExecution": self._get_summary(execution_id)}
+
+    def _ListNotebookExecutions(self, params):
+        with self._lock:
+            execution_ids = list(self.executions)
+        return {"NotebookExecutions": [self._get_summary(execution_id) for execution_id in execution_ids]}
+
+    def _StopNotebookExecution(self, params):
+        return {}
+
+    def _get_summary(self, execution_id):
+        status = self.status_of(execution_id)
+        summary = {"NotebookExecutionId": execution_id, "Status": status,
+                   "StartTime": self.executions[execution_id]["start_time"]}
+        if status not in ("START_PENDING", "STARTING"):
+            summary["OutputNotebookURI"] = "s3://benchmark-bucket/executions/{}/output.ipynb".format(execution_id)
+        return summary
+
+
+class FakeAWS:
+    """
+    Answers the requests of the boto3 clients created from a session with the S3 and EMR stand-ins, and counts the
+    API calls. Requests to any other service fail, so that nothing goes to the network.
+    """
+
+    def __init__(self, emr_status_sequence=((0, "STARTING"), (1, "RUNNING"), (2, "FINISHED"))):
+        self.s3 = FakeS3()
+        self.emr = FakeEMR(list(emr_status_sequence))
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+
+    def install(self, events):
+        events.register("before-send", self._before_send)
+        events.register("before-call", self._count_call)
+
+    def reset_calls(self):
+        with self._calls_lock:
+            self.calls = Counter()
+
+    def _count_call(self, event_name, **kwargs):
+        with self._calls_lock:
+            self.calls[event_name.split(".", 1)[-1]] += 1
+
+    def _before_send(self, request, **kwargs):
+        from botocore.awsrequest import AWSResponse
+
+        target = request.headers.get("X-Amz-Target", b"")
+        if target.startswith(b"ElasticMapReduce."):
+            status, headers, body = self.emr.handle(request)
+        elif "s3" in urlsplit(request.url).netloc:
+            status, headers, body = self.s3.handle(request)
+        else:
+            raise RuntimeError("No stand-in for {}".format(request.url))
+        return AWSResponse(request.url, status, headers, _RawResponse(body))
+
+
+class _RawResponse:
+    def __init__(self, body):
+        self._body = body
+        self._read = False
+
+    def stream(self, **kwargs):
+        yield self.read()
+
+    def read(self, amt=None):
+        if self._read:
+            return b""
+        self._read = True
+        return self._body
+
+
+def _etag(body):
+    return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+
+def _s3_error(code):
+    return "<Error><Code>{}</Code><Message>{}</Message></Error>".format(code, code).encode("utf-8")
+
+
+FAKE_FUSE_SCRIPT = """#!/bin/sh
+# Records the mount in the fake mountinfo file instead of mounting
+for last; do :; done
+echo "$(basename "$0") $*" >> "$FAKE_FUSE_LOG"
+echo "900 1 0:99 / $last rw,nosuid,nodev - fuse.$(basename "$0") $(basename "$0") rw" >> "$FAKE_MOUNTINFO"
+"""
+
+FAKE_FUSERMOUNT_SCRIPT = """#!/bin/sh
+for last; do :; done
+echo "fusermount $*" >> "$FAKE_FUSE_LOG"
+grep -v " $last " "$FAKE_MOUNTINFO" > "$FAKE_MOUNTINFO.tmp"
+mv "$FAKE_MOUNTINFO.tmp" "$FAKE_MOUNTINFO"
+"""
+
+FAKE_FINDMNT_SCRIPT = """#!/bin/sh
+# Used by versions that check the mounts with findmnt
+echo "findmnt $*" >> "$FAKE_FUSE_LOG"
+fstype=$(grep " $1 " "$FAKE_MOUNTINFO" | sed 's/.* - \\([^ ]*\\) .*/\\1/')
+[ -n "$fstype" ] || exit 1
+echo "{\\"filesystems\\": [{\\"target\\": \\"$1\\", \\"fstype\\": \\"$fstype\\"}]}"
+"""
+
+
+def install_fake_fuse_commands(bin_dir, mountinfo_path, log_path):
+    """
+    Writes fake s3fs, goofys, fusermount and findmnt commands to bin_dir, and returns the environment variables they
+    need. Put bin_dir first on PATH to use them.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, script in [("s3fs", FAKE_FUSE_SCRIPT), ("goofys", FAKE_FUSE_SCRIPT),
+                         ("fusermount", FAKE_FUSERMOUNT_SCRIPT), ("findmnt", FAKE_FINDMNT_SCRIPT)]:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(script)
+        os.chmod(path, 0o755)
+    open(mountinfo_path, "a").close()
+    open(log_path, "a").close()
+    return {"FAKE_MOUNTINFO": mountinfo_path, "FAKE_FUSE_LOG": log_path}
@@ -0,0 +1,319 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline benchmarks of the EMR Notebooks magics.
+IMDS, S3 and EMR are replaced by the local stand-ins of fakes.py, and s3fs, goofys, fusermount and findmnt by fake
+commands, so the benchmarks run on any Linux machine without network access or AWS credentials.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --only presigned_urls --only mount --compare baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fakes import FakeAWS, FakeIMDSServer, install_fake_fuse_commands  # noqa: E402
+
+BENCHMARKS = ["extension_load", "presigned_urls", "mount", "polling"]
+WORKSPACE_ID = "e-BENCHMARK"
+WORKSPACE_BUCKET = "benchmark-bucket"
+CLUSTER_ID = "j-BENCHMARK"
+STARTUP_SCRIPT = os.path.join(REPO_DIR, "startup_script", "001-setup-emr-notebook-magics.py")
+
+# Loads the startup script in a fresh interpreter, as a new kernel does
+EXTENSION_LOAD_SCRIPT = """
+import json, sys, time
+from IPython.core.interactiveshell import InteractiveShell
+shell = InteractiveShell.instance()
+start = time.perf_counter()
+exec(compile(open(sys.argv[1]).read(), sys.argv[1], "exec"), {"get_ipython": lambda: shell})
+load_ms = (time.perf_counter() - start) * 1000
+magics = set(shell.magics_manager.magics["line"]) | set(getattr(shell.magics_manager, "lazy_magics", {}))
+print(json.dumps({"load_ms": load_ms, "registered": "execute_notebook" in magics}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark-results.json", help="JSON file the results are written to")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Benchmarks to run, all by default")
+    parser.add_argument("--iterations", type=int, default=20, help="Iterations of the short benchmarks")
+    parser.add_argument("--prefix-objects", type=int, default=2000,
+                        help="Number of objects under the prefix of the bulk presigned url benchmark")
+    parser.add_argument("--finish-after", type=float, default=12,
+                        help="Seconds after which the scripted notebook executions finish")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="emr-magics-benchmark-")
+    with FakeIMDSServer() as imds:
+        env = _get_isolated_environment(work_dir, imds.endpoint)
+        os.environ.update(env)
+        fake_aws = FakeAWS(emr_status_sequence=_get_status_sequence(args.finish_after))
+
+        results = {}
+        for name in args.only or BENCHMARKS:
+            print("Running {} ...".format(name), file=sys.stderr)
+            if name == "extension_load":
+                results[name] = bench_extension_load(env, args.iterations)
+            else:
+                shell = _get_shell(fake_aws)
+                if name == "presigned_urls":
+                    results[name] = bench_presigned_urls(shell, fake_aws, args.iterations, args.prefix_objects)
+                elif name == "mount":
+                    results[name] = bench_mount(shell, fake_aws, work_dir, args.iterations)
+                elif name == "polling":
+                    results[name] = bench_polling(shell, fake_aws)
+        results["imds_requests"] = dict(imds.requests)
+
+    report = {
+        "timestamp": time.time(),
+        "git_revision": _get_git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print("Results written to {}".format(args.output), file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f)["results"], results)
+
+
+def bench_extension_load(env, iterations):
+    """
+    Time for the startup script to register the magics in a new interpreter, with lazy and eager registration.
+    """
+    results = {}
+    for mode, lazy in [("lazy", "true"), ("eager", "false")]:
+        child_env = dict(os.environ, **env)
+        child_env.update(EMR_NOTEBOOKS_MAGICS_LAZY_LOAD=lazy, PYTHONPATH=REPO_DIR)
+        timings = []
+        for _ in range(max(iterations // 4, 3)):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", EXTENSION_LOAD_SCRIPT, STARTUP_SCRIPT],
+                                     capture_output=True, text=True, env=child_env, check=True)
+            interpreter_ms = (time.perf_counter() - start) * 1000
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+            if not result["registered"]:
+                raise RuntimeError("The startup script did not register the magics: " + process.stderr)
+            timings.append((result["load_ms"], interpreter_ms))
+        results[mode] = {"load_ms": _summarize([load for load, _ in timings]),
+                         "interpreter_ms": _summarize([total for _, total in timings])}
+    return results
+
+
+def bench_presigned_urls(shell, fake_aws, iterations, prefix_objects):
+    """
+    Latency of a presigned url for a single object, and throughput for all objects under a prefix.
+    """
+    prefix = WORKSPACE_ID + "/"
+    fake_aws.s3.put(WORKSPACE_BUCKET, prefix + "data/object.csv", b"a,b\n1,2\n")
+    for i in range(prefix_objects):
+        fake_aws.s3.put(WORKSPACE_BUCKET, prefix + "bulk/part-{:05d}.csv".format(i), b"x" * 64)
+
+    _run_magic(shell, "generate_s3_download_url", "data/object.csv")
+    fake_aws.reset_calls()
+    latencies = [_time_magic(shell, "generate_s3_download_url", "data/object.csv") for _ in range(iterations)]
+    single_calls = _per_iteration(fake_aws.calls, iterations)
+
+    fake_aws.reset_calls()
+    bulk_runs = 3
+    bulk_timings = [_time_magic(shell, "generate_s3_download_url", "bulk/") for _ in range(bulk_runs)]
+    return {
+        "single_object_ms": _summarize(latencies),
+        "single_object_api_calls": single_calls,
+        "prefix_objects": prefix_objects,
+        "prefix_ms": _summarize(bulk_timings),
+        "prefix_urls_per_second": prefix_objects / statistics.median(bulk_timings) * 1000,
+        "prefix_api_calls": _per_iteration(fake_aws.calls, bulk_runs),
+    }
+
+
+def bench_mount(shell, fake_aws, work_dir, iterations):
+    """
+    Overhead of mounting, re-mounting and unmounting with fake s3fs/goofys commands.
+    """
+    bin_dir = os.path.join(work_dir, "bin")
+    mountinfo_path = os.path.join(work_dir, "mountinfo")
+    log_path = os.path.join(work_dir, "fuse.log")
+    os.environ.update(install_fake_fuse_commands(bin_dir, mountinfo_path, log_path))
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+    fake_aws.s3.put(WORKSPACE_BUCKET, WORKSPACE_ID + "/project/main.py", b"print('hello')\n")
+
+    # The fake commands cannot change /proc/self/mountinfo, so the mount table reads their mountinfo file instead
+    _run_magic(shell, "mount_workspace_dir", "project")
+    magics = shell.magics_manager.registry["MountWorkspaceDirMagics"]
+    if hasattr(magics, "mount_table"):
+        from emr_notebooks_magics.utils.workspace_mount_table import WorkspaceMountTable
+        magics.mount_table = WorkspaceMountTable(path=os.path.join(work_dir, "workspace_mounts.json"),
+                                                 mountinfo_path=mountinfo_path)
+    _run_magic(shell, "umount_workspace_dir", "")
+    open(mountinfo_path, "w").close()
+
+    results = {}
+    for fuse_type in ["s3-fuse", "goofys"]:
+        timings = {"mount": [], "remount": [], "umount": []}
+        fake_aws.reset_calls()
+        commands_before = _count_lines(log_path)
+        for _ in range(iterations):
+            line = "project --fuse-type {}".format(fuse_type)
+            timings["mount"].append(_time_magic(shell, "mount_workspace_dir", line))
+            timings["remount"].append(_time_magic(shell, "mount_workspace_dir", line))
+            timings["umount"].append(_time_magic(shell, "umount_workspace_dir", ""))
+        results[fuse_type] = {operation + "_ms": _summarize(values) for operation, values in timings.items()}
+        results[fuse_type]["commands_per_cycle"] = (_count_lines(log_path) - commands_before) / iterations
+        results[fuse_type]["api_calls_per_cycle"] = _per_iteration(fake_aws.calls, iterations)
+    os.chdir(work_dir)
+    return results
+
+
+def bench_polling(shell, fake_aws):
+    """
+    EMR API calls and the delay between the end of a scripted execution and its detection by the magics, for one
+    blocking execution and for several concurrent executions tracked in the background.
+    """
+    results = {}
+    magics = None
+    for scenario, executions in [("single", 1), ("concurrent", 8)]:
+        fake_aws.reset_calls()
+        start = time.perf_counter()
+        if executions == 1:
+            _run_magic(shell, "execute_notebook", "notebook.ipynb")
+        else:
+            for i in range(executions):
+                _run_magic(shell, "execute_notebook", "notebook-{}.ipynb --async".format(i))
+            _run_magic(shell, "wait_notebook_execution", "")
+        wall_ms = (time.perf_counter() - start) * 1000
+
+        magics = magics or shell.magics_manager.registry["ExecuteNotebookMagics"]
+        tracked = [execution for execution in magics.tracker.list()
+                   if execution.execution_id in fake_aws.emr.executions][-executions:]
+        latencies = [(execution.end_time - fake_aws.emr.finished_at(execution.execution_id)) * 1000
+                     for execution in tracked if execution.end_time is not None]
+        results[scenario] = {
+            "executions": executions,
+            "wall_ms": wall_ms,
+            "detection_latency_ms": _summarize(latencies),
+            "api_calls": dict(fake_aws.calls),
+        }
+    return results
+
+
+def print_comparison(baseline, results, path=""):
+    """
+    Prints the numeric results that differ from the baseline, with their relative change.
+    """
+    for key, value in results.items():
+        name = path + "." + key if path else key
+        baseline_value = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            print_comparison(baseline_value or {}, value, name)
+        elif isinstance(value, (int, float)) and isinstance(baseline_value, (int, float)) and value != baseline_value:
+            change = (value - baseline_value) / baseline_value * 100 if baseline_value else float("inf")
+            print("{:<60} {:>12.2f} -> {:>12.2f} ({:+.1f}%)".format(name, baseline_value, value, change))
+
+
+def _get_isolated_environment(work_dir, imds_endpoint):
+    home_dir = os.path.join(work_dir, "home")
+    os.makedirs(home_dir, exist_ok=True)
+    return {
+        "HOME": home_dir,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_CONFIG_FILE": os.devnull,
+        "AWS_SHARED_CREDENTIALS_FILE": os.devnull,
+        "AWS_EC2_METADATA_SERVICE_ENDPOINT": imds_endpoint,
+        "KERNEL_WORKSPACE_ID": WORKSPACE_ID,
+        "KERNEL_WORKSPACE_DIR_S3_BUCKET": WORKSPACE_BUCKET,
+        "KERNEL_WORKSPACE_DIR_S3_LOCATION": WORKSPACE_ID + "/",
+        "KERNEL_WORKSPACE_DIR_S3_PREFIX": "s3://{}/{}/".format(WORKSPACE_BUCKET, WORKSPACE_ID),
+        "EMR_CLUSTER_ID": CLUSTER_ID,
+    }
+
+
+def _get_status_sequence(finish_after):
+    return [(0, "START_PENDING"), (finish_after * 0.15, "STARTING"), (finish_after * 0.3, "RUNNING"),
+            (finish_after, "FINISHED")]
+
+
+def _get_shell(fake_aws):
+    from IPython.core.interactiveshell import InteractiveShell
+    import emr_notebooks_magics
+
+    shell = InteractiveShell.instance()
+    if "generate_s3_download_url" not in shell.magics_manager.magics["line"] and \
+            "generate_s3_download_url" not in getattr(shell.magics_manager, "lazy_magics", {}):
+        emr_notebooks_magics.load_ipython_extension(shell)
+        from emr_notebooks_magics.utils.aws_clients import AWSClientRegistry
+        fake_aws.install(AWSClientRegistry.shared().session.events)
+    return shell
+
+
+def _run_magic(shell, name, line):
+    from IPython.utils.capture import capture_output
+
+    with capture_output():
+        return shell.run_line_magic(name, line)
+
+
+def _time_magic(shell, name, line):
+    start = time.perf_counter()
+    _run_magic(shell, name, line)
+    return (time.perf_counter() - start) * 1000
+
+
+def _summarize(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {"median": statistics.median(values), "min": values[0], "max": values[-1],
+            "p90": values[min(int(round(0.9 * (len(values) - 1))), len(values) - 1)], "count": len(values)}
+
+
+def _per_iteration(calls, iterations):
+    return {operation: count / iterations for operation, count in sorted(calls.items())}
+
+
+def _count_lines(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+def _get_git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,22 @@
 from .generate_s3_presigned_url import S3DownloadMagics
 from .mount_workspace_dir import MountWorkspaceDirMagics
 from .execute_emr_notebook import ExecuteNotebookMagics
+from .emr_magics_stats import EMRMagicsStatsMagics
+
+MAGICS_CLASSES = [MountWorkspaceDirMagics, S3DownloadMagics, ExecuteNotebookMagics, EMRMagicsStatsMagics]
+
+
+def load_ipython_extension(ipython, lazy=True):
+    """
+    Registers all EMR Notebooks magics with the given shell.
+    When lazy is True and the shell supports it, only the magic names are registered and each magics class
+    is created the first time one of its magics is used.
+    """
+    magics_manager = ipython.magics_manager
+    for magics_cls in MAGICS_CLASSES:
+        if lazy and hasattr(magics_manager, "register_lazy"):
+            for magic_type in ("line", "cell"):
+                for magic_name in magics_cls.magics[magic_type]:
+                    magics_manager.register_lazy(magic_name, magics_cls.__module__)
+        else:
+            ipython.register_magics(magics_cls(ipython))
@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+
+from IPython.core import magic_arguments
+from IPython.core.error import UsageError
+from IPython.core.magic import (Magics, magics_class, line_magic)
+from .utils.instrumentation import stats
+
+
+@magics_class
+class EMRMagicsStatsMagics(Magics):
+    """
+    Magic class that shows where the time of the EMR Notebooks magics goes.
+    """
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        '--enable', action='store_true',
+        help="""Start recording the wall time of the magics, AWS API calls, instance metadata requests and
+        subprocesses. Recording can also be enabled with the EMR_NOTEBOOKS_MAGICS_STATS=true environment variable."""
+    )
+    @magic_arguments.argument(
+        '--disable', action='store_true',
+        help="""Stop recording. The recorded stats are kept."""
+    )
+    @magic_arguments.argument(
+        '--reset', action='store_true',
+        help="""Clear the recorded stats"""
+    )
+    @magic_arguments.argument(
+        '--json', action='store_true',
+        help="""Print the stats as JSON instead of a table"""
+    )
+    @magic_arguments.argument(
+        '--export', default=None,
+        help="""Append the stats to the given file as JSON lines, one line per metric"""
+    )
+    @line_magic
+    def emr_magics_stats(self, line):
+        """
+        Shows the number of calls, the wall time, the errors, the retries and the throttles of the magics and of the
+        AWS API calls, instance metadata requests, subprocesses and EMR polls made by them.
+        Usage:
+            emr_magics_stats --enable
+            emr_magics_stats
+            emr_magics_stats --json
+            emr_magics_stats --export /var/log/emr_magics_stats.jsonl --reset
+        """
+        args = magic_arguments.parse_argstring(self.emr_magics_stats, line)
+        if args.enable and args.disable:
+            raise UsageError("--enable and --disable cannot be used together")
+
+        if args.enable:
+            stats.enabled = True
+            print("Recording EMR Notebooks magics stats")
+            return
+        if args.disable:
+            stats.enabled = False
+            print("Stopped recording EMR Notebooks magics stats")
+            return
+
+        if args.export:
+            stats.export_json_lines(args.export)
+            print("Exported the stats to {}".format(args.export))
+        elif args.json:
+            print(json.dumps(stats.metrics(), indent=2))
+        elif not args.reset:
+            self._print_stats()
+
+        if args.reset:
+            stats.reset()
+            print("Cleared the recorded stats")
+
+    def _print_stats(self):
+        metrics = stats.metrics()
+        if not metrics:
+            print("No stats recorded." + ("" if stats.enabled else " Run %emr_magics_stats --enable first."))
+            return
+
+        rows = [["name", "count", "total ms", "mean ms", "max ms", "errors", "retries", "throttles"]]
+        for metric in metrics:
+            rows.append([metric["name"], str(metric["count"]), "{:.1f}".format(metric["total_ms"]),
+                         "{:.1f}".format(metric["mean_ms"]), "{:.1f}".format(metric["max_ms"]),
+                         str(metric["errors"]), str(metric["retries"]), str(metric["throttles"])])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            print("  ".join(cell.rjust(width) if i else cell.ljust(width)
+                            for i, (cell, width) in enumerate(zip(row, widths))))
+
+
+def load_ipython_extension(ipython):
+    ipython.register_magics(EMRMagicsStatsMagics(ipython))
@@ -12,18 +12,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import html
+import itertools
+import json
 import os
-import boto3
 import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
 
 from IPython.core import magic_arguments
 from IPython.core.magic import (Magics, magics_class, line_magic)
 from IPython.core.error import UsageError
-from .utils.instance_metadata_service_utils import IMDSv2Util
-from .utils.display_utils import display_html
+from .utils.aws_clients import AWSClientRegistry
+from .utils.cluster_context import ClusterContextResolver
+from .utils.display_utils import display_html, update_display_html, display_notebook_cell_outputs
+from .utils.execution_result_cache import (ExecutionResultCache, LocalExecutionCacheStore, S3ExecutionCacheStore,
+                                           get_execution_cache_key, DEFAULT_CACHE_TTL_SECS, WORKSPACE_CACHE_PREFIX)
+from .utils.instrumentation import instrumented
+from .utils.output_notebook_streamer import OutputNotebookStreamer
+from .utils.notebook_stream_parser import iter_notebook_cells, get_cell_output_values, get_cell_scraps
+from .utils.notebook_batch_scheduler import NotebookBatchScheduler, NotebookTask
+from .utils.notebook_execution_history import NotebookExecutionHistory
+from .utils.notebook_execution_tracker import (NotebookExecution, NotebookExecutionTracker,
+                                               EXECUTIONS_STARTING_STATUS, EXECUTIONS_TERMINAL_STATUS)
+from .utils.str_utils import remove_prefix, compile_path_glob
 
-EXECUTIONS_TERMINAL_STATUS = ["FINISHED", "FAILED"]
-EXECUTIONS_STARTING_STATUS = ["STARTING", "START_PENDING"]
+# Interval at which the output notebook is checked for finished cells with --stream
+STREAM_INTERVAL_SECS = 5
+# Size of the chunks in which output notebooks are downloaded by %fetch_notebook_output
+FETCH_CHUNK_SIZE = 1024 * 1024
+# Workspace directory EMR writes the output notebooks of executions to. Glob patterns of %execute_notebooks only
+# match output notebooks when they start with it.
+EXECUTION_OUTPUT_PREFIX = "executions/"
+NOTEBOOK_EXECUTION_STATUSES = ["START_PENDING", "STARTING", "RUNNING", "FINISHING", "FINISHED", "FAILING", "FAILED",
+                               "STOP_PENDING", "STOPPING", "STOPPED"]
+TIME_UNITS_SECS = {"m": 60, "h": 3600, "d": 24 * 3600, "w": 7 * 24 * 3600}
 
 
 @magics_class
@@ -32,10 +57,48 @@ class ExecuteNotebookMagics(Magics):
     def __init__(self, shell):
         super(ExecuteNotebookMagics, self).__init__(shell)
         self.shell = shell
-        self.imdsv2 = IMDSv2Util()
-        self.region = self.imdsv2.get_region()
-        self.ec2 = boto3.client('ec2', region_name=self.region)
-        self.emr = boto3.client('emr', region_name=self.region)
+        self.cluster_context = ClusterContextResolver.shared()
+        # Region lookup and client creation are deferred to the first use so that kernel startup
+        # does not pay for IMDS round trips or boto3 imports.
+        self._region = None
+        self._ec2 = None
+        self._emr = None
+        self._s3 = None
+        self.tracker = NotebookExecutionTracker(self._describe_notebook_execution, self._list_notebook_executions)
+        self._history = None
+        # Executions started without --async that are no longer waited for, see _detach_execution_display
+        self._detached_executions = set()
+
+    @property
+    def region(self):
+        if self._region is None:
+            self._region = self.cluster_context.get_region()
+        return self._region
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            self._s3 = AWSClientRegistry.shared().client('s3')
+        return self._s3
+
+    @property
+    def ec2(self):
+        if self._ec2 is None:
+            self._ec2 = AWSClientRegistry.shared().client('ec2', region_name=self.region)
+        return self._ec2
+
+    @property
+    def emr(self):
+        if self._emr is None:
+            self._emr = AWSClientRegistry.shared().client('emr', region_name=self.region)
+        return self._emr
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._history = NotebookExecutionHistory(os.environ["KERNEL_WORKSPACE_ID"], self._list_notebook_executions,
+                                                     self._describe_notebook_execution)
+        return self._history
 
     @magic_arguments.magic_arguments()
     @magic_arguments.argument(
@@ -58,7 +121,45 @@ class ExecuteNotebookMagics(Magics):
         type=int,
         help="""Timeout for the execution to complete"""
     )
+    @magic_arguments.argument(
+        '--params',
+        help="""[Optional] Parameters passed to the notebook as a JSON object, e.g. '{"date": "2023-01-01"}'"""
+    )
+    @magic_arguments.argument(
+        '--param-grid',
+        help="""[Optional] JSON object mapping parameter names to lists of values, or a Workspace file containing it.
+        The notebook is executed once for every combination of values, e.g. '{"date": ["2023-01-01", "2023-01-02"]}'"""
+    )
+    @magic_arguments.argument(
+        '--max-concurrency', default=4, type=int,
+        help="""[Optional] Maximum number of executions of a --param-grid running at the same time. Default value: 4"""
+    )
+    @magic_arguments.argument(
+        '--cache', action='store_true',
+        help="""[Optional] Reuse the output of an earlier successful execution of the unchanged notebook with the same
+        parameters on the same cluster, instead of executing it again."""
+    )
+    @magic_arguments.argument(
+        '--cache-ttl', default=DEFAULT_CACHE_TTL_SECS, type=int,
+        help="""[Optional] Number of seconds a cached execution can be reused. Default value: 604800 (7 days)"""
+    )
+    @magic_arguments.argument(
+        '--cache-location', default='local', choices=['local', 'workspace'],
+        help="""[Optional] Keep the cache on the local disk of the cluster instance or in the Workspace S3 location,
+        so that it is shared by all clusters. Default value: local"""
+    )
+    @magic_arguments.argument(
+        '--stream', action='store_true',
+        help="""[Optional] Display the outputs of the cells of the output notebook as they finish."""
+    )
+    @magic_arguments.argument(
+        '--async', dest='run_async', action='store_true',
+        help="""[Optional] Return immediately and track the execution in the background.
+        Use %%list_tracked_notebook_executions, %%wait_notebook_execution and %%cancel_notebook_execution
+        to manage background executions."""
+    )
     @line_magic
+    @instrumented
     def execute_notebook(self, line):
         """
         Execute a EMR Studio Notebook non-interactively.
@@ -66,9 +167,18 @@ class ExecuteNotebookMagics(Magics):
         `
            "elasticmapreduce:StartNotebookExecution",
            "elasticmapreduce:DescribeNotebookExecution",
+           "elasticmapreduce:ListNotebookExecutions",
+           "elasticmapreduce:StopNotebookExecution",
+           "elasticmapreduce:AddTags",
            "ec2:DescribeInstances",
            "iam:PassRole"
         `
+        Executions started with parameters are named and tagged after their parameters.
+        Usage:
+            execute_notebook my_notebook.ipynb
+            execute_notebook my_notebook.ipynb --async
+            execute_notebook my_notebook.ipynb --params '{"date": "2023-01-01"}'
+            execute_notebook my_notebook.ipynb --param-grid '{"date": ["2023-01-01", "2023-01-02"], "region": ["us", "eu"]}'
         """
 
         args = magic_arguments.parse_argstring(self.execute_notebook, line)
@@ -83,39 +193,770 @@ class ExecuteNotebookMagics(Magics):
         if emr_notebooks_service_role is None:
             emr_notebooks_service_role = "EMR_Notebooks_DefaultRole"
 
+        notebook_params = self._parse_json_argument(args.params, "--params") if args.params is not None else {}
+        if not isinstance(notebook_params, dict):
+            raise UsageError("--params should be a JSON object")
+
+        result_cache = self._get_result_cache(args)
+
+        if args.stream and args.run_async:
+            raise UsageError("--stream cannot be used together with --async, use %wait_notebook_execution --stream")
+
+        if args.param_grid is not None:
+            if args.run_async:
+                raise UsageError("--async cannot be used together with --param-grid")
+            param_sets = self._expand_param_grid(args.param_grid, notebook_params)
+            display_html("Going to execute the Notebook {} with {} parameter sets using the service role {} and the cluster {}"
+                         .format(notebook, len(param_sets), emr_notebooks_service_role, emr_cluster_id))
+            tasks = [NotebookTask("{} {}".format(notebook, self._get_params_text(params)), notebook, emr_cluster_id,
+                                  params=params) for params in param_sets]
+            self._run_batch(tasks, emr_notebooks_service_role, timeout, args.max_concurrency, show_params=True,
+                            result_cache=result_cache)
+            return
+
         display_html("Going to execute the Notebook {} using the service role {} and the cluster {}".format(notebook, emr_notebooks_service_role, emr_cluster_id))
-        start_notebook_resp = self.emr.start_notebook_execution(
-            EditorId=workspace_id,
+
+        if args.run_async:
+            execution = self._start_notebook_execution(notebook, emr_cluster_id, emr_notebooks_service_role, timeout,
+                                                       on_update=self._update_execution_status_display,
+                                                       notebook_params=notebook_params, result_cache=result_cache)
+            display_html(self._get_execution_status_text(execution), display_id=self._get_display_id(execution))
+            return self.tracker.track(execution)
+
+        execution = self._start_notebook_execution(notebook, emr_cluster_id, emr_notebooks_service_role, timeout,
+                                                   on_update=self._display_execution_progress,
+                                                   notebook_params=notebook_params, result_cache=result_cache)
+        if execution.cached:
+            display_html("The Notebook has not changed since the execution {}, reusing its output.".format(execution.execution_id))
+        else:
+            display_html("Started Notebook execution with id: {}. Waiting for execution to finish...".format(execution.execution_id))
+        self.tracker.track(execution)
+        self._wait_for_execution(execution, stream=args.stream)
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'notebooks', nargs='*',
+        help="""Notebooks to be executed, relative to the Workspace root. Glob patterns such as reports/*.ipynb
+        are expanded against the notebooks in the Workspace, * does not match "/" and reports/**/*.ipynb matches
+        the notebooks of all subdirectories. Output notebooks of earlier executions are not matched."""
+    )
+    @magic_arguments.argument(
+        '--manifest',
+        help="""[Optional] JSON file listing the notebooks to be executed and their dependencies, e.g.
+        {"notebooks": ["extract.ipynb", {"path": "report.ipynb", "depends_on": ["extract.ipynb"]}]}.
+        Entries may also set their own "cluster_id" and "params"."""
+    )
+    @magic_arguments.argument(
+        '--depends-on', action='append', default=[], metavar='NOTEBOOK:DEPENDENCY',
+        help="""[Optional] Run NOTEBOOK only after DEPENDENCY has finished successfully. Can be repeated."""
+    )
+    @magic_arguments.argument(
+        '--max-concurrency', default=4, type=int,
+        help="""[Optional] Maximum number of notebooks running at the same time on a cluster. Default value: 4"""
+    )
+    @magic_arguments.argument(
+        '--cluster-id',
+        help="""[Optional] EMR cluster to be used for executing the notebooks.
+        If not specified, cluster attached to the Workspace will be used."""
+    )
+    @magic_arguments.argument(
+        '--service-role',
+        help="""[Optional] Service role to be used for executing the notebooks.
+        Default value: EMR_Notebooks_DefaultRole"""
+    )
+    @magic_arguments.argument(
+        '--timeout',
+        default=3600,
+        type=int,
+        help="""Timeout for each execution to complete"""
+    )
+    @magic_arguments.argument(
+        '--cache', action='store_true',
+        help="""[Optional] Reuse the output of an earlier successful execution of the unchanged notebook with the same
+        parameters on the same cluster, instead of executing it again."""
+    )
+    @magic_arguments.argument(
+        '--cache-ttl', default=DEFAULT_CACHE_TTL_SECS, type=int,
+        help="""[Optional] Number of seconds a cached execution can be reused. Default value: 604800 (7 days)"""
+    )
+    @magic_arguments.argument(
+        '--cache-location', default='local', choices=['local', 'workspace'],
+        help="""[Optional] Keep the cache on the local disk of the cluster instance or in the Workspace S3 location,
+        so that it is shared by all clusters. Default value: local"""
+    )
+    @line_magic
+    @instrumented
+    def execute_notebooks(self, line):
+        """
+        Execute several EMR Studio Notebooks non-interactively and in parallel.
+        A notebook is started as soon as all the notebooks it depends on have finished successfully, notebooks that
+        depend on a failed notebook are skipped. A summary of all executions is shown once the batch has completed.
+        In addition to the permissions required by %execute_notebook, "s3:ListBucket" and "s3:GetObject" on the
+        Workspace location are required to expand glob patterns and read manifests.
+        Usage:
+            execute_notebooks extract.ipynb transform.ipynb
+            execute_notebooks reports/*.ipynb --max-concurrency 8
+            execute_notebooks extract.ipynb report.ipynb --depends-on report.ipynb:extract.ipynb
+            execute_notebooks --manifest pipeline.json
+        """
+        args = magic_arguments.parse_argstring(self.execute_notebooks, line)
+        if args.max_concurrency < 1:
+            raise UsageError("--max-concurrency should be at least 1")
+
+        entries = []
+        if args.manifest is not None:
+            entries.extend(self._read_manifest(args.manifest))
+        entries.extend({"path": notebook} for notebook in self._expand_notebook_paths(args.notebooks))
+        if not entries:
+            raise UsageError("No notebooks to execute. Specify notebooks or a --manifest.")
+
+        emr_cluster_id = args.cluster_id
+        if emr_cluster_id is None and any("cluster_id" not in entry for entry in entries):
+            emr_cluster_id = self.get_cluster_id()
+        emr_notebooks_service_role = args.service_role or "EMR_Notebooks_DefaultRole"
+
+        tasks = OrderedDict()
+        for entry in entries:
+            notebook = remove_prefix(entry["path"], "./")
+            if notebook not in tasks:
+                tasks[notebook] = NotebookTask(notebook, notebook, entry.get("cluster_id", emr_cluster_id),
+                                               params=entry.get("params"))
+            tasks[notebook].dependencies.extend(remove_prefix(dependency, "./")
+                                                for dependency in entry.get("depends_on", []))
+        for dependency_edge in args.depends_on:
+            notebook, separator, dependency = dependency_edge.rpartition(":")
+            notebook = remove_prefix(notebook, "./")
+            if not separator or notebook not in tasks:
+                raise UsageError("Invalid --depends-on {}. Expected NOTEBOOK:DEPENDENCY for notebooks in the batch."
+                                 .format(dependency_edge))
+            tasks[notebook].dependencies.append(remove_prefix(dependency, "./"))
+
+        self._run_batch(list(tasks.values()), emr_notebooks_service_role, args.timeout, args.max_concurrency,
+                        show_params=any(task.params for task in tasks.values()),
+                        result_cache=self._get_result_cache(args))
+
+    @line_magic
+    @instrumented
+    def list_tracked_notebook_executions(self, line):
+        """
+        List the notebook executions started with %execute_notebook from this kernel.
+        """
+        executions = self.tracker.list()
+        if not executions:
+            print("No notebook executions have been started from this kernel.")
+            return
+
+        rows = []
+        for execution in executions:
+            rows.append([execution.execution_id, execution.notebook, execution.cluster_id,
+                         self._get_execution_status(execution), "{:.0f}s".format(execution.duration()),
+                         self._get_output_notebook_link(execution) or ""])
+        display_html(self._get_table_html(["Execution id", "Notebook", "Cluster", "Status", "Duration", "Output"], rows))
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        '--status', action='append', default=[], type=str.upper, choices=NOTEBOOK_EXECUTION_STATUSES,
+        help="""[Optional] Only list the executions in this status. Can be repeated."""
+    )
+    @magic_arguments.argument(
+        '--since',
+        help="""[Optional] Only list the executions started since this date, e.g. 2023-01-31 or 2023-01-31T08:00,
+        or within this duration, e.g. 30m, 12h or 7d"""
+    )
+    @magic_arguments.argument(
+        '--until',
+        help="""[Optional] Only list the executions started before this date or duration ago"""
+    )
+    @magic_arguments.argument(
+        '--limit', default=50, type=int,
+        help="""[Optional] Maximum number of executions listed, most recent first. Default value: 50"""
+    )
+    @magic_arguments.argument(
+        '--details', action='store_true',
+        help="""[Optional] Describe the listed executions to show their cluster and output notebook."""
+    )
+    @magic_arguments.argument(
+        '--full-refresh', action='store_true',
+        help="""[Optional] List all executions of the Workspace again instead of only those started since the
+        last refresh."""
+    )
+    @line_magic
+    @instrumented
+    def list_notebook_executions(self, line):
+        """
+        List the past and running notebook executions of the Workspace, including those not started from this kernel.
+        The executions are kept in a local history, so that only the executions started since the last refresh and
+        those that were still running are queried again.
+        Usage:
+            list_notebook_executions
+            list_notebook_executions --status FAILED --since 7d --details
+            list_notebook_executions --since 2023-01-01 --until 2023-02-01 --limit 500
+        """
+        args = magic_arguments.parse_argstring(self.list_notebook_executions, line)
+        if args.limit < 1:
+            raise UsageError("--limit should be a positive number")
+        since = self._parse_time_argument(args.since, "--since") if args.since is not None else None
+        until = self._parse_time_argument(args.until, "--until") if args.until is not None else None
+
+        self.history.refresh(full=args.full_refresh)
+        entries = self.history.list(statuses=args.status, since=since, until=until, limit=args.limit)
+        if not entries:
+            print("No notebook executions found.")
+            return
+        if args.details:
+            details = self.history.fetch_details([entry["NotebookExecutionId"] for entry in entries])
+            entries = [details.get(entry["NotebookExecutionId"], entry) for entry in entries]
+
+        rows = []
+        for entry in entries:
+            tracked = self.tracker.get(entry["NotebookExecutionId"])
+            output_notebook_uri = entry.get("OutputNotebookURI") or (tracked.output_notebook_uri if tracked else None)
+            output_link = ""
+            if output_notebook_uri is not None and entry["Status"] in EXECUTIONS_TERMINAL_STATUS:
+                workspace_relative_path = self.get_output_nb_workspace(output_notebook_uri)
+                if workspace_relative_path is not None:
+                    output_link = """<a href="{}">{}</a>""".format(workspace_relative_path, workspace_relative_path)
+            cluster_id = entry.get("ExecutionEngineId") or entry.get("ExecutionEngine", {}).get("Id") \
+                or (tracked.cluster_id if tracked else "")
+            rows.append([entry["NotebookExecutionId"], html.escape(self._get_history_entry_name(entry, tracked)),
+                         entry["Status"], self._format_time(entry.get("StartTime")),
+                         self._get_history_entry_duration(entry), cluster_id, output_link])
+        display_html(self._get_table_html(["Execution id", "Notebook", "Status", "Started", "Duration", "Cluster",
+                                           "Output"], rows))
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'execution_id', nargs='?', default=None,
+        help="""[Optional] Id of the notebook execution to wait for. If not specified, waits for all tracked executions."""
+    )
+    @magic_arguments.argument(
+        '--timeout', default=None, type=int,
+        help="""[Optional] Maximum number of seconds to wait"""
+    )
+    @magic_arguments.argument(
+        '--stream', action='store_true',
+        help="""[Optional] Display the outputs of the cells of the output notebook as they finish."""
+    )
+    @line_magic
+    @instrumented
+    def wait_notebook_execution(self, line):
+        """
+        Wait for notebook executions started with %execute_notebook --async to finish.
+        Usage:
+            wait_notebook_execution
+            wait_notebook_execution ex-XXXXXXXXXXXXXXXXXXXXXXXXXXXXX --timeout 600
+            wait_notebook_execution ex-XXXXXXXXXXXXXXXXXXXXXXXXXXXXX --stream
+        """
+        args = magic_arguments.parse_argstring(self.wait_notebook_execution, line)
+        if args.execution_id is not None:
+            executions = [self._get_tracked_execution(args.execution_id)]
+        else:
+            executions = self.tracker.list()
+
+        for execution in executions:
+            if not self._wait_for_execution(execution, args.timeout, stream=args.stream):
+                return
+            display_html(self._get_execution_status_text(execution))
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'execution_id',
+        help="""Id of the notebook execution to cancel"""
+    )
+    @line_magic
+    @instrumented
+    def cancel_notebook_execution(self, line):
+        """
+        Cancel a notebook execution started with %execute_notebook.
+        Usage:
+            cancel_notebook_execution ex-XXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+        """
+        args = magic_arguments.parse_argstring(self.cancel_notebook_execution, line)
+        execution = self._get_tracked_execution(args.execution_id)
+        if execution.is_done():
+            raise UsageError("Notebook execution {} has already completed.".format(args.execution_id))
+
+        self.emr.stop_notebook_execution(NotebookExecutionId=args.execution_id)
+        self.tracker.poll_now(args.execution_id)
+        display_html("Requested to stop the Notebook execution {}.".format(args.execution_id))
+
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'source',
+        help="""Output notebook to read from: a notebook execution id, a S3 path or a path relative to the Workspace root"""
+    )
+    @magic_arguments.argument(
+        '--scrap', action='append', default=[],
+        help="""[Optional] Name of a scrap glued with scrapbook. The value is stored in a variable of the same name.
+        Can be repeated."""
+    )
+    @magic_arguments.argument(
+        '--tag', action='append', default=[],
+        help="""[Optional] Fetch the outputs of the cells with this tag. Can be repeated."""
+    )
+    @magic_arguments.argument(
+        '--cell', action='append', default=[], type=int,
+        help="""[Optional] Fetch the outputs of the cell at this 0-based index. Can be repeated."""
+    )
+    @magic_arguments.argument(
+        '--as', dest='variable', default='notebook_outputs',
+        help="""[Optional] Variable the cell outputs are stored in, as a dict of cell index to list of outputs.
+        Default value: notebook_outputs"""
+    )
+    @line_magic
+    @instrumented
+    def fetch_notebook_output(self, line):
+        """
+        Fetch values from an output notebook into the current kernel.
+        The output notebook is parsed while it is downloaded, so only the selected outputs are kept in memory.
+        "s3:GetObject" permission on the output notebook is required on EMR-EC2 role.
+        Usage:
+            fetch_notebook_output ex-XXXXXXXXXXXXXXXXXXXXXXXXXXXXX --scrap row_count
+            fetch_notebook_output path/to/output.ipynb --tag results --as results
+            fetch_notebook_output s3://my_bucket/path/to/output.ipynb --cell 3
+        """
+        args = magic_arguments.parse_argstring(self.fetch_notebook_output, line)
+        if not (args.scrap or args.tag or args.cell):
+            raise UsageError("Specify the outputs to fetch with --scrap, --tag or --cell")
+
+        output_notebook_uri = self._get_output_notebook_uri(args.source)
+        parsed_url = urlparse(output_notebook_uri, allow_fragments=False)
+        body = self.s3.get_object(Bucket=parsed_url.netloc, Key=remove_prefix(parsed_url.path, "/"))["Body"]
+
+        tags = set(args.tag)
+        cell_indexes = set(args.cell)
+        scrap_names = set(args.scrap)
+        cell_outputs = {}
+        scraps = {}
+        try:
+            for index, cell in enumerate(iter_notebook_cells(body.iter_chunks(FETCH_CHUNK_SIZE))):
+                if index in cell_indexes or tags.intersection(cell.get("metadata", {}).get("tags", [])):
+                    cell_outputs[index] = get_cell_output_values(cell)
+                for name, value in get_cell_scraps(cell).items():
+                    if name in scrap_names:
+                        scraps[name] = value
+                if not tags and not scrap_names - set(scraps) and cell_indexes.issubset(cell_outputs):
+                    break
+        finally:
+            body.close()
+
+        missing_scraps = scrap_names - set(scraps)
+        if missing_scraps:
+            raise UsageError("Scraps not found in the output notebook: {}".format(", ".join(sorted(missing_scraps))))
+        missing_cells = cell_indexes - set(cell_outputs)
+        if missing_cells:
+            raise UsageError("Cells not found in the output notebook: {}".format(
+                ", ".join(str(index) for index in sorted(missing_cells))))
+
+        self.shell.user_ns.update(scraps)
+        fetched = sorted(scraps)
+        if args.tag or args.cell:
+            self.shell.user_ns[args.variable] = cell_outputs
+            fetched.append(args.variable)
+
+        output_notebook = self.get_output_nb_workspace(output_notebook_uri) or output_notebook_uri
+        display_html("Fetched {} from the output notebook {}".format(", ".join(fetched), output_notebook))
+
+    def _get_output_notebook_uri(self, source):
+        if source.startswith("s3://"):
+            return source
+
+        execution = self.tracker.get(source)
+        if execution is not None and execution.output_notebook_uri is not None:
+            return execution.output_notebook_uri
+        if source.startswith("ex-"):
+            notebook_execution = self._describe_notebook_execution(source)
+            if "OutputNotebookURI" not in notebook_execution:
+                raise UsageError("Notebook execution {} does not have an output notebook yet.".format(source))
+            return notebook_execution["OutputNotebookURI"]
+
+        return os.environ["KERNEL_WORKSPACE_DIR_S3_PREFIX"] + remove_prefix(source, "./")
+
+    def _start_notebook_execution(self, notebook, emr_cluster_id, emr_notebooks_service_role, timeout, on_update,
+                                  notebook_params=None, result_cache=None):
+        if result_cache is not None:
+            cache_key = self._get_execution_cache_key(notebook, emr_cluster_id, notebook_params)
+            entry = result_cache.get(cache_key)
+            if entry is not None and self._is_valid_s3_uri(entry["output_notebook_uri"]):
+                execution = NotebookExecution(entry["execution_id"], notebook, emr_cluster_id, timeout,
+                                              on_update=on_update)
+                execution.update({"Status": entry["status"], "OutputNotebookURI": entry["output_notebook_uri"]})
+                execution.cached = True
+                execution.finish()
+                return execution
+            on_update = self._get_caching_on_update(result_cache, cache_key, on_update)
+
+        request = dict(
+            EditorId=os.environ["KERNEL_WORKSPACE_ID"],
             RelativePath=notebook,
             ExecutionEngine={'Id': emr_cluster_id},
             ServiceRole=emr_notebooks_service_role
         )
+        if notebook_params:
+            request["NotebookParams"] = json.dumps(notebook_params)
+            request["NotebookExecutionName"] = "{} {}".format(notebook, self._get_params_text(notebook_params))[:256]
+            request["Tags"] = [{"Key": "param:{}".format(name)[:128], "Value": self._get_param_value_text(value)[:256]}
+                               for name, value in notebook_params.items()]
+        start_notebook_resp = self.emr.start_notebook_execution(**request)
+        return NotebookExecution(start_notebook_resp["NotebookExecutionId"], notebook, emr_cluster_id, timeout,
+                                 on_update=on_update)
 
-        notebook_execution_id = start_notebook_resp["NotebookExecutionId"]
-        display_html("Started Notebook execution with id: {}. Waiting for execution to finish...".format(notebook_execution_id))
+    def _get_result_cache(self, args):
+        if not args.cache:
+            return None
+        if args.cache_location == "workspace":
+            store = S3ExecutionCacheStore(self.s3, os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"],
+                                          os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + WORKSPACE_CACHE_PREFIX)
+        else:
+            store = LocalExecutionCacheStore()
+        return ExecutionResultCache(store, ttl_secs=args.cache_ttl)
 
-        # Polling for execution to finish
-        start = time.time()
+    def _get_execution_cache_key(self, notebook, emr_cluster_id, notebook_params):
+        s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + notebook
+        notebook_etag = self.s3.head_object(Bucket=s3_bucket, Key=s3_key)["ETag"]
+        return get_execution_cache_key(os.environ["KERNEL_WORKSPACE_ID"], notebook, notebook_etag, notebook_params,
+                                       emr_cluster_id)
 
-        is_nb_output_link_shown = False
+    def _get_caching_on_update(self, result_cache, cache_key, on_update):
+        # The tracker calls on_update before waking up the waiters, so the result is cached before
+        # %execute_notebook returns. The execution is cached as soon as EMR reports it as finished.
+        cached = []
 
-        # Note: Timeout will NOT be precise as there is 10s sleep inside the loop.
-        while (time.time() - start) < timeout:
-            describe_response = self.emr.describe_notebook_execution(NotebookExecutionId=notebook_execution_id)
-            execution_status = describe_response["NotebookExecution"]["Status"]
-            if not is_nb_output_link_shown and "OutputNotebookURI" in describe_response["NotebookExecution"] and execution_status not in EXECUTIONS_STARTING_STATUS:
-                workspace_relative_path = self.get_output_nb_workspace(describe_response["NotebookExecution"]["OutputNotebookURI"])
-                if workspace_relative_path is not None:
-                    text = """Output of the cells that have finished execution are captured in a new notebook file <a href="{}">{}</a>.""".format(
-                        workspace_relative_path, workspace_relative_path)
-                    display_html(text)
-                    is_nb_output_link_shown = True
+        def caching_on_update(execution):
+            if not cached and execution.error is None and not execution.timed_out \
+                    and execution.status == "FINISHED" and execution.output_notebook_uri is not None:
+                cached.append(execution.execution_id)
+                try:
+                    result_cache.put(cache_key, execution)
+                except Exception as e:
+                    display_html("Unable to cache the result of the Notebook execution {}: {}"
+                                 .format(execution.execution_id, e))
+            if on_update is not None:
+                on_update(execution)
+        return caching_on_update
 
-            if execution_status in EXECUTIONS_TERMINAL_STATUS:
-                display_html("Execution completed. Status: {}".format(execution_status))
-                break
+    def _is_valid_s3_uri(self, s3_uri):
+        import botocore
 
-            time.sleep(10)
+        parsed_url = urlparse(s3_uri, allow_fragments=False)
+        try:
+            self.s3.head_object(Bucket=parsed_url.netloc, Key=remove_prefix(parsed_url.path, "/"))
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "404":
+                return False
+            raise
+        return True
+
+    def _run_batch(self, tasks, emr_notebooks_service_role, timeout, max_concurrency, show_params=False,
+                   result_cache=None):
+        if max_concurrency < 1:
+            raise UsageError("--max-concurrency should be at least 1")
+
+        def start_execution(task, on_update):
+            execution = self._start_notebook_execution(task.notebook, task.cluster_id, emr_notebooks_service_role,
+                                                       timeout, on_update=on_update, notebook_params=task.params,
+                                                       result_cache=result_cache)
+            return self.tracker.track(execution)
+
+        display_id = "emr-notebook-batch-{}".format(uuid.uuid4())
+        try:
+            scheduler = NotebookBatchScheduler(tasks, start_execution, max_concurrency,
+                                               on_progress=lambda batch: update_display_html(
+                                                   self._get_batch_progress_text(batch), display_id=display_id))
+        except ValueError as e:
+            raise UsageError(str(e))
+
+        display_html(self._get_batch_progress_text(scheduler.tasks), display_id=display_id)
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            display_html("Stopped scheduling new notebooks. Notebook executions that have already started continue "
+                         "in the background, use %list_tracked_notebook_executions to see them.")
+
+        headers = ["Notebook", "Execution id", "Cluster", "Status", "Duration", "Output"]
+        if show_params:
+            headers.insert(1, "Parameters")
+        rows = []
+        for task in scheduler.tasks:
+            execution = task.execution
+            row = [task.notebook, execution.execution_id if execution else "", task.cluster_id, task.get_status(),
+                   "{:.0f}s".format(execution.duration()) if execution else "",
+                   (self._get_output_notebook_link(execution) if execution else None) or ""]
+            if show_params:
+                row.insert(1, html.escape(self._get_params_text(task.params or {})))
+            rows.append(row)
+        display_html(self._get_table_html(headers, rows))
+
+    def _parse_json_argument(self, value, argument_name):
+        # Magic arguments keep the quotes around values, e.g. --params '{"a": 1}'
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+            value = value[1:-1]
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            raise UsageError("{} should be valid JSON: {}".format(argument_name, e))
+
+    @staticmethod
+    def _parse_time_argument(value, argument_name):
+        """
+        Parses a date or a duration before now, e.g. 12h, into a timestamp.
+        """
+        value = value.strip("'\"")
+        if value[:-1].isdigit() and value[-1:].lower() in TIME_UNITS_SECS:
+            return time.time() - int(value[:-1]) * TIME_UNITS_SECS[value[-1:].lower()]
+        try:
+            date = datetime.fromisoformat(value)
+        except ValueError:
+            raise UsageError("{} should be a date such as 2023-01-31 or 2023-01-31T08:00, or a duration such as 30m, "
+                             "12h or 7d".format(argument_name))
+        return date.timestamp()
+
+    @staticmethod
+    def _format_time(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else ""
+
+    def _get_history_entry_name(self, entry, tracked):
+        if tracked is not None:
+            return tracked.notebook
+        if entry.get("NotebookExecutionName"):
+            return entry["NotebookExecutionName"]
+        location = entry.get("NotebookS3Location")
+        if not location:
+            return ""
+        return self.get_output_nb_workspace("s3://{}/{}".format(location["Bucket"], location["Key"])) \
+            or location["Key"]
+
+    @staticmethod
+    def _get_history_entry_duration(entry):
+        if not entry.get("StartTime"):
+            return ""
+        end_time = entry.get("EndTime") or (time.time() if entry["Status"] not in EXECUTIONS_TERMINAL_STATUS else None)
+        return "{:.0f}s".format(end_time - entry["StartTime"]) if end_time else ""
+
+    def _expand_param_grid(self, param_grid, base_params):
+        if not param_grid.lstrip("'\"").startswith("{"):
+            param_grid = self._read_workspace_file(param_grid)
+        grid = self._parse_json_argument(param_grid, "--param-grid")
+        if not isinstance(grid, dict) or not grid:
+            raise UsageError("--param-grid should be a non-empty JSON object")
+
+        names = list(grid.keys())
+        values = [value if isinstance(value, list) else [value] for value in grid.values()]
+        param_sets = []
+        for combination in itertools.product(*values):
+            params = dict(base_params)
+            params.update(zip(names, combination))
+            param_sets.append(params)
+        if not param_sets:
+            raise UsageError("--param-grid does not contain any parameter values")
+        return param_sets
+
+    @staticmethod
+    def _get_param_value_text(value):
+        return value if isinstance(value, str) else json.dumps(value)
+
+    def _get_params_text(self, params):
+        return ", ".join("{}={}".format(name, self._get_param_value_text(value)) for name, value in params.items())
+
+    def _expand_notebook_paths(self, patterns):
+        notebooks = []
+        workspace_notebooks = None
+        for pattern in patterns:
+            pattern = remove_prefix(pattern, "./")
+            if not any(glob_char in pattern for glob_char in "*?["):
+                notebooks.append(pattern)
+                continue
+
+            if workspace_notebooks is None:
+                workspace_notebooks = self._list_workspace_notebooks()
+            pattern_regex = compile_path_glob(pattern)
+            include_outputs = pattern.startswith(EXECUTION_OUTPUT_PREFIX)
+            matches = [notebook for notebook in workspace_notebooks if pattern_regex.match(notebook) and
+                       (include_outputs or not notebook.startswith(EXECUTION_OUTPUT_PREFIX))]
+            if not matches:
+                raise UsageError("No notebooks in the Workspace match {}".format(pattern))
+            notebooks.extend(matches)
+        return notebooks
+
+    def _list_workspace_notebooks(self):
+        s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"]
+        notebooks = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=s3_key):
+            for s3_object in page.get("Contents", []):
+                if s3_object["Key"].endswith(".ipynb"):
+                    notebooks.append(s3_object["Key"][len(s3_key):])
+        return sorted(notebooks)
+
+    def _read_workspace_file(self, path):
+        if os.path.isfile(path):
+            with open(path) as f:
+                return f.read()
+
+        s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + remove_prefix(path, "./")
+        return self.s3.get_object(Bucket=s3_bucket, Key=s3_key)["Body"].read().decode("utf-8")
+
+    def _read_manifest(self, path):
+        try:
+            manifest = json.loads(self._read_workspace_file(path))
+        except ValueError as e:
+            raise UsageError("{} is not a valid JSON manifest: {}".format(path, e))
+
+        if isinstance(manifest, dict):
+            manifest = manifest.get("notebooks", [])
+        entries = []
+        for entry in manifest:
+            if isinstance(entry, str):
+                entry = {"path": entry}
+            if not isinstance(entry, dict) or "path" not in entry:
+                raise UsageError("Invalid manifest entry {}. Expected a notebook path or an object with a \"path\"."
+                                 .format(entry))
+            entries.append(entry)
+        return entries
+
+    def _describe_notebook_execution(self, notebook_execution_id):
+        describe_response = self.emr.describe_notebook_execution(NotebookExecutionId=notebook_execution_id)
+        return describe_response["NotebookExecution"]
+
+    def _list_notebook_executions(self, from_time=None):
+        # Without From, ListNotebookExecutions only returns the executions of the last 30 days, so all executions
+        # are listed from the epoch.
+        paginator = self.emr.get_paginator('list_notebook_executions')
+        for page in paginator.paginate(EditorId=os.environ["KERNEL_WORKSPACE_ID"],
+                                       From=datetime.fromtimestamp(from_time or 0, timezone.utc)):
+            for summary in page["NotebookExecutions"]:
+                yield summary
+
+    def _wait_for_execution(self, execution, timeout=None, stream=False):
+        """
+        Blocks until the execution is done. Returns False if the wait timed out or was interrupted.
+        When stream is True, the outputs of the cells of the output notebook are displayed as they finish.
+        """
+        try:
+            if stream:
+                is_done = self._stream_execution_outputs(execution, timeout)
+            else:
+                is_done = execution.wait(timeout)
+            if not is_done:
+                display_html("Notebook execution {} is still running.".format(execution.execution_id))
+                self._detach_execution_display(execution)
+                return False
+        except KeyboardInterrupt:
+            display_html("Stopped waiting. The Notebook execution {} continues in the background, use "
+                         "%wait_notebook_execution to wait for it.".format(execution.execution_id))
+            self._detach_execution_display(execution)
+            return False
+        return True
+
+    def _detach_execution_display(self, execution):
+        """
+        Once nothing waits for the execution anymore, its progress is shown in a status line of the current cell
+        that is updated in place, instead of being displayed into whatever cell runs when the execution is updated.
+        """
+        if execution.is_done() or execution.execution_id in self._detached_executions:
+            return
+        self._detached_executions.add(execution.execution_id)
+        display_html(self._get_execution_status_text(execution), display_id=self._get_display_id(execution))
+
+    def _stream_execution_outputs(self, execution, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        streamer = None
+        while True:
+            wait_secs = STREAM_INTERVAL_SECS if deadline is None else \
+                max(0, min(STREAM_INTERVAL_SECS, deadline - time.time()))
+            is_done = execution.wait(wait_secs)
+
+            if streamer is None and execution.output_notebook_uri is not None:
+                streamer = OutputNotebookStreamer(self.s3, execution.output_notebook_uri)
+            if streamer is not None:
+                for cell in streamer.get_finished_cells(final=is_done):
+                    display_notebook_cell_outputs(cell)
+
+            if is_done:
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+    def _get_tracked_execution(self, execution_id):
+        execution = self.tracker.get(execution_id)
+        if execution is None:
+            raise UsageError("Notebook execution {} was not started from this kernel.".format(execution_id))
+        return execution
+
+    def _display_execution_progress(self, execution):
+        if execution.execution_id in self._detached_executions:
+            self._update_execution_status_display(execution)
+            return
+        if not execution.is_output_link_shown:
+            output_link = self._get_output_notebook_link(execution)
+            if output_link is not None:
+                display_html("Output of the cells that have finished execution are captured in a new notebook file {}."
+                             .format(output_link))
+                execution.is_output_link_shown = True
+
+        if execution.is_done():
+            if execution.error is None and not execution.timed_out:
+                display_html("Execution completed. Status: {}".format(execution.status))
+            else:
+                display_html(self._get_execution_status_text(execution))
+
+    def _update_execution_status_display(self, execution):
+        update_display_html(self._get_execution_status_text(execution), display_id=self._get_display_id(execution))
+
+    def _get_execution_status_text(self, execution):
+        if execution.error is not None:
+            return "Unable to track the Notebook execution {}: {}".format(execution.execution_id, execution.error)
+        if execution.timed_out:
+            return "Timed out waiting for the Notebook execution {}. Last known status: {}".format(
+                execution.execution_id, execution.status)
+        if execution.is_done():
+            text = "Notebook execution {} of {} completed. Status: {}".format(
+                execution.execution_id, execution.notebook, self._get_execution_status(execution))
+        else:
+            text = "Notebook execution {} of {} on the cluster {}. Status: {}".format(
+                execution.execution_id, execution.notebook, execution.cluster_id, execution.status or "STARTING")
+        output_link = self._get_output_notebook_link(execution)
+        if output_link is not None:
+            text += " Output notebook: {}".format(output_link)
+        return text
+
+    def _get_execution_status(self, execution):
+        if execution.error is not None:
+            return "UNKNOWN"
+        if execution.timed_out:
+            return "{} (timed out)".format(execution.status)
+        if execution.cached:
+            return "{} (cached)".format(execution.status)
+        return execution.status or "STARTING"
+
+    def _get_output_notebook_link(self, execution):
+        if execution.output_notebook_uri is None or execution.status in EXECUTIONS_STARTING_STATUS:
+            return None
+        workspace_relative_path = self.get_output_nb_workspace(execution.output_notebook_uri)
+        if workspace_relative_path is None:
+            return None
+        return """<a href="{}">{}</a>""".format(workspace_relative_path, workspace_relative_path)
+
+    def _get_batch_progress_text(self, tasks):
+        counts = OrderedDict()
+        for task in tasks:
+            status = task.get_status()
+            counts[status] = counts.get(status, 0) + 1
+        return "Running {} notebook executions: {}".format(
+            len(tasks), ", ".join("{} {}".format(count, status) for status, count in counts.items()))
+
+    @staticmethod
+    def _get_table_html(headers, rows):
+        header_html = "".join("<th>{}</th>".format(header) for header in headers)
+        rows_html = "".join("<tr>{}</tr>".format("".join("<td>{}</td>".format(cell) for cell in row)) for row in rows)
+        return "<table><tr>{}</tr>{}</table>".format(header_html, rows_html)
+
+    @staticmethod
+    def _get_display_id(execution):
+        return "emr-notebook-execution-{}".format(execution.execution_id)
 
     def get_output_nb_workspace(self, output_notebook_uri):
         workspace_s3_prefix = os.environ["KERNEL_WORKSPACE_DIR_S3_PREFIX"]
@@ -124,10 +965,11 @@ class ExecuteNotebookMagics(Magics):
         return None
 
     def get_cluster_id(self):
-        ec2_instance_id = self.imdsv2.ec2_instance_id()
-        desc_ec2_instance_resp = self.ec2.describe_instances(InstanceIds=[ec2_instance_id])
-        for tag in desc_ec2_instance_resp['Reservations'][0]['Instances'][0]['Tags']:
-            if tag['Key'] == 'aws:elasticmapreduce:job-flow-id':
-                return tag['Value']
+        cluster_id = self.cluster_context.get_cluster_id(lambda: self.ec2)
+        if cluster_id is None:
+            raise UsageError("Unable to determine cluster id. Please use --cluster-id parameter")
+        return cluster_id
+
 
-        raise UsageError("Unable to determine cluster id. Please use --cluster-id parameter")
\ No newline at end of file
+def load_ipython_extension(ipython):
+    ipython.register_magics(ExecuteNotebookMagics(ipython))
@@ -11,28 +11,53 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import boto3
-import botocore
+import fnmatch
+import html
+import json
 import os
+import time
+import uuid
+import zipfile
 from IPython.core import magic_arguments
 from IPython.core.error import UsageError
 from IPython.core.magic import (Magics, magics_class, line_magic)
 from IPython.display import display, HTML
 from urllib.parse import urlparse
 from datetime import datetime, timedelta, timezone
-from .utils.str_utils import remove_prefix
+from .utils.aws_clients import AWSClientRegistry
+from .utils.display_utils import display_html, update_display_html
+from .utils.instrumentation import instrumented
+from .utils.s3_parallel_download import S3ObjectDownload, S3ParallelDownloader
+from .utils.s3_zip_bundle import bundle_s3_objects
+from .utils.str_utils import remove_prefix, format_size
+
+# Multipart upload settings of --bundle. At most BUNDLE_MAX_WORKERS parts are held in memory at any time.
+BUNDLE_PART_SIZE = 16 * 1024 * 1024
+BUNDLE_MAX_WORKERS = 4
 
 
 @magics_class
 class S3DownloadMagics(Magics):
     """
-    Magic class that generates presigned url of a S3 object
+    Magic class that generates presigned url of a S3 object and downloads S3 objects
     """
 
     def __init__(self, shell):
         super(S3DownloadMagics, self).__init__(shell)
-        self.s3_client = boto3.client('s3')
-        self.s3_resource = boto3.resource('s3')
+        self._s3_client = None
+        self._s3_resource = None
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            self._s3_client = AWSClientRegistry.shared().client('s3')
+        return self._s3_client
+
+    @property
+    def s3_resource(self):
+        if self._s3_resource is None:
+            self._s3_resource = AWSClientRegistry.shared().resource('s3')
+        return self._s3_resource
 
     @magic_arguments.magic_arguments()
     @magic_arguments.argument(
@@ -46,26 +71,57 @@ class S3DownloadMagics(Magics):
         type=int,
         help="""Number of seconds until the download URL expires.(Default 3600 seconds)"""
     )
+    @magic_arguments.argument(
+        '--manifest',
+        default=None,
+        help="""[Optional] For a prefix or glob pattern, write the download URLs to this local JSON file instead of
+        displaying them"""
+    )
+    @magic_arguments.argument(
+        '--bundle',
+        nargs='?',
+        const='',
+        default=None,
+        help="""[Optional] For a prefix or glob pattern, stream all matching S3 objects into a single zip archive and
+        generate one download url for it. The archive is written to the given S3 path, or next to the prefix
+        (e.g. s3://my_bucket/path/to/folder.zip) if no path is given, unless an object of that name exists"""
+    )
+    @magic_arguments.argument(
+        '--compress',
+        action='store_true',
+        help="""[Optional] Compress the files of the --bundle zip archive (deflate). By default files are stored"""
+    )
     @line_magic
+    @instrumented
     def generate_s3_download_url(self, line):
         """
         Generates an url to download a S3 object. Argument should be full S3 path for an S3 object.
+        When the path ends with "/" or contains a glob pattern (*, ?, [), urls are generated for all matching S3 objects
+        with a single listing of the prefix.
         Usage:
             generate_s3_download_url s3://path/to/s3/object --expires-in 1200
+            generate_s3_download_url s3://path/to/s3/folder/
+            generate_s3_download_url s3://path/to/s3/folder/part-*.csv --manifest urls.json
+            generate_s3_download_url s3://path/to/s3/folder/ --bundle
+            generate_s3_download_url s3://path/to/s3/folder/ --bundle s3://path/to/s3/bundle.zip
         """
         args = magic_arguments.parse_argstring(self.generate_s3_download_url, line)
 
-        parsed_url = urlparse(args.path, allow_fragments=False)
-        key = remove_prefix(parsed_url.path, "/")
+        s3_bucket, key = self._parse_s3_path(args.path)
+
+        if key == "" or key.endswith("/") or any(glob_char in key for glob_char in "*?["):
+            if args.bundle is not None:
+                self._generate_s3_bundle_download_url(s3_bucket, key, args.bundle, args.compress, args.expires_in)
+            else:
+                self._generate_s3_download_urls(s3_bucket, key, args.expires_in, args.manifest)
+            return
+        if args.bundle is not None:
+            raise UsageError("--bundle requires a S3 prefix ending with / or a glob pattern")
 
-        if not self._is_valid_s3_object(parsed_url.netloc, key):
+        if not self._is_valid_s3_object(s3_bucket, key):
             raise UsageError("{} is not a valid S3 object.".format(args.path))
 
-        signed_url = self.s3_client.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={'Bucket': parsed_url.netloc,
-                    'Key': key},
-            ExpiresIn=args.expires_in)
+        signed_url = self._generate_presigned_url(s3_bucket, key, args.expires_in)
 
         expiry_time_abs, expiry_time_rel = self._get_expiry_time_text(args.expires_in)
         html = HTML("""<a href="{}">Click here</a> to download the S3 object. The link will expire at {} [in {}] """
@@ -73,7 +129,241 @@ class S3DownloadMagics(Magics):
                     )
         display(html)
 
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'path',
+        type=str,
+        help="""Full S3 path or file path relative to EMR workspace root. Paths ending with "/" or containing a glob
+        pattern download all matching S3 objects."""
+    )
+    @magic_arguments.argument(
+        '--dest',
+        default='.',
+        help="""[Optional] Local file or directory to download to. Default: current directory"""
+    )
+    @magic_arguments.argument(
+        '--part-size',
+        default=8,
+        type=int,
+        help="""[Optional] Size in MB of the byte ranges fetched concurrently. Default value: 8"""
+    )
+    @magic_arguments.argument(
+        '--max-workers',
+        default=16,
+        type=int,
+        help="""[Optional] Number of byte ranges fetched concurrently. Default value: 16"""
+    )
+    @line_magic
+    @instrumented
+    def download_s3(self, line):
+        """
+        Downloads S3 objects to the local disk of the EMR cluster instance.
+        Objects are split into byte ranges that are fetched concurrently and written in place into the local file.
+        An interrupted download is resumed when the magic is run again.
+        Usage:
+            download_s3 s3://path/to/s3/object --dest /mnt/data/
+            download_s3 s3://path/to/s3/folder/ --dest /mnt/data/folder/
+            download_s3 relative/path/to/workspace/file
+        """
+        args = magic_arguments.parse_argstring(self.download_s3, line)
+        if args.part_size < 1 or args.max_workers < 1:
+            raise UsageError("--part-size and --max-workers should be at least 1")
+        part_size = args.part_size * 1024 * 1024
+
+        s3_bucket, key = self._parse_s3_path(args.path)
+        downloads = []
+        if key == "" or key.endswith("/") or any(glob_char in key for glob_char in "*?["):
+            s3_objects = self._list_s3_objects(s3_bucket, key)
+            if not s3_objects:
+                raise UsageError("No S3 objects found matching s3://{}/{}".format(s3_bucket, key))
+            base_prefix = self._get_base_prefix(key)
+            for s3_object in s3_objects:
+                local_path = os.path.join(args.dest, remove_prefix(s3_object["Key"], base_prefix))
+                downloads.append(S3ObjectDownload(s3_bucket, s3_object["Key"], s3_object["Size"], s3_object["ETag"],
+                                                  local_path, part_size))
+        else:
+            s3_object = self._head_s3_object(s3_bucket, key)
+            if s3_object is None:
+                raise UsageError("{} is not a valid S3 object.".format(args.path))
+            local_path = args.dest
+            if args.dest.endswith("/") or os.path.isdir(args.dest):
+                local_path = os.path.join(args.dest, os.path.basename(key))
+            downloads.append(S3ObjectDownload(s3_bucket, key, s3_object["ContentLength"], s3_object["ETag"],
+                                              local_path, part_size))
+
+        display_id = "s3-download-{}".format(uuid.uuid4())
+        start_time = time.time()
+
+        def on_progress(downloaded_bytes, total_bytes):
+            update_display_html(self._get_download_progress_html(downloaded_bytes, total_bytes, start_time),
+                                display_id=display_id)
+
+        display_html(self._get_download_progress_html(0, sum(download.size for download in downloads), start_time),
+                     display_id=display_id)
+        downloader = S3ParallelDownloader(self._get_transfer_client(args.max_workers), args.max_workers,
+                                          on_progress=on_progress)
+        try:
+            downloader.download(downloads)
+        except KeyboardInterrupt:
+            print("Download interrupted. Run the magic again to resume the download.")
+            return
+
+        if len(downloads) == 1:
+            print("Downloaded s3://{}/{} to {}".format(s3_bucket, downloads[0].s3_key, downloads[0].local_path))
+        else:
+            print("Downloaded {} S3 objects to {}".format(len(downloads), args.dest))
+
+    def _get_transfer_client(self, max_workers):
+        """
+        Returns a S3 client whose connection pool is large enough for max_workers concurrent requests.
+        """
+        return AWSClientRegistry.shared().client('s3', max_pool_connections=max_workers)
+
+    def _head_s3_object(self, s3_bucket, key):
+        import botocore
+
+        try:
+            return self.s3_client.head_object(Bucket=s3_bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "404":
+                return None
+            raise UsageError("Something went wrong while making S3 request. Err code {}, error message {}"
+                             .format(e.response['Error']['Code'], e.response['Error']['Message']))
+
+    @staticmethod
+    def _get_download_progress_html(downloaded_bytes, total_bytes, start_time):
+        elapsed_secs = max(time.time() - start_time, 0.001)
+        return """<progress value="{}" max="{}"></progress> {} / {} ({}/s)""".format(
+            downloaded_bytes, max(total_bytes, 1), format_size(downloaded_bytes), format_size(total_bytes),
+            format_size(int(downloaded_bytes / elapsed_secs)))
+
+    def _generate_s3_bundle_download_url(self, s3_bucket, key_pattern, bundle_path, compress, expires_in):
+        s3_objects = self._list_s3_objects(s3_bucket, key_pattern)
+        if not s3_objects:
+            raise UsageError("No S3 objects found matching s3://{}/{}".format(s3_bucket, key_pattern))
+
+        base_prefix = self._get_base_prefix(key_pattern)
+        if bundle_path:
+            bundle_bucket, bundle_key = self._parse_s3_path(bundle_path)
+        else:
+            bundle_bucket = s3_bucket
+            bundle_key = (base_prefix.rstrip("/") or "bundle") + ".zip"
+            # The default location is next to the bundled objects, an object that is already there is kept
+            if self._head_s3_object(bundle_bucket, bundle_key) is not None:
+                raise UsageError("s3://{}/{} already exists. Pass a S3 path to --bundle to write the archive "
+                                 "elsewhere.".format(bundle_bucket, bundle_key))
+        if any(s3_object["Key"] == bundle_key for s3_object in s3_objects) and bundle_bucket == s3_bucket:
+            raise UsageError("The bundle s3://{}/{} cannot be one of the bundled S3 objects".format(bundle_bucket,
+                                                                                                    bundle_key))
+
+        print("Bundling {} S3 objects ({}) into s3://{}/{}".format(
+            len(s3_objects), format_size(sum(s3_object["Size"] for s3_object in s3_objects)), bundle_bucket,
+            bundle_key))
+        import botocore
+
+        try:
+            bundle_size = bundle_s3_objects(self._get_transfer_client(BUNDLE_MAX_WORKERS), s3_bucket, s3_objects,
+                                            base_prefix, bundle_bucket, bundle_key, BUNDLE_PART_SIZE,
+                                            BUNDLE_MAX_WORKERS,
+                                            zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                            overwrite=bool(bundle_path))
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != "PreconditionFailed":
+                raise
+            raise UsageError("s3://{}/{} was created while the archive was written. Pass a S3 path to --bundle to "
+                             "write the archive elsewhere.".format(bundle_bucket, bundle_key))
+
+        signed_url = self._generate_presigned_url(bundle_bucket, bundle_key, expires_in)
+        expiry_time_abs, expiry_time_rel = self._get_expiry_time_text(expires_in)
+        display(HTML("""<a href="{}">Click here</a> to download the zip archive of {} S3 objects ({}). The link will expire at {} [in {}] """
+                     .format(html.escape(signed_url), len(s3_objects), format_size(bundle_size), expiry_time_abs,
+                             expiry_time_rel)))
+
+    def _generate_s3_download_urls(self, s3_bucket, key_pattern, expires_in, manifest):
+        s3_objects = self._list_s3_objects(s3_bucket, key_pattern)
+        if not s3_objects:
+            raise UsageError("No S3 objects found matching s3://{}/{}".format(s3_bucket, key_pattern))
+
+        # Presigned urls are signed locally, without any request to S3.
+        signed_urls = [self._generate_presigned_url(s3_bucket, s3_object["Key"], expires_in) for s3_object in s3_objects]
+        expiry_time_abs, expiry_time_rel = self._get_expiry_time_text(expires_in)
+
+        if manifest is not None:
+            with open(manifest, "w") as f:
+                json.dump({"expires_at": expiry_time_abs,
+                           "objects": [{"bucket": s3_bucket, "key": s3_object["Key"], "size": s3_object["Size"],
+                                        "url": signed_url}
+                                       for s3_object, signed_url in zip(s3_objects, signed_urls)]}, f, indent=1)
+            display(HTML("""Download urls of {} S3 objects were written to {}. The links will expire at {} [in {}] """
+                         .format(len(s3_objects), html.escape(manifest), expiry_time_abs, expiry_time_rel)))
+            return
+
+        base_prefix = self._get_base_prefix(key_pattern)
+        rows = "".join("""<tr><td><a href="{}">{}</a></td><td>{}</td></tr>""".format(
+            html.escape(signed_url), html.escape(remove_prefix(s3_object["Key"], base_prefix)),
+            format_size(s3_object["Size"]))
+            for s3_object, signed_url in zip(s3_objects, signed_urls))
+        display(HTML("""{} S3 objects in s3://{}/{}. The links will expire at {} [in {}]
+                     <table><tr><th>Object</th><th>Size</th></tr>{}</table>"""
+                     .format(len(s3_objects), s3_bucket, html.escape(base_prefix), expiry_time_abs, expiry_time_rel,
+                             rows)))
+
+    @staticmethod
+    def _get_glob_index(key_pattern):
+        return min([key_pattern.find(glob_char) for glob_char in "*?[" if glob_char in key_pattern], default=-1)
+
+    def _get_base_prefix(self, key_pattern):
+        """
+        Returns the directory part of a prefix or glob pattern that all matching keys start with, i.e. up to the
+        last "/" before the first glob character. Local paths and archive entries are relative to it.
+        """
+        glob_index = self._get_glob_index(key_pattern)
+        literal_part = key_pattern if glob_index < 0 else key_pattern[:glob_index]
+        return literal_part[:literal_part.rfind("/") + 1]
+
+    def _list_s3_objects(self, s3_bucket, key_pattern):
+        """
+        Lists the S3 objects under a prefix, or matching a glob pattern, with a single paginated listing.
+        """
+        glob_index = self._get_glob_index(key_pattern)
+        list_prefix = key_pattern if glob_index < 0 else key_pattern[:glob_index]
+
+        s3_objects = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=s3_bucket, Prefix=list_prefix):
+            for s3_object in page.get("Contents", []):
+                if s3_object["Key"].endswith("/"):
+                    continue
+                if glob_index >= 0 and not fnmatch.fnmatchcase(s3_object["Key"], key_pattern):
+                    continue
+                s3_objects.append(s3_object)
+        return s3_objects
+
+    def _generate_presigned_url(self, s3_bucket, key, expires_in):
+        return self.s3_client.generate_presigned_url(
+            ClientMethod='get_object',
+            Params={'Bucket': s3_bucket,
+                    'Key': key},
+            ExpiresIn=expires_in)
+
+    def _parse_s3_path(self, path):
+        """
+        Returns the bucket and key of a full S3 path or of a path relative to the Workspace root.
+        """
+        parsed_url = urlparse(path, allow_fragments=False)
+        if parsed_url.scheme == "s3":
+            return parsed_url.netloc, remove_prefix(parsed_url.path, "/")
+
+        # remove "." and "./" from the Workspace relative path
+        if path.startswith("./"):
+            path = remove_prefix(path, "./")
+        elif path.startswith("."):
+            path = remove_prefix(path, ".")
+        return os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"], os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + path
+
     def _is_valid_s3_object(self, s3_bucket, s3_prefix):
+        import botocore
+
         if s3_prefix.endswith('/'):
             return False
 
@@ -107,3 +397,7 @@ class S3DownloadMagics(Magics):
         expiry_time_rel = ''.join(text)
 
         return expiry_time_abs.strftime('%Y-%m-%d %H:%M:%S UTC'), expiry_time_rel
+
+
+def load_ipython_extension(ipython):
+    ipython.register_magics(S3DownloadMagics(ipython))
@@ -13,16 +13,26 @@
 # limitations under the License.
 import os
 import json
+import re
 import subprocess
-import boto3
 import shlex
+import time
 
 from IPython.core import magic_arguments
 from IPython.core.magic import (Magics, magics_class, line_magic)
 from IPython.core.error import UsageError
 from pathlib import Path
 from shutil import which
-from .utils.str_utils import remove_prefix
+from .utils.aws_clients import AWSClientRegistry
+from .utils.instrumentation import instrumented, stats
+from .utils.mount_benchmark import benchmark_directory
+from .utils.mount_profiles import MOUNT_PROFILES, get_profile_params, merge_mount_params
+from .utils.str_utils import remove_prefix, format_size
+from .utils.workspace_import_finder import WorkspaceModuleFinder
+from .utils.workspace_mount_table import WorkspaceMount, WorkspaceMountTable
+from .utils.workspace_sync import WorkspaceSync
+
+DEFAULT_BENCHMARK_RESULTS_FILE = os.path.join("~", ".emr_notebooks_magics", "mount_benchmarks.json")
 
 
 @magics_class
@@ -33,7 +43,16 @@ class MountWorkspaceDirMagics(Magics):
 
     def __init__(self, shell):
         super(MountWorkspaceDirMagics, self).__init__(shell)
-        self.s3_client = boto3.client('s3')
+        self._s3_client = None
+        self.mount_table = WorkspaceMountTable()
+        self.workspace_syncs = {}
+        self.import_finders = {}
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            self._s3_client = AWSClientRegistry.shared().client('s3')
+        return self._s3_client
 
     @magic_arguments.magic_arguments()
     @magic_arguments.argument(
@@ -42,7 +61,38 @@ class MountWorkspaceDirMagics(Magics):
     )
     @magic_arguments.argument(
         '--fuse-type', default='s3-fuse',
-        help="""use S3-FUSE/Goofys to mount the Workspace directory"""
+        help="""use S3-FUSE/Goofys to mount the Workspace directory, or "sync" to copy the Workspace directory to the
+        local disk instead of mounting it. Re-running the magic with "sync" only downloads the files that have changed."""
+    )
+    @magic_arguments.argument(
+        '--profile', default=None, choices=MOUNT_PROFILES,
+        help="""[Optional] Tune the S3-FUSE/Goofys mount options for a workload: "small-files", "large-sequential"
+        or "read-mostly". The caches are sized for the instance and --params override the options of the profile."""
+    )
+    @magic_arguments.argument(
+        '--mount-dir', default=None,
+        help="""[Optional] Local directory to mount the Workspace directory on. Defaults to ~/<workspace-id>, or to
+        ~/<workspace-id>-<ws_path> when another Workspace directory is already mounted there"""
+    )
+    @magic_arguments.argument(
+        '--import-finder', action='store_true',
+        help="""[Optional] Import Python modules of the Workspace directory from a local cache indexed with a single
+        S3 listing, instead of looking them up on the mount directory"""
+    )
+    @magic_arguments.argument(
+        '--writable', action='store_true',
+        help="""[Optional] With --fuse-type sync, write the files changed in the local directory back to the
+        Workspace directory. Changes are uploaded in batches once no file has changed for --write-back-delay seconds,
+        and files changed in the Workspace in the meantime are reported as conflicts instead of being overwritten."""
+    )
+    @magic_arguments.argument(
+        '--write-back-delay', default=2.0, type=float,
+        help="""[Optional] With --writable, seconds without changes before the changed files are uploaded"""
+    )
+    @magic_arguments.argument(
+        '--refresh-interval', default=0, type=int,
+        help="""[Optional] With --fuse-type sync, sync the Workspace directory again every given number of seconds
+        in the background"""
     )
     @magic_arguments.argument(
         '--params', default=None,
@@ -53,6 +103,7 @@ class MountWorkspaceDirMagics(Magics):
             """
     )
     @line_magic
+    @instrumented
     def mount_workspace_dir(self, line):
         """
         Mount EMR workspace directory on the remote instance.
@@ -66,65 +117,325 @@ class MountWorkspaceDirMagics(Magics):
             mount_workspace_dir mydirectory
             mount_workspace_dir mydirectory --fuse-type s3-fuse --params use_cache=/tmp/
             mount_workspace_dir mydirectory --fuse-type goofys --params cheap,region=us-east-1
+            mount_workspace_dir mydirectory --fuse-type s3-fuse --profile small-files
+            mount_workspace_dir mydirectory --fuse-type sync --refresh-interval 60
+            mount_workspace_dir mydirectory --fuse-type sync --writable
+            mount_workspace_dir mydirectory --import-finder
+            mount_workspace_dir otherdirectory --mount-dir ~/otherdirectory
         """
         
         args = magic_arguments.parse_argstring(self.mount_workspace_dir, line)
-        mount_dir = self._get_mount_directory()
+        args.ws_path = self._normalize_ws_path(args.ws_path)
+        if args.writable and args.fuse_type != "sync":
+            raise UsageError("--writable is only supported with --fuse-type sync. FUSE mounts are read only.")
+
+        # Users want to repeatedly execute their Notebook so we do NOT want to throw an error when the Workspace
+        # directory is already mounted.
+        mount = self.mount_table.find(args.ws_path)
+        if mount is not None and (mount.fuse_type == "sync") != (args.fuse_type == "sync"):
+            raise UsageError("{} is already {} to {}. Run %umount_workspace_dir {} first.".format(
+                args.ws_path or ".", "synced" if mount.fuse_type == "sync" else "mounted", mount.mount_dir,
+                args.ws_path or "."))
+
+        if mount is not None:
+            mount_dir = mount.mount_dir
+        elif args.mount_dir is not None:
+            mount_dir = os.path.abspath(os.path.expanduser(args.mount_dir))
+            if self._is_mount_directory_in_use(mount_dir):
+                raise UsageError("{} is already used by another mount".format(mount_dir))
+        else:
+            mount_dir = self._get_mount_directory(args.ws_path)
 
-        # Check if the mount_dir is already mounted.
-        # Users want to repeatedly execute their Notebook so we do NOT want to throw an error when the mount dir is already mounted.
-        if self._is_already_mounted(mount_dir):
-            print("The mount directory is already mounted. Skipping mounting.")
+        if args.fuse_type == "sync":
+            self._sync_workspace_dir(args, mount_dir)
+            self.mount_table.add(WorkspaceMount(args.ws_path, mount_dir, args.fuse_type, writable=args.writable))
+            if args.import_finder:
+                self._install_import_finder(args.ws_path, mount_dir)
+            return
+
+        if mount is not None:
+            print("{} is already mounted on {} using {}. Skipping mounting.".format(
+                args.ws_path or ".", mount_dir, mount.fuse_type))
+            if (mount.fuse_type, mount.params, mount.profile) != (args.fuse_type, args.params, args.profile):
+                print("Run %umount_workspace_dir {} first to mount it with other options.".format(args.ws_path or "."))
             os.chdir(mount_dir)
+            if args.import_finder:
+                self._install_import_finder(args.ws_path, mount_dir)
             return
 
         s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
-        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"]
-
-        # remove "." and "./" from source file path
-        if args.ws_path.startswith("./"):
-            args.ws_path = remove_prefix(args.ws_path, "./")
-        elif args.ws_path.startswith("."):
-            args.ws_path = remove_prefix(args.ws_path, ".")
-        
-        s3_key = s3_key + args.ws_path
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + args.ws_path
 
         if not self._is_valid_workspace_directory(s3_bucket, s3_key):
             raise UsageError("{} is not a valid Workspace directory".format(args.ws_path))
 
+        params = args.params
+        if args.profile is not None:
+            params = merge_mount_params(get_profile_params(args.fuse_type, args.profile), params)
+
         if args.fuse_type == "s3-fuse":
-            ret_code, stdout, stderr = self.mount_using_s3fuse(s3_bucket, s3_key, mount_dir, args.params, True)
+            ret_code, stdout, stderr = self.mount_using_s3fuse(s3_bucket, s3_key, mount_dir, params, True)
         elif args.fuse_type == "goofys":
-            ret_code, stdout, stderr = self.mount_using_goofys(s3_bucket, s3_key, mount_dir, args.params, True)
+            ret_code, stdout, stderr = self.mount_using_goofys(s3_bucket, s3_key, mount_dir, params, True)
         else:
             raise UsageError("Unknown mount option:{}".format(args.fuse_type))
 
         if ret_code != 0:
             raise UsageError("Unable to mount the Workspace. stdout={} stderr={}".format(stdout, stderr))
+        self.mount_table.add(WorkspaceMount(args.ws_path, mount_dir, args.fuse_type, args.params, args.profile))
 
         # Change directory to the mount folder
         os.chdir(mount_dir)
 
         print("Successfully mounted EMR Workspace on the cluster")
+        if args.import_finder:
+            self._install_import_finder(args.ws_path, mount_dir)
         return
 
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        'ws_path', nargs='?', default=None,
+        help="""[Optional] Relative path of the Workspace directory to unmount. Can be omitted when only one
+        Workspace directory is mounted"""
+    )
+    @magic_arguments.argument(
+        '--all', action='store_true',
+        help="""[Optional] Unmount all Workspace directories"""
+    )
     @line_magic
+    @instrumented
     def umount_workspace_dir(self, line):
         """
         Unmount Workspace directory
+        Usage:
+            umount_workspace_dir
+            umount_workspace_dir mydirectory
+            umount_workspace_dir --all
+        """
+        args = magic_arguments.parse_argstring(self.umount_workspace_dir, line)
+        mounts = self.mount_table.list()
+
+        if args.all:
+            targets = mounts
+        elif args.ws_path is not None:
+            ws_path = self._normalize_ws_path(args.ws_path)
+            targets = [mount for mount in mounts if mount.ws_path == ws_path]
+            if not targets:
+                raise UsageError("{} is not mounted".format(args.ws_path))
+        elif len(mounts) > 1:
+            raise UsageError("Several Workspace directories are mounted: {}. Specify the one to unmount or use --all."
+                             .format(", ".join(mount.ws_path or "." for mount in mounts)))
+        elif mounts:
+            targets = mounts
+        elif self._is_already_mounted(self._get_mount_directory()):
+            # Mounted by a kernel that did not record it in the mount table
+            targets = [WorkspaceMount(None, self._get_mount_directory(), "s3-fuse")]
+        else:
+            raise UsageError("No Workspace directory is mounted")
+
+        for mount in targets:
+            self._unmount(mount)
+
+    @line_magic
+    @instrumented
+    def list_workspace_mounts(self, line):
+        """
+        Lists the Workspace directories mounted or synced on the cluster instance.
+        Usage:
+            list_workspace_mounts
         """
-        mount_dir = self._get_mount_directory()
+        mounts = self.mount_table.list()
+        if not mounts:
+            print("No Workspace directory is mounted")
+            return
+
+        rows = [["ws_path", "mount_dir", "fuse_type", "options"]]
+        for mount in mounts:
+            fuse_type = mount.fuse_type
+            workspace_sync = self.workspace_syncs.get(mount.mount_dir)
+            if workspace_sync is not None and workspace_sync.is_refreshing():
+                fuse_type += " (refreshing)"
+            conflicts = workspace_sync.conflicts if workspace_sync is not None else []
+            options = ", ".join(option for option in [
+                "profile={}".format(mount.profile) if mount.profile else None,
+                mount.params,
+                "writable" if mount.writable else None,
+                "{} conflicts".format(len(conflicts)) if conflicts else None,
+                "import-finder" if mount.mount_dir in self.import_finders else None] if option)
+            rows.append([mount.ws_path or ".", mount.mount_dir, fuse_type, options])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+    def _unmount(self, mount):
+        self._uninstall_import_finder(mount.mount_dir)
+
+        if mount.fuse_type == "sync":
+            workspace_sync = self.workspace_syncs.pop(mount.mount_dir, None)
+            if workspace_sync is not None:
+                workspace_sync.stop_refresh()
+            if mount.writable:
+                if workspace_sync is None:
+                    # Synced by another kernel, the local changes are found with the manifest of the directory
+                    workspace_sync = WorkspaceSync(self.s3_client, os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"],
+                                                   os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + mount.ws_path,
+                                                   mount.mount_dir, read_only=False)
+                self._print_write_back_result(workspace_sync.stop_write_back(flush=True))
+            self.mount_table.remove(mount.mount_dir)
+            print("Stopped syncing the Workspace directory. The synced files are kept in {}".format(mount.mount_dir))
+            return
 
         # change current directory to home directory (so that currently opened files in the mounted dir is released by python)
-        os.chdir(os.path.expanduser("~"))
+        if os.path.realpath(os.getcwd()).startswith(os.path.realpath(mount.mount_dir)):
+            os.chdir(os.path.expanduser("~"))
 
-        command = "fusermount -u {}".format(mount_dir)
+        command = "fusermount -u {}".format(mount.mount_dir)
         ret_code, stdout, stderr = self._execute_command(command)
         if ret_code == 0:
-            print("Successfully unmounted the directory")
+            self.mount_table.remove(mount.mount_dir)
+            print("Successfully unmounted {}".format(mount.mount_dir))
         else:
             raise UsageError("Unable to unmount the Workspace. stdout={} stderr={}".format(stdout, stderr))
 
+    @magic_arguments.magic_arguments()
+    @magic_arguments.argument(
+        '--dir', default=None,
+        help="""[Optional] Directory to benchmark. Defaults to the mount directory of the Workspace, and can be any
+        local directory to compare with"""
+    )
+    @magic_arguments.argument(
+        '--label', default=None,
+        help="""[Optional] Name of the results in the comparison table. Defaults to the file system type of the
+        directory"""
+    )
+    @magic_arguments.argument(
+        '--max-files', default=500, type=int,
+        help="""[Optional] Maximum number of files to stat and read"""
+    )
+    @magic_arguments.argument(
+        '--output', default=DEFAULT_BENCHMARK_RESULTS_FILE,
+        help="""[Optional] JSON file the results are saved to, and compared with"""
+    )
+    @line_magic
+    @instrumented
+    def benchmark_workspace_mount(self, line):
+        """
+        Measures the metadata operations per second, the small file read latency, the large file sequential read
+        throughput and the import time of the Python modules of a mounted Workspace directory, and compares them
+        with the previous results of other mounts.
+        The benchmark only reads files, and runs on any local directory as well.
+        Usage:
+            benchmark_workspace_mount
+            benchmark_workspace_mount --label s3fs-small-files
+            benchmark_workspace_mount --dir /tmp/workspace-copy --label local
+        """
+        args = magic_arguments.parse_argstring(self.benchmark_workspace_mount, line)
+        directory = os.path.expanduser(args.dir) if args.dir else self._get_mount_directory()
+        if not os.path.isdir(directory):
+            raise UsageError("{} is not a directory. Mount the Workspace directory first.".format(directory))
+
+        label = args.label or self.mount_table.get_fs_type(directory) or "local"
+        print("Benchmarking {} ...".format(directory))
+        result = benchmark_directory(directory, max_files=args.max_files)
+        result["label"] = label
+
+        output = os.path.expanduser(args.output)
+        results = []
+        try:
+            with open(output) as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            pass
+        results = [previous for previous in results if previous.get("label") != label] + [result]
+        Path(os.path.dirname(os.path.abspath(output))).mkdir(parents=True, exist_ok=True)
+        with open(output + ".tmp", "w") as f:
+            json.dump(results, f, indent=2)
+        os.replace(output + ".tmp", output)
+
+        self._print_benchmark_results(results)
+        print("Results saved to {}".format(output))
+
+    def _print_benchmark_results(self, results):
+        def value(number, decimals=1):
+            return "-" if number is None else "{:.{}f}".format(number, decimals)
+
+        header = ["label", "files", "listdir/s", "stat/s", "read p50 ms", "read p90 ms", "read p99 ms",
+                  "seq MB/s", "import ms"]
+        rows = [header]
+        for result in results:
+            latencies = result["small_file_read_ms"]
+            rows.append([result["label"], str(result["files"]), value(result["listdir_per_second"], 0),
+                         value(result["stat_per_second"], 0), value(latencies["p50"], 2),
+                         value(latencies["p90"], 2), value(latencies["p99"], 2),
+                         value(result["sequential_read_mb_per_second"]), value(result["import_ms"])])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        for row in rows:
+            print("  ".join(cell.rjust(width) if i else cell.ljust(width)
+                            for i, (cell, width) in enumerate(zip(row, widths))))
+
+    def _sync_workspace_dir(self, args, mount_dir):
+        if self._is_already_mounted(mount_dir):
+            raise UsageError("The mount directory is mounted using FUSE. Run %umount_workspace_dir before syncing.")
+        if args.params is not None or args.profile is not None:
+            print("--params and --profile are ignored with --fuse-type sync")
+
+        s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + args.ws_path
+        if not self._is_valid_workspace_directory(s3_bucket, s3_key):
+            raise UsageError("{} is not a valid Workspace directory".format(args.ws_path))
+
+        workspace_sync = self.workspace_syncs.pop(mount_dir, None)
+        if workspace_sync is not None:
+            workspace_sync.stop_refresh()
+            # Upload the local changes first, so that they are not reported as conflicts by the sync
+            self._print_write_back_result(workspace_sync.stop_write_back(flush=True))
+        workspace_sync = WorkspaceSync(self.s3_client, s3_bucket, s3_key, mount_dir, read_only=not args.writable)
+        self.workspace_syncs[mount_dir] = workspace_sync
+        start = time.time()
+        result = workspace_sync.sync()
+        print("Synced EMR Workspace to {}: {} of {} files changed ({}), {} removed in {:.1f}s".format(
+            mount_dir, result.downloaded, result.listed, format_size(result.downloaded_bytes), result.deleted,
+            time.time() - start))
+        if workspace_sync.conflicts:
+            print("Kept the local changes of {} files that also changed in the Workspace: {}".format(
+                len(workspace_sync.conflicts), ", ".join(workspace_sync.conflicts)))
+
+        if args.refresh_interval > 0:
+            workspace_sync.start_refresh(args.refresh_interval)
+            print("The Workspace directory is synced again every {} seconds".format(args.refresh_interval))
+
+        if args.writable:
+            workspace_sync.start_write_back(args.write_back_delay)
+            print("The files changed in {} are written back to the Workspace".format(mount_dir))
+
+        os.chdir(mount_dir)
+
+    def _print_write_back_result(self, result):
+        if result is None:
+            return
+        if result.uploaded:
+            print("Uploaded {} changed files ({}) to the Workspace".format(result.uploaded,
+                                                                       format_size(result.uploaded_bytes)))
+        if result.conflicts:
+            print("{} files were not uploaded because they also changed in the Workspace: {}".format(
+                len(result.conflicts), ", ".join(result.conflicts)))
+
+    def _install_import_finder(self, ws_path, mount_dir):
+        self._uninstall_import_finder(mount_dir)
+        s3_bucket = os.environ["KERNEL_WORKSPACE_DIR_S3_BUCKET"]
+        s3_key = os.environ["KERNEL_WORKSPACE_DIR_S3_LOCATION"] + ws_path
+        import_finder = WorkspaceModuleFinder(self.s3_client, s3_bucket, s3_key)
+        module_count = import_finder.refresh()
+        import_finder.install()
+        self.import_finders[mount_dir] = import_finder
+        print("Python modules of the Workspace directory are imported from a local cache ({} modules found)"
+              .format(module_count))
+
+    def _uninstall_import_finder(self, mount_dir):
+        import_finder = self.import_finders.pop(mount_dir, None)
+        if import_finder is not None:
+            import_finder.uninstall()
+
     def mount_using_s3fuse(self, s3_bucket, s3_key, mount_dir, params, read_only):
         if which("s3fs") is None:
             raise UsageError("S3-fuse is not installed")
@@ -180,21 +491,15 @@ class MountWorkspaceDirMagics(Magics):
     
     def _execute_command(self, cmd):
         cmd_list = shlex.split(cmd)
-        process = subprocess.run(cmd_list, capture_output=True, text=True, shell=False)
+        with stats.phase("subprocess." + cmd_list[0]):
+            process = subprocess.run(cmd_list, capture_output=True, text=True, shell=False)
         return process.returncode, process.stdout, process.stderr
 
     def _is_already_mounted(self, mount_dir):
-        cmd = "findmnt {} --json".format(mount_dir)
-        ret_code, std_out, std_err = self._execute_command(cmd)
-        if ret_code != 0:
-            return False
+        return self.mount_table.is_fuse_mounted(mount_dir)
 
-        try:
-            mounts = json.loads(std_out)
-            fs_type = mounts['filesystems'][0]['fstype']
-            return True if fs_type.startswith('fuse') else False
-        except:
-            return False
+    def _is_mount_directory_in_use(self, mount_dir):
+        return self.mount_table.get(mount_dir) is not None or self._is_already_mounted(mount_dir)
 
     def _is_valid_workspace_directory(self, s3_bucket, s3_prefix):
         if not s3_prefix.endswith("/"):
@@ -206,7 +511,23 @@ class MountWorkspaceDirMagics(Magics):
 
         return True if "Contents" in result else False
 
-    def _get_mount_directory(self):
+    def _normalize_ws_path(self, ws_path):
+        # remove "." and "./" from source file path
+        if ws_path.startswith("./"):
+            return remove_prefix(ws_path, "./")
+        elif ws_path.startswith("."):
+            return remove_prefix(ws_path, ".")
+        return ws_path
+
+    def _get_mount_directory(self, ws_path=None):
         workspace_id = os.environ["KERNEL_WORKSPACE_ID"]
         home_dir = os.path.expanduser("~")
-        return os.path.join(home_dir, workspace_id)
+        mount_dir = os.path.join(home_dir, workspace_id)
+        if ws_path is None or not self._is_mount_directory_in_use(mount_dir):
+            return mount_dir
+        # Another Workspace directory is mounted on the default mount directory
+        return "{}-{}".format(mount_dir, re.sub(r"[^A-Za-z0-9_.]+", "-", ws_path).strip("-") or "root")
+
+
+def load_ipython_extension(ipython):
+    ipython.register_magics(MountWorkspaceDirMagics(ipython))
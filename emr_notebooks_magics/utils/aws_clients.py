@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import threading
+
+from .instrumentation import stats
+
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get("EMR_NOTEBOOKS_MAGICS_MAX_POOL_CONNECTIONS", 50))
+DEFAULT_CONNECT_TIMEOUT_SECS = float(os.environ.get("EMR_NOTEBOOKS_MAGICS_CONNECT_TIMEOUT", 10))
+DEFAULT_READ_TIMEOUT_SECS = float(os.environ.get("EMR_NOTEBOOKS_MAGICS_READ_TIMEOUT", 60))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("EMR_NOTEBOOKS_MAGICS_MAX_ATTEMPTS", 5))
+
+
+class AWSClientRegistry:
+    """
+    Creates the boto3 clients and resources of all magics from a single session, so that credentials and endpoints
+    are resolved once per process and the connection pools are shared.
+    Clients are keyed by service and region. A client is created again with a larger connection pool when more
+    concurrent connections are requested than its pool holds. Use AWSClientRegistry.shared() to get the process-wide
+    instance.
+    """
+
+    _shared_instance = None
+    _shared_instance_lock = threading.Lock()
+
+    def __init__(self, max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS, connect_timeout=DEFAULT_CONNECT_TIMEOUT_SECS,
+                 read_timeout=DEFAULT_READ_TIMEOUT_SECS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        # boto3 sessions are not thread safe, so clients are created under the lock. The clients themselves are.
+        self._lock = threading.Lock()
+        self._session = None
+        self._clients = {}
+        self._resources = {}
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_instance_lock:
+            if cls._shared_instance is None:
+                cls._shared_instance = cls()
+            return cls._shared_instance
+
+    @property
+    def session(self):
+        """
+        The boto3 session of all clients, e.g. to register botocore event handlers before the clients are created.
+        """
+        with self._lock:
+            return self._get_session()
+
+    def configure(self, max_pool_connections=None, connect_timeout=None, read_timeout=None, max_attempts=None):
+        """
+        Changes the client configuration. Clients created before are replaced on their next use.
+        """
+        with self._lock:
+            if max_pool_connections is not None:
+                self.max_pool_connections = max_pool_connections
+            if connect_timeout is not None:
+                self.connect_timeout = connect_timeout
+            if read_timeout is not None:
+                self.read_timeout = read_timeout
+            if max_attempts is not None:
+                self.max_attempts = max_attempts
+            self._clients = {}
+            self._resources = {}
+
+    def client(self, service_name, region_name=None, max_pool_connections=None):
+        pool_size = max(max_pool_connections or 0, self.max_pool_connections)
+        key = (service_name, region_name)
+        with self._lock:
+            client, client_pool_size = self._clients.get(key, (None, 0))
+            if client is None or client_pool_size < pool_size:
+                with stats.phase("aws.create_client." + service_name):
+                    client = self._get_session().client(service_name, region_name=region_name,
+                                                        config=self._get_config(pool_size))
+                self._clients[key] = (client, pool_size)
+            return client
+
+    def resource(self, service_name, region_name=None):
+        key = (service_name, region_name)
+        with self._lock:
+            if key not in self._resources:
+                self._resources[key] = self._get_session().resource(
+                    service_name, region_name=region_name, config=self._get_config(self.max_pool_connections))
+            return self._resources[key]
+
+    def _get_session(self):
+        if self._session is None:
+            import boto3
+            self._session = boto3.session.Session()
+            stats.register_botocore_handlers(self._session.events)
+        return self._session
+
+    def _get_config(self, max_pool_connections):
+        from botocore.config import Config
+
+        return Config(max_pool_connections=max_pool_connections,
+                      connect_timeout=self.connect_timeout,
+                      read_timeout=self.read_timeout,
+                      retries={"mode": "adaptive", "total_max_attempts": self.max_attempts})
@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import socket
+import threading
+
+from .instance_metadata_service_utils import IMDSv2Util
+from .instrumentation import stats
+from .locked_json_file import LockedJSONFile
+
+DEFAULT_CLUSTER_CONTEXT_CACHE_PATH = os.path.join("~", ".emr_notebooks_magics", "cluster_context.json")
+CLUSTER_ID_ENV_VARIABLE = "EMR_CLUSTER_ID"
+# Files written by EMR on every cluster node. Both contain the cluster id as "jobFlowId".
+EMR_NODE_INFO_FILES = [
+    "/emr/instance-controller/lib/info/extraInstanceData.json",
+    "/mnt/var/lib/info/job-flow.json",
+]
+CLUSTER_ID_TAG = "aws:elasticmapreduce:job-flow-id"
+
+
+class ClusterContextResolver:
+    """
+    Resolves the id and the region of the EMR cluster the kernel runs on.
+    The cluster id is read from the EMR_CLUSTER_ID environment variable or from the info files EMR writes on the node,
+    and only looked up with IMDS and ec2:DescribeInstances when neither is available. Resolved values never change for
+    the life of the node, so they are kept in a file shared by all kernels on the node. The file is locked while a
+    value is resolved, so that concurrent kernels make the API calls only once.
+    Use ClusterContextResolver.shared() to get the process-wide instance.
+    """
+
+    _shared_instance = None
+    _shared_instance_lock = threading.Lock()
+
+    def __init__(self, cache_path=DEFAULT_CLUSTER_CONTEXT_CACHE_PATH, node_info_files=None, imdsv2=None):
+        self._cache_file = LockedJSONFile(cache_path)
+        self.cache_path = self._cache_file.path
+        self.node_info_files = EMR_NODE_INFO_FILES if node_info_files is None else node_info_files
+        self.imdsv2 = imdsv2 if imdsv2 is not None else IMDSv2Util.shared()
+        self._context = {}
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_instance_lock:
+            if cls._shared_instance is None:
+                cls._shared_instance = cls()
+            return cls._shared_instance
+
+    def get_cluster_id(self, get_ec2_client):
+        """
+        Returns the cluster id, or None if it cannot be found. get_ec2_client is only called when the EC2 API has to
+        be used.
+        """
+        if os.environ.get(CLUSTER_ID_ENV_VARIABLE):
+            return os.environ[CLUSTER_ID_ENV_VARIABLE]
+        return self._resolve("cluster_id", lambda: self._read_node_info("jobFlowId")
+                             or self._describe_cluster_id(get_ec2_client()))
+
+    def get_region(self):
+        return self._resolve("region", lambda: self._read_node_info("region") or self.imdsv2.get_region())
+
+    def _resolve(self, key, fetch):
+        # The lock is reentrant, as resolving the cluster id may resolve the region.
+        with self._cache_file.locked():
+            if key not in self._context:
+                context = self._read_cache()
+                if key not in context:
+                    with stats.phase("cluster_context." + key):
+                        value = fetch()
+                    if value is None:
+                        return None
+                    # Read again, as another value may have been resolved while fetching
+                    context = self._read_cache()
+                    context[key] = value
+                    self._write_cache(context)
+                self._context = context
+            return self._context[key]
+
+    def _read_node_info(self, key):
+        for path in self.node_info_files:
+            try:
+                with open(path) as f:
+                    value = json.load(f).get(key)
+            except (OSError, ValueError, AttributeError):
+                continue
+            if value:
+                return value
+        return None
+
+    def _describe_cluster_id(self, ec2):
+        response = ec2.describe_instances(InstanceIds=[self.imdsv2.ec2_instance_id()])
+        for tag in response['Reservations'][0]['Instances'][0].get('Tags', []):
+            if tag['Key'] == CLUSTER_ID_TAG:
+                return tag['Value']
+        return None
+
+    def _read_cache(self):
+        context = self._cache_file.read()
+        # The home directory may outlive the node, e.g. when it is on a shared file system
+        if not isinstance(context, dict) or context.get("hostname") != socket.gethostname():
+            return {}
+        return context
+
+    def _write_cache(self, context):
+        context["hostname"] = socket.gethostname()
+        self._cache_file.write(context)
@@ -12,8 +12,32 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from IPython.display import display, HTML
+import sys
 
+from IPython.display import display, update_display, HTML
+from .str_utils import join_multiline
+
+
+def display_html(text, display_id=None):
+    display(HTML(text), display_id=display_id)
+
+
+def update_display_html(text, display_id):
+    update_display(HTML(text), display_id=display_id)
+
+
+def display_notebook_cell_outputs(cell):
+    """
+    Displays the outputs of a cell of a notebook file (nbformat 4) in the current kernel.
+    """
+    for output in cell.get("outputs", []):
+        output_type = output.get("output_type")
+        if output_type == "stream":
+            stream = sys.stderr if output.get("name") == "stderr" else sys.stdout
+            stream.write(join_multiline(output.get("text", "")))
+        elif output_type in ("display_data", "execute_result"):
+            data = {mime_type: join_multiline(value) for mime_type, value in output.get("data", {}).items()}
+            display(data, raw=True, metadata=output.get("metadata") or None)
+        elif output_type == "error":
+            sys.stderr.write("\n".join(output.get("traceback", [])) + "\n")
 
-def display_html(text):
-    display(HTML(text))
\ No newline at end of file
@@ -0,0 +1,127 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import os
+import time
+
+from .locked_json_file import LockedJSONFile
+
+DEFAULT_CACHE_TTL_SECS = 7 * 24 * 3600
+DEFAULT_CACHE_MAX_ENTRIES = 1000
+DEFAULT_LOCAL_CACHE_PATH = os.path.join("~", ".emr_notebooks_magics", "execution_cache.json")
+WORKSPACE_CACHE_PREFIX = ".emr_notebooks_magics/execution_cache/"
+
+
+def get_execution_cache_key(workspace_id, notebook, notebook_etag, notebook_params, execution_engine_id):
+    """
+    Returns the key of a notebook execution, derived from everything that determines its output.
+    """
+    key_source = json.dumps([workspace_id, notebook, notebook_etag, notebook_params or {}, execution_engine_id],
+                            sort_keys=True)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+class LocalExecutionCacheStore:
+    """
+    Keeps cache entries in a LockedJSONFile on the local disk.
+    """
+
+    def __init__(self, path=DEFAULT_LOCAL_CACHE_PATH, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        self._file = LockedJSONFile(path)
+        self.path = self._file.path
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._file.locked():
+            return self._file.read({}).get(key)
+
+    def put(self, key, entry):
+        with self._file.locked():
+            entries = self._file.read({})
+            entries[key] = entry
+            if len(entries) > self.max_entries:
+                # Evict the oldest entries
+                for evicted_key in sorted(entries, key=lambda k: entries[k]["created_at"])[:len(entries) - self.max_entries]:
+                    del entries[evicted_key]
+            self._file.write(entries)
+
+    def delete(self, key):
+        with self._file.locked():
+            entries = self._file.read({})
+            if entries.pop(key, None) is not None:
+                self._file.write(entries)
+
+
+class S3ExecutionCacheStore:
+    """
+    Keeps cache entries as JSON objects under a S3 prefix, e.g. in the Workspace, so that they are shared by all
+    clusters attached to the Workspace.
+    """
+
+    def __init__(self, s3_client, s3_bucket, s3_prefix):
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+
+    def get(self, key):
+        import botocore
+
+        try:
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=self.s3_prefix + key + ".json")
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ("404", "NoSuchKey"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def put(self, key, entry):
+        self.s3_client.put_object(Bucket=self.s3_bucket, Key=self.s3_prefix + key + ".json",
+                                  Body=json.dumps(entry).encode("utf-8"), ContentType="application/json")
+
+    def delete(self, key):
+        self.s3_client.delete_object(Bucket=self.s3_bucket, Key=self.s3_prefix + key + ".json")
+
+
+class ExecutionResultCache:
+    """
+    Remembers the output of finished notebook executions, so that an unchanged notebook does not have to be executed
+    again with the same parameters on the same execution engine.
+    """
+
+    def __init__(self, store, ttl_secs=DEFAULT_CACHE_TTL_SECS):
+        self.store = store
+        self.ttl_secs = ttl_secs
+
+    def get(self, key):
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_secs:
+            self.store.delete(key)
+            return None
+        return entry
+
+    def put(self, key, execution):
+        self.store.put(key, {
+            "execution_id": execution.execution_id,
+            "notebook": execution.notebook,
+            "cluster_id": execution.cluster_id,
+            "status": execution.status,
+            "output_notebook_uri": execution.output_notebook_uri,
+            "created_at": time.time(),
+        })
+
+    def delete(self, key):
+        self.store.delete(key)
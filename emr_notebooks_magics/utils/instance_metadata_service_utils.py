@@ -11,24 +11,109 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+import threading
+import time
 
-import requests
+from .instrumentation import stats
 
 IMDSv2_TOKEN_TTL_HEADER = "X-aws-ec2-metadata-token-ttl-seconds"
 IMDSv2_TOKEN_HEADER = "X-aws-ec2-metadata-token"
 
+IMDS_DEFAULT_ENDPOINT = "http://169.254.169.254"
+IMDSv2_TOKEN_TTL_SECS = 21600
+# The token is refreshed this many seconds before it expires, so that an in-flight request never uses a stale token.
+IMDSv2_TOKEN_REFRESH_MARGIN_SECS = 300
+IMDS_CONNECT_TIMEOUT_SECS = 1
+IMDS_READ_TIMEOUT_SECS = 2
+IMDS_MAX_RETRIES = 3
+
 
 class IMDSv2Util:
-    def __get_imdsv2_token(self):
-        return requests.put("http://169.254.169.254/latest/api/token",
-                            headers={IMDSv2_TOKEN_TTL_HEADER: "21600"}).text
+    """
+    Client for the EC2 instance metadata service (IMDSv2).
+    The session token is reused until shortly before it expires and immutable instance facts (region, instance id,
+    identity document) are memoized. Use IMDSv2Util.shared() to get the process-wide instance.
+    """
+
+    _shared_instance = None
+    _shared_instance_lock = threading.Lock()
+
+    def __init__(self, endpoint=None, connect_timeout=IMDS_CONNECT_TIMEOUT_SECS, read_timeout=IMDS_READ_TIMEOUT_SECS,
+                 max_retries=IMDS_MAX_RETRIES):
+        if endpoint is None:
+            endpoint = os.environ.get("AWS_EC2_METADATA_SERVICE_ENDPOINT", IMDS_DEFAULT_ENDPOINT)
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self._lock = threading.RLock()
+        self._session = None
+        self._token = None
+        self._token_expires_at = 0
+        self._metadata_cache = {}
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_instance_lock:
+            if cls._shared_instance is None:
+                cls._shared_instance = cls()
+            return cls._shared_instance
 
     def get_region(self):
-        token = self.__get_imdsv2_token()
-        return requests.get("http://169.254.169.254/latest/dynamic/instance-identity/document",
-                            headers={IMDSv2_TOKEN_HEADER: token}).json()['region']
+        return self.get_identity_document()['region']
 
     def ec2_instance_id(self):
-        token = self.__get_imdsv2_token()
-        return requests.get("http://169.254.169.254/latest/meta-data/instance-id",
-                            headers={IMDSv2_TOKEN_HEADER: token}).text
+        return self._get_cached("instance-id", lambda: self._get("/latest/meta-data/instance-id").text)
+
+    def get_identity_document(self):
+        return self._get_cached("identity-document",
+                                lambda: self._get("/latest/dynamic/instance-identity/document").json())
+
+    def _get_cached(self, key, fetch):
+        with self._lock:
+            if key not in self._metadata_cache:
+                self._metadata_cache[key] = fetch()
+            return self._metadata_cache[key]
+
+    def _get_session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=self.max_retries, backoff_factor=0.1, status_forcelist=[429, 500, 502, 503, 504])
+                session = requests.Session()
+                session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+                self._session = session
+            return self._session
+
+    def _get_token(self):
+        with self._lock:
+            if self._token is None or time.monotonic() >= self._token_expires_at:
+                with stats.phase("imds/latest/api/token"):
+                    response = self._get_session().put(self.endpoint + "/latest/api/token",
+                                                       headers={IMDSv2_TOKEN_TTL_HEADER: str(IMDSv2_TOKEN_TTL_SECS)},
+                                                       timeout=self.timeout)
+                response.raise_for_status()
+                self._token = response.text
+                self._token_expires_at = time.monotonic() + IMDSv2_TOKEN_TTL_SECS - IMDSv2_TOKEN_REFRESH_MARGIN_SECS
+            return self._token
+
+    def _invalidate_token(self):
+        with self._lock:
+            self._token = None
+
+    def _get(self, path):
+        with stats.phase("imds" + path):
+            response = self._get_session().get(self.endpoint + path, headers={IMDSv2_TOKEN_HEADER: self._get_token()},
+                                               timeout=self.timeout)
+            if response.status_code == 401:
+                # The token was rejected (e.g. the instance metadata service was restarted), fetch a new one and
+                # retry once.
+                self._invalidate_token()
+                response = self._get_session().get(self.endpoint + path,
+                                                   headers={IMDSv2_TOKEN_HEADER: self._get_token()},
+                                                   timeout=self.timeout)
+        response.raise_for_status()
+        return response
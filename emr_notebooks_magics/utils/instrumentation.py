@@ -0,0 +1,180 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+STATS_ENV_VARIABLE = "EMR_NOTEBOOKS_MAGICS_STATS"
+THROTTLING_ERROR_CODES = ("Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException",
+                          "TooManyRequestsException", "SlowDown", "RequestLimitExceeded", "PriorRequestNotComplete")
+_CALL_START_CONTEXT_KEY = "emr_notebooks_magics_call_start"
+_CALL_THROTTLES_CONTEXT_KEY = "emr_notebooks_magics_call_throttles"
+
+
+class Metric:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_secs = 0.0
+        self.max_secs = 0.0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+
+    def to_dict(self):
+        return {"name": self.name, "count": self.count, "total_ms": self.total_secs * 1000,
+                "mean_ms": self.total_secs * 1000 / self.count if self.count else 0.0,
+                "max_ms": self.max_secs * 1000, "errors": self.errors, "retries": self.retries,
+                "throttles": self.throttles}
+
+
+class Instrumentation:
+    """
+    Records the wall time of the phases of the magics (AWS API calls, instance metadata requests, subprocesses,
+    polling) and the retries and throttles of the AWS API calls.
+    Recording is disabled by default, and a disabled phase costs a single attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._started_at = time.time()
+
+    @contextmanager
+    def _phase(self, name):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, error=failed)
+
+    def phase(self, name):
+        """
+        Returns a context manager that records the wall time of the enclosed block under the given name.
+        """
+        return self._phase(name) if self.enabled else _DISABLED_PHASE
+
+    def record(self, name, secs, error=False, retries=0, throttles=0):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(name)
+            metric.count += 1
+            metric.total_secs += secs
+            metric.max_secs = max(metric.max_secs, secs)
+            metric.errors += 1 if error else 0
+            metric.retries += retries
+            metric.throttles += throttles
+
+    def metrics(self):
+        with self._lock:
+            return sorted((metric.to_dict() for metric in self._metrics.values()),
+                          key=lambda metric: metric["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+            self._started_at = time.time()
+
+    def export_json_lines(self, path):
+        """
+        Appends one JSON line per metric to the given file.
+        """
+        timestamp = time.time()
+        with open(os.path.expanduser(path), "a") as f:
+            for metric in self.metrics():
+                metric.update({"timestamp": timestamp, "since": self._started_at})
+                f.write(json.dumps(metric) + "\n")
+
+    def register_botocore_handlers(self, events):
+        """
+        Records every AWS API call made by the clients of a boto3 session as "aws.<service>.<operation>".
+        """
+        events.register("before-call", self._on_before_call)
+        events.register("needs-retry", self._on_needs_retry)
+        events.register("after-call", self._on_after_call)
+        events.register("after-call-error", self._on_after_call_error)
+
+    def _on_before_call(self, context=None, **kwargs):
+        if self.enabled and context is not None:
+            context[_CALL_START_CONTEXT_KEY] = time.perf_counter()
+
+    def _on_needs_retry(self, response=None, request_dict=None, **kwargs):
+        # Emitted after every attempt, including the ones that are retried
+        if not self.enabled or response is None or request_dict is None:
+            return None
+        http_response, parsed = response
+        error_code = (parsed or {}).get("Error", {}).get("Code")
+        # Responses to HEAD requests have no body, so S3 throttling only shows as a 503 status
+        if error_code in THROTTLING_ERROR_CODES or getattr(http_response, "status_code", None) == 429 or \
+                error_code == "503":
+            context = request_dict.get("context", {})
+            context[_CALL_THROTTLES_CONTEXT_KEY] = context.get(_CALL_THROTTLES_CONTEXT_KEY, 0) + 1
+        return None
+
+    def _on_after_call(self, event_name, parsed=None, context=None, **kwargs):
+        start = (context or {}).get(_CALL_START_CONTEXT_KEY)
+        if not self.enabled or start is None:
+            return
+        self.record(_get_call_metric_name(event_name), time.perf_counter() - start,
+                    error="Error" in (parsed or {}),
+                    retries=(parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                    throttles=context.get(_CALL_THROTTLES_CONTEXT_KEY, 0))
+
+    def _on_after_call_error(self, event_name, context=None, **kwargs):
+        start = (context or {}).get(_CALL_START_CONTEXT_KEY)
+        if self.enabled and start is not None:
+            self.record(_get_call_metric_name(event_name), time.perf_counter() - start, error=True)
+
+
+class _DisabledPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_DISABLED_PHASE = _DisabledPhase()
+
+stats = Instrumentation(enabled=os.environ.get(STATS_ENV_VARIABLE, "false").lower() == "true")
+
+
+def instrumented(func):
+    """
+    Records the wall time of a magic as "magic.<name>".
+    """
+    name = "magic." + func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not stats.enabled:
+            return func(*args, **kwargs)
+        with stats.phase(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _get_call_metric_name(event_name):
+    # event_name is "after-call.<service>.<operation>"
+    return "aws." + event_name.split(".", 1)[-1]
@@ -0,0 +1,74 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class LockedJSONFile:
+    """
+    JSON file on the local disk that is locked while it is updated, so that it can be shared by all kernels on the
+    instance. The lock is a flock on a ".lock" file next to it, and writes replace the file atomically, so readers
+    never see a partial file. The lock is reentrant for the thread that holds it.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            if self._lock_depth > 0:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, default=None):
+        """
+        Returns the content of the file, or default if it does not exist or is not valid JSON.
+        """
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def write(self, value):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import subprocess
+import sys
+import time
+
+SMALL_FILE_MAX_SIZE = 1024 * 1024
+LARGE_FILE_MIN_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Imports each module in a fresh interpreter so that the modules already imported by the kernel are not measured.
+IMPORT_TIMER_SCRIPT = """
+import importlib, json, sys, time
+sys.path.insert(0, sys.argv[1])
+timings = {}
+for name in sys.argv[2:]:
+    start = time.perf_counter()
+    try:
+        importlib.import_module(name)
+    except BaseException:
+        continue
+    timings[name] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def benchmark_directory(directory, max_files=500, max_large_file_bytes=256 * 1024 * 1024):
+    """
+    Measures the file system operations that notebooks do on a Workspace directory: listing and stating files,
+    reading small files, reading a large file sequentially and importing the Python modules of the directory.
+    Only reads are done, so that the benchmark also runs on the read-only mounts.
+    """
+    directories, files, listdir_time = _walk(directory, max_files)
+
+    start = time.perf_counter()
+    for path in files:
+        os.stat(path)
+    stat_time = time.perf_counter() - start
+
+    sizes = {path: os.path.getsize(path) for path in files}
+    small_files = [path for path in files if sizes[path] <= SMALL_FILE_MAX_SIZE]
+    read_latencies = [_time_read(path) for path in small_files]
+
+    large_files = [path for path in files if sizes[path] >= LARGE_FILE_MIN_SIZE]
+    sequential_throughput = None
+    if large_files:
+        largest_file = max(large_files, key=lambda path: sizes[path])
+        read_bytes, read_time = _read_sequential(largest_file, max_large_file_bytes)
+        sequential_throughput = read_bytes / read_time / (1024 * 1024) if read_time > 0 else None
+
+    import_times = _time_imports(directory, files)
+
+    return {
+        "directory": directory,
+        "timestamp": time.time(),
+        "files": len(files),
+        "directories": len(directories),
+        "listdir_per_second": _rate(len(directories), listdir_time),
+        "stat_per_second": _rate(len(files), stat_time),
+        "small_file_reads": len(read_latencies),
+        "small_file_read_ms": {
+            "p50": _percentile(read_latencies, 50),
+            "p90": _percentile(read_latencies, 90),
+            "p99": _percentile(read_latencies, 99),
+        },
+        "sequential_read_mb_per_second": sequential_throughput,
+        "imported_modules": len(import_times),
+        "import_ms": sum(import_times.values()) * 1000 if import_times else None,
+    }
+
+
+def _walk(directory, max_files):
+    directories, files = [], []
+    pending = [directory]
+    start = time.perf_counter()
+    while pending and len(files) < max_files:
+        current = pending.pop()
+        directories.append(current)
+        try:
+            entries = list(os.scandir(current))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith("."):
+                    pending.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and len(files) < max_files:
+                files.append(entry.path)
+    return directories, files, time.perf_counter() - start
+
+
+def _time_read(path):
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        f.read()
+    return (time.perf_counter() - start) * 1000
+
+
+def _read_sequential(path, max_bytes):
+    read_bytes = 0
+    start = time.perf_counter()
+    with open(path, "rb", buffering=0) as f:
+        while read_bytes < max_bytes:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            read_bytes += len(chunk)
+    return read_bytes, time.perf_counter() - start
+
+
+def _time_imports(directory, files):
+    module_names = []
+    for path in files:
+        relative_path = os.path.relpath(path, directory)
+        name, extension = os.path.splitext(relative_path)
+        if extension == ".py" and os.sep not in name and name.isidentifier():
+            module_names.append(name)
+        elif relative_path.endswith(os.sep + "__init__.py") and os.path.dirname(relative_path).isidentifier():
+            module_names.append(os.path.dirname(relative_path))
+    if not module_names:
+        return {}
+
+    # -B keeps the benchmark from writing bytecode, so that every run compiles the modules from the directory.
+    process = subprocess.run([sys.executable, "-B", "-c", IMPORT_TIMER_SCRIPT, directory] + sorted(module_names),
+                             capture_output=True, text=True, cwd=directory)
+    try:
+        return json.loads(process.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {}
+
+
+def _rate(count, seconds):
+    return count / seconds if count and seconds > 0 else None
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+MOUNT_PROFILES = ["small-files", "large-sequential", "read-mostly"]
+
+# s3fs documents about 40 MB for its default of 100,000 stat cache entries.
+S3FS_STAT_CACHE_ENTRY_SIZE = 400
+S3FS_MIN_STAT_CACHE_SIZE = 100000
+S3FS_MAX_STAT_CACHE_SIZE = 2000000
+
+# Only block devices with these file systems are considered for the s3fs data cache.
+LOCAL_FILE_SYSTEMS = ("ext2", "ext3", "ext4", "xfs", "btrfs")
+S3FS_CACHE_DIR_NAME = "emr-notebooks-s3fs-cache-{}"
+
+
+def get_profile_params(fuse_type, profile):
+    """
+    Returns the mount params of a profile, sized for the memory and the cores of the instance.
+    The params have the same "name=value" form as the params of %mount_workspace_dir.
+    """
+    memory, cpu_count = get_instance_resources()
+    if fuse_type == "s3-fuse":
+        return _get_s3fuse_profile_params(profile, memory, cpu_count)
+    elif fuse_type == "goofys":
+        return _get_goofys_profile_params(profile)
+    return []
+
+
+def merge_mount_params(profile_params, params):
+    """
+    Merges the params of a profile with the comma separated params given by the user. The params given by the user
+    override the params of the profile with the same name.
+    """
+    merged_params = {}
+    for param in profile_params + (params.split(",") if params else []):
+        merged_params[param.split("=", 1)[0]] = param
+    return ",".join(merged_params.values()) if merged_params else None
+
+
+def get_instance_resources():
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return memory, os.cpu_count() or 1
+
+
+def get_largest_local_volume():
+    """
+    Returns a writable directory on the local volume with the most free space, or None if there is no such volume.
+    """
+    volumes = []
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                device, mount_point, fs_type = line.split()[:3]
+                if device.startswith("/dev/") and fs_type in LOCAL_FILE_SYSTEMS:
+                    volumes.append(mount_point)
+    except OSError:
+        return None
+
+    largest_dir, largest_free = None, -1
+    for mount_point in set(volumes):
+        for directory in [mount_point, os.path.join(mount_point, "tmp")]:
+            if os.path.isdir(directory) and os.access(directory, os.W_OK):
+                stat = os.statvfs(directory)
+                free = stat.f_bavail * stat.f_frsize
+                if free > largest_free:
+                    largest_dir, largest_free = directory, free
+                break
+    return largest_dir
+
+
+def _clamp(value, min_value, max_value):
+    return max(min_value, min(value, max_value))
+
+
+def _get_s3fuse_stat_cache_size(memory, memory_fraction):
+    return _clamp(int(memory * memory_fraction / S3FS_STAT_CACHE_ENTRY_SIZE),
+                  S3FS_MIN_STAT_CACHE_SIZE, S3FS_MAX_STAT_CACHE_SIZE)
+
+
+def _get_s3fuse_cache_params():
+    volume = get_largest_local_volume()
+    if volume is None:
+        return []
+    cache_dir = os.path.join(volume, S3FS_CACHE_DIR_NAME.format(os.getuid()))
+    os.makedirs(cache_dir, exist_ok=True)
+    # Keep 10% of the volume free for the jobs running on the cluster.
+    stat = os.statvfs(cache_dir)
+    ensure_diskfree = max(stat.f_blocks * stat.f_frsize // 10 // (1024 * 1024), 1024)
+    return ["use_cache={}".format(cache_dir), "ensure_diskfree={}".format(ensure_diskfree)]
+
+
+def _get_s3fuse_profile_params(profile, memory, cpu_count):
+    if profile == "small-files":
+        return [
+            "max_stat_cache_size={}".format(_get_s3fuse_stat_cache_size(memory, 0.01)),
+            "stat_cache_expire=900",
+            "enable_noobj_cache",
+            "multireq_max={}".format(_clamp(cpu_count * 4, 20, 100)),
+        ] + _get_s3fuse_cache_params()
+    elif profile == "large-sequential":
+        return [
+            "parallel_count={}".format(_clamp(cpu_count * 2, 5, 32)),
+            "multipart_size={}".format(64 if memory >= 16 * 1024 ** 3 else 32),
+        ] + _get_s3fuse_cache_params()
+    elif profile == "read-mostly":
+        return [
+            "max_stat_cache_size={}".format(_get_s3fuse_stat_cache_size(memory, 0.005)),
+            "stat_cache_expire=3600",
+            "enable_noobj_cache",
+            "kernel_cache",
+        ] + _get_s3fuse_cache_params()
+    return []
+
+
+def _get_goofys_profile_params(profile):
+    # Goofys streams reads and writes without a local data cache, so its profiles only tune the metadata caches.
+    if profile == "small-files":
+        return ["stat-cache-ttl=5m", "type-cache-ttl=5m"]
+    elif profile == "read-mostly":
+        return ["stat-cache-ttl=1h", "type-cache-ttl=1h"]
+    return []
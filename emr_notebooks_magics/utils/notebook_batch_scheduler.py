@@ -0,0 +1,149 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import queue
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+TASK_STATUS_PENDING = "PENDING"
+TASK_STATUS_SKIPPED = "SKIPPED"
+
+
+class NotebookTask:
+    """
+    A notebook to be executed as part of a batch.
+    """
+
+    def __init__(self, name, notebook, cluster_id, dependencies=None, params=None):
+        self.name = name
+        self.notebook = notebook
+        self.cluster_id = cluster_id
+        self.dependencies = list(dependencies or [])
+        self.params = params
+        self.execution = None
+        self.error = None
+        self.skipped = False
+
+    def is_done(self):
+        return self.skipped or self.error is not None or (self.execution is not None and self.execution.is_done())
+
+    def succeeded(self):
+        execution = self.execution
+        return execution is not None and execution.is_done() and execution.error is None \
+            and not execution.timed_out and execution.status == "FINISHED"
+
+    def get_status(self):
+        if self.skipped:
+            return TASK_STATUS_SKIPPED
+        if self.error is not None:
+            return "FAILED TO START"
+        if self.execution is None:
+            return TASK_STATUS_PENDING
+        if self.execution.error is not None:
+            return "UNKNOWN"
+        if self.execution.timed_out:
+            return "{} (timed out)".format(self.execution.status)
+        if self.execution.cached:
+            return "{} (cached)".format(self.execution.status)
+        return self.execution.status or "STARTING"
+
+
+class NotebookBatchScheduler:
+    """
+    Runs a batch of notebooks, starting each one as soon as all of its dependencies have finished successfully.
+    At most max_concurrency notebooks run at the same time on each cluster. Notebooks that depend on a notebook
+    that did not finish successfully are skipped.
+    """
+
+    def __init__(self, tasks, start_execution, max_concurrency, on_progress=None):
+        """
+        start_execution(task, on_update) must start and track the execution of the task and return its
+        NotebookExecution. on_update is to be called by the tracker whenever the execution is updated.
+        """
+        self.tasks = tasks
+        self._start_execution = start_execution
+        self.max_concurrency = max_concurrency
+        self._on_progress = on_progress
+        self._tasks_by_name = {task.name: task for task in tasks}
+        self._validate()
+
+    def _validate(self):
+        for task in self.tasks:
+            for dependency in task.dependencies:
+                if dependency not in self._tasks_by_name:
+                    raise ValueError("{} depends on {} which is not part of the batch".format(task.name, dependency))
+
+        # Depth first search for cycles
+        visiting, visited = set(), set()
+
+        def visit(task):
+            if task.name in visited:
+                return
+            if task.name in visiting:
+                raise ValueError("Dependency cycle detected at {}".format(task.name))
+            visiting.add(task.name)
+            for dependency in task.dependencies:
+                visit(self._tasks_by_name[dependency])
+            visiting.remove(task.name)
+            visited.add(task.name)
+
+        for task in self.tasks:
+            visit(task)
+
+    def run(self):
+        pending = list(self.tasks)
+        running_per_cluster = defaultdict(int)
+        in_flight = 0
+        done_tasks = queue.Queue()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            while pending or in_flight:
+                for task in list(pending):
+                    dependencies = [self._tasks_by_name[name] for name in task.dependencies]
+                    if any(dependency.is_done() and not dependency.succeeded() for dependency in dependencies):
+                        task.skipped = True
+                        pending.remove(task)
+                    elif all(dependency.succeeded() for dependency in dependencies) and \
+                            running_per_cluster[task.cluster_id] < self.max_concurrency:
+                        pending.remove(task)
+                        running_per_cluster[task.cluster_id] += 1
+                        in_flight += 1
+                        pool.submit(self._start, task, done_tasks)
+                self._notify_progress()
+
+                if in_flight == 0:
+                    break
+                task = done_tasks.get()
+                in_flight -= 1
+                running_per_cluster[task.cluster_id] -= 1
+
+        self._notify_progress()
+        return self.tasks
+
+    def _start(self, task, done_tasks):
+        def on_update(execution):
+            # The execution can finish before start_execution has returned.
+            task.execution = execution
+            if execution.is_done():
+                done_tasks.put(task)
+            self._notify_progress()
+
+        try:
+            task.execution = self._start_execution(task, on_update)
+        except Exception as e:
+            task.error = e
+            done_tasks.put(task)
+
+    def _notify_progress(self):
+        if self._on_progress is not None:
+            self._on_progress(self.tasks)
@@ -0,0 +1,164 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .locked_json_file import LockedJSONFile
+from .notebook_execution_tracker import EXECUTIONS_TERMINAL_STATUS
+
+DEFAULT_HISTORY_DIR = os.path.join("~", ".emr_notebooks_magics", "execution_history")
+DEFAULT_MAX_WORKERS = 8
+# Allowance for clock skew between the cluster and EMR, and for executions that are listed late, when listing only
+# the executions started since the last refresh.
+HISTORY_CLOCK_SKEW_SECS = 300
+# Fields of DescribeNotebookExecution kept in the history, in addition to those of the listing.
+DETAIL_FIELDS = ["ExecutionEngine", "NotebookParams", "OutputNotebookURI", "LastStateChangeReason", "Tags"]
+
+
+def _to_timestamp(value):
+    return value.timestamp() if hasattr(value, "timestamp") else value
+
+
+class NotebookExecutionHistory:
+    """
+    Local, incremental copy of the notebook executions of a Workspace.
+    The first refresh lists all executions of the Workspace. Later refreshes only list the executions started since
+    the previous one and describe the executions that were not terminal then, so opening the history of a Workspace
+    with thousands of executions costs a single small ListNotebookExecutions call. Executions in a terminal status never
+    change and are kept forever. The history is kept in a LockedJSONFile.
+    """
+
+    def __init__(self, workspace_id, list_notebook_executions, describe_notebook_execution, path=None,
+                 max_workers=DEFAULT_MAX_WORKERS):
+        """
+        list_notebook_executions(from_time) yields the summaries of the executions of the Workspace started after
+        from_time, or of all its executions if from_time is None.
+        """
+        self.workspace_id = workspace_id
+        self._list_notebook_executions = list_notebook_executions
+        self._describe_notebook_execution = describe_notebook_execution
+        self._file = LockedJSONFile(path or os.path.join(DEFAULT_HISTORY_DIR, workspace_id + ".json"))
+        self.path = self._file.path
+        self.max_workers = max_workers
+
+    def refresh(self, full=False):
+        """
+        Brings the history up to date and returns the number of executions that were added or have changed.
+        With full=True all executions of the Workspace are listed again.
+        """
+        with self._file.locked():
+            history = self._read()
+            executions = history["executions"]
+            refreshed_at = time.time()
+            from_time = None if full or history["refreshed_at"] is None \
+                else history["refreshed_at"] - HISTORY_CLOCK_SKEW_SECS
+
+            changed = 0
+            listed = set()
+            for summary in self._list_notebook_executions(from_time):
+                entry = self._get_entry(summary)
+                listed.add(entry["NotebookExecutionId"])
+                changed += self._merge(executions, entry)
+
+            # Executions that were running at the previous refresh but started before the listed window
+            stale = [execution_id for execution_id, entry in executions.items()
+                     if execution_id not in listed and entry["Status"] not in EXECUTIONS_TERMINAL_STATUS]
+            for notebook_execution in self._describe_all(stale):
+                changed += self._merge(executions, self._get_entry(notebook_execution, details=True))
+
+            history["refreshed_at"] = refreshed_at
+            self._file.write(history)
+        return changed
+
+    def list(self, statuses=None, since=None, until=None, limit=None):
+        """
+        Returns the executions in the history, most recently started first, filtered by status and start time.
+        """
+        with self._file.locked():
+            executions = list(self._read()["executions"].values())
+        if statuses:
+            executions = [entry for entry in executions if entry["Status"] in statuses]
+        if since is not None:
+            executions = [entry for entry in executions if (entry.get("StartTime") or 0) >= since]
+        if until is not None:
+            executions = [entry for entry in executions if (entry.get("StartTime") or 0) < until]
+        executions.sort(key=lambda entry: entry.get("StartTime") or 0, reverse=True)
+        return executions[:limit] if limit is not None else executions
+
+    def fetch_details(self, execution_ids):
+        """
+        Describes the executions concurrently and returns their updated entries by id. The details of terminal
+        executions are cached, so they are only described once.
+        """
+        with self._file.locked():
+            executions = self._read()["executions"]
+        missing = [execution_id for execution_id in execution_ids
+                   if not self._has_details(executions.get(execution_id))]
+        described = [self._get_entry(notebook_execution, details=True)
+                     for notebook_execution in self._describe_all(missing)]
+
+        with self._file.locked():
+            history = self._read()
+            for entry in described:
+                self._merge(history["executions"], entry)
+            if described:
+                self._file.write(history)
+            executions = history["executions"]
+        return {execution_id: executions[execution_id] for execution_id in execution_ids if execution_id in executions}
+
+    def _describe_all(self, execution_ids):
+        if not execution_ids:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(execution_ids))) as pool:
+            return list(pool.map(self._describe_notebook_execution, execution_ids))
+
+    @staticmethod
+    def _has_details(entry):
+        return entry is not None and entry.get("HasDetails") and entry["Status"] in EXECUTIONS_TERMINAL_STATUS
+
+    @staticmethod
+    def _get_entry(notebook_execution, details=False):
+        entry = {key: value for key, value in notebook_execution.items()
+                 if key in ("NotebookExecutionId", "NotebookExecutionName", "Status", "NotebookS3Location",
+                            "ExecutionEngineId")
+                 or (details and key in DETAIL_FIELDS)}
+        entry["StartTime"] = _to_timestamp(notebook_execution.get("StartTime"))
+        entry["EndTime"] = _to_timestamp(notebook_execution.get("EndTime"))
+        if details:
+            entry["HasDetails"] = True
+        return entry
+
+    @staticmethod
+    def _merge(executions, entry):
+        """
+        Merges the entry into the history, keeping the details of an execution when it is listed again.
+        Returns 1 if the execution is new or has changed, 0 otherwise.
+        """
+        current = executions.get(entry["NotebookExecutionId"])
+        if current is None:
+            executions[entry["NotebookExecutionId"]] = entry
+            return 1
+        if current["Status"] != entry["Status"] and not entry.get("HasDetails"):
+            # The details of a running execution may change with its status
+            current.pop("HasDetails", None)
+        previous = dict(current)
+        current.update((key, value) for key, value in entry.items() if value is not None)
+        return int(current != previous)
+
+    def _read(self):
+        history = self._file.read()
+        if isinstance(history, dict) and history.get("workspace_id") == self.workspace_id:
+            return history
+        return {"workspace_id": self.workspace_id, "refreshed_at": None, "executions": {}}
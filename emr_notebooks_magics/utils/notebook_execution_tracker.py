@@ -0,0 +1,262 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from .instrumentation import stats
+
+EXECUTIONS_TERMINAL_STATUS = ["FINISHED", "FAILED", "STOPPED"]
+EXECUTIONS_STARTING_STATUS = ["STARTING", "START_PENDING"]
+
+# Executions are polled quickly while they start, then with an exponential backoff while they run.
+STARTING_POLL_INTERVAL_SECS = 2
+RUNNING_MIN_POLL_INTERVAL_SECS = 5
+RUNNING_MAX_POLL_INTERVAL_SECS = 60
+POLL_BACKOFF_MULTIPLIER = 1.5
+POLL_JITTER = 0.2
+# When at least this many executions are due in the same tick, their status is refreshed with a single
+# ListNotebookExecutions call and only the executions that have changed are described.
+BATCH_REFRESH_MIN_EXECUTIONS = 3
+# Allowance for clock skew between the cluster and EMR when listing executions by start time.
+BATCH_REFRESH_CLOCK_SKEW_SECS = 300
+# Throttling and connection errors are retried on the next polls, until this many polls in a row have failed.
+MAX_CONSECUTIVE_POLL_ERRORS = 5
+TRANSIENT_ERROR_CODES = ["Throttling", "ThrottlingException", "ThrottledException", "RequestLimitExceeded",
+                         "TooManyRequestsException", "RequestTimeout", "RequestTimeoutException",
+                         "InternalServerError", "InternalServerException", "ServiceUnavailable"]
+
+
+def _is_transient_error(e):
+    import botocore.exceptions
+
+    if isinstance(e, botocore.exceptions.ClientError):
+        status_code = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return e.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES or status_code == 429 \
+            or status_code >= 500
+    return isinstance(e, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError))
+
+
+class NotebookExecution:
+    """
+    Handle of a notebook execution started from this kernel.
+    """
+
+    def __init__(self, execution_id, notebook, cluster_id, timeout, on_update=None):
+        self.execution_id = execution_id
+        self.notebook = notebook
+        self.cluster_id = cluster_id
+        self.status = None
+        self.output_notebook_uri = None
+        self.is_output_link_shown = False
+        # True if the result of an earlier execution is reused instead of executing the notebook again.
+        self.cached = False
+        self.timed_out = False
+        self.error = None
+        self.start_time = time.time()
+        self.end_time = None
+        self.deadline = self.start_time + timeout
+        self.on_update = on_update
+        self.poll_interval = None
+        self.poll_errors = 0
+        self.next_poll_at = self.start_time
+        # True once the execution has reached its final state. Waiters are only woken up once the on_update
+        # callbacks of the final state have run, see signal_done.
+        self.terminal = False
+        self._done = threading.Event()
+
+    def is_done(self):
+        return self.terminal
+
+    def wait(self, timeout=None):
+        """
+        Waits for the execution to reach a terminal status or time out. Returns True if tracking has finished.
+        """
+        return self._done.wait(timeout)
+
+    def duration(self):
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    def update(self, notebook_execution):
+        """
+        Updates the handle from a DescribeNotebookExecution response. Returns True if anything has changed.
+        """
+        status = notebook_execution["Status"]
+        output_notebook_uri = notebook_execution.get("OutputNotebookURI")
+        changed = status != self.status or output_notebook_uri != self.output_notebook_uri
+        self.status = status
+        self.output_notebook_uri = output_notebook_uri
+        return changed
+
+    def finish(self, timed_out=False, error=None):
+        """
+        Marks the execution as terminal. The waiters are woken up by signal_done.
+        """
+        self.timed_out = timed_out
+        self.error = error
+        self.end_time = time.time()
+        self.terminal = True
+
+    def signal_done(self):
+        self._done.set()
+
+    def __repr__(self):
+        return "NotebookExecution(id={}, notebook={}, cluster={}, status={})".format(
+            self.execution_id, self.notebook, self.cluster_id, self.status)
+
+
+class NotebookExecutionTracker:
+    """
+    Keeps track of the notebook executions started from this kernel.
+    All executions are polled from a single background thread that is started on demand. Each execution is polled
+    on its own adaptive schedule and is finished as soon as its deadline passes.
+    """
+
+    def __init__(self, describe_notebook_execution, list_notebook_executions=None):
+        self._describe_notebook_execution = describe_notebook_execution
+        self._list_notebook_executions = list_notebook_executions
+        self._executions = OrderedDict()
+        self._condition = threading.Condition()
+        self._poller = None
+
+    def track(self, execution):
+        if execution.is_done():
+            with self._condition:
+                self._executions[execution.execution_id] = execution
+            self._notify_done(execution)
+            return execution
+
+        with self._condition:
+            self._executions[execution.execution_id] = execution
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name="emr-notebook-execution-poller", daemon=True)
+                self._poller.start()
+            self._condition.notify_all()
+        return execution
+
+    def get(self, execution_id):
+        with self._condition:
+            return self._executions.get(execution_id)
+
+    def list(self):
+        with self._condition:
+            return list(self._executions.values())
+
+    def poll_now(self, execution_id):
+        """
+        Schedules the execution to be polled right away, e.g. after it was asked to stop.
+        """
+        with self._condition:
+            execution = self._executions.get(execution_id)
+            if execution is not None:
+                execution.next_poll_at = time.time()
+                self._condition.notify_all()
+
+    def _poll(self):
+        while True:
+            with self._condition:
+                while True:
+                    active = [execution for execution in self._executions.values() if not execution.is_done()]
+                    if not active:
+                        self._poller = None
+                        return
+                    now = time.time()
+                    wake_at = min(min(execution.next_poll_at, execution.deadline) for execution in active)
+                    if wake_at <= now:
+                        break
+                    self._condition.wait(wake_at - now)
+
+            due = []
+            for execution in active:
+                if now >= execution.deadline:
+                    execution.finish(timed_out=True)
+                    self._notify_done(execution)
+                elif now >= execution.next_poll_at - POLL_JITTER * (execution.poll_interval or 0):
+                    # Executions that are due within their jitter window are polled together with the others.
+                    due.append(execution)
+            self._refresh(due)
+
+    def _refresh(self, executions):
+        with stats.phase("emr.poll"):
+            self._refresh_executions(executions)
+
+    def _refresh_executions(self, executions):
+        summaries = {}
+        if self._list_notebook_executions is not None and len(executions) >= BATCH_REFRESH_MIN_EXECUTIONS:
+            from_time = min(execution.start_time for execution in executions) - BATCH_REFRESH_CLOCK_SKEW_SECS
+            try:
+                summaries = {summary["NotebookExecutionId"]: summary
+                             for summary in self._list_notebook_executions(from_time)}
+            except Exception:
+                # Fall back to describing every execution.
+                summaries = {}
+
+        for execution in executions:
+            if execution.is_done():
+                continue
+            try:
+                summary = summaries.get(execution.execution_id)
+                if summary is not None and summary["Status"] == execution.status and \
+                        (execution.output_notebook_uri is not None or execution.status in EXECUTIONS_STARTING_STATUS):
+                    changed = False
+                else:
+                    changed = execution.update(self._describe_notebook_execution(execution.execution_id))
+            except Exception as e:
+                execution.poll_errors += 1
+                if _is_transient_error(e) and execution.poll_errors < MAX_CONSECUTIVE_POLL_ERRORS:
+                    self._schedule_poll_retry(execution)
+                else:
+                    execution.finish(error=e)
+                    self._notify_done(execution)
+                continue
+
+            execution.poll_errors = 0
+            if changed:
+                self._notify(execution)
+            if execution.status in EXECUTIONS_TERMINAL_STATUS:
+                execution.finish()
+                self._notify_done(execution)
+            else:
+                self._schedule_next_poll(execution, changed)
+
+    def _schedule_next_poll(self, execution, changed):
+        if execution.status is None or execution.status in EXECUTIONS_STARTING_STATUS:
+            interval = STARTING_POLL_INTERVAL_SECS
+        elif changed or execution.poll_interval is None:
+            interval = RUNNING_MIN_POLL_INTERVAL_SECS
+        else:
+            interval = min(execution.poll_interval * POLL_BACKOFF_MULTIPLIER, RUNNING_MAX_POLL_INTERVAL_SECS)
+        execution.poll_interval = interval
+        execution.next_poll_at = time.time() + interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def _schedule_poll_retry(self, execution):
+        interval = min(RUNNING_MIN_POLL_INTERVAL_SECS * POLL_BACKOFF_MULTIPLIER ** (execution.poll_errors - 1),
+                       RUNNING_MAX_POLL_INTERVAL_SECS)
+        execution.next_poll_at = time.time() + interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def _notify(self, execution):
+        if execution.on_update is not None:
+            execution.on_update(execution)
+
+    def _notify_done(self, execution):
+        """
+        Runs the on_update callback of the final state before waking up the waiters, so that a blocking magic
+        displays the final status before it returns.
+        """
+        try:
+            self._notify(execution)
+        finally:
+            execution.signal_done()
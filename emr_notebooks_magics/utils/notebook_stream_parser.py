@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import codecs
+import json
+import re
+from .str_utils import join_multiline
+
+_STRUCTURAL_CHARS = re.compile(r'[{}\[\]"]')
+_STRING_CHARS = re.compile(r'["\\]')
+
+SCRAP_MIME_TYPE_PREFIX = "application/scrapbook.scrap."
+
+
+def iter_notebook_cells(chunks):
+    """
+    Incrementally parses a notebook file (nbformat 4) given as an iterable of byte chunks and yields its cells one by
+    one. Only the cell being parsed is kept in memory, and parsing stops as soon as the cells have been read.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    depth = 0
+    in_string = False
+    is_escaped = False
+    key_pieces = None
+    last_key = None
+    in_cells = False
+    cell_pieces = None
+
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        cell_start = 0
+        pos = 0
+        while pos < len(text):
+            if in_string:
+                if is_escaped:
+                    if key_pieces is not None:
+                        key_pieces.append(text[pos])
+                    is_escaped = False
+                    pos += 1
+                    continue
+                match = _STRING_CHARS.search(text, pos)
+                if match is None:
+                    if key_pieces is not None:
+                        key_pieces.append(text[pos:])
+                    break
+                if key_pieces is not None:
+                    key_pieces.append(text[pos:match.start()])
+                pos = match.end()
+                if match.group() == "\\":
+                    is_escaped = True
+                else:
+                    in_string = False
+                    if key_pieces is not None:
+                        last_key = "".join(key_pieces)
+                        key_pieces = None
+                continue
+
+            match = _STRUCTURAL_CHARS.search(text, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                in_string = True
+                if depth == 1:
+                    key_pieces = []
+            elif char in "{[":
+                if depth == 1 and char == "[" and last_key == "cells":
+                    in_cells = True
+                elif in_cells and depth == 2:
+                    cell_pieces = []
+                    cell_start = match.start()
+                depth += 1
+            else:
+                depth -= 1
+                if in_cells and depth == 2:
+                    cell_pieces.append(text[cell_start:pos])
+                    yield json.loads("".join(cell_pieces))
+                    cell_pieces = None
+                elif in_cells and depth == 1:
+                    return
+
+        if cell_pieces is not None:
+            cell_pieces.append(text[cell_start:])
+
+
+def get_cell_output_values(cell):
+    """
+    Returns the outputs of a cell: the text of stream outputs, and the mime bundle of other outputs.
+    """
+    values = []
+    for output in cell.get("outputs", []):
+        if output.get("output_type") == "stream":
+            values.append(join_multiline(output.get("text", "")))
+        elif "data" in output:
+            values.append({mime_type: join_multiline(value) for mime_type, value in output["data"].items()})
+    return values
+
+
+def get_cell_scraps(cell):
+    """
+    Returns the scraps glued into a cell with scrapbook, as a dict of name to value.
+    """
+    scraps = {}
+    for output in cell.get("outputs", []):
+        for mime_type, scrap in output.get("data", {}).items():
+            if mime_type.startswith(SCRAP_MIME_TYPE_PREFIX) and isinstance(scrap, dict) and "name" in scrap:
+                scraps[scrap["name"]] = scrap.get("data")
+    return scraps
+
@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+from urllib.parse import urlparse
+from .str_utils import remove_prefix
+
+
+class OutputNotebookStreamer:
+    """
+    Follows the output notebook of a running execution and returns the cells that have finished since the last call.
+    The output notebook is only downloaded again when its ETag has changed.
+    """
+
+    def __init__(self, s3_client, output_notebook_uri):
+        parsed_url = urlparse(output_notebook_uri, allow_fragments=False)
+        self.s3_client = s3_client
+        self.s3_bucket = parsed_url.netloc
+        self.s3_key = remove_prefix(parsed_url.path, "/")
+        self.etag = None
+        self.cells = []
+        self.finished_cell_count = 0
+        self.downloads = 0
+        self.not_modified = 0
+
+    def get_finished_cells(self, final=False):
+        """
+        Returns the code cells that have finished since the last call. When final is True, the execution has completed
+        and every remaining cell is returned.
+        """
+        self._refresh()
+
+        finished_cells = []
+        for cell in self.cells[self.finished_cell_count:]:
+            if not final and not self._is_cell_finished(cell):
+                break
+            finished_cells.append(cell)
+            self.finished_cell_count += 1
+        return [cell for cell in finished_cells if cell.get("cell_type") == "code"]
+
+    def _refresh(self):
+        import botocore
+
+        request = {"Bucket": self.s3_bucket, "Key": self.s3_key}
+        if self.etag is not None:
+            request["IfNoneMatch"] = self.etag
+        try:
+            response = self.s3_client.get_object(**request)
+        except botocore.exceptions.ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code in ("304", "NotModified"):
+                self.not_modified += 1
+                return
+            if error_code in ("404", "NoSuchKey"):
+                # The output notebook has not been written yet.
+                return
+            raise
+
+        try:
+            notebook = json.loads(response["Body"].read())
+        except ValueError:
+            # The output notebook is being rewritten, try again on the next refresh.
+            return
+        self.downloads += 1
+        self.etag = response["ETag"]
+        self.cells = notebook.get("cells", [])
+
+    @staticmethod
+    def _is_cell_finished(cell):
+        papermill_metadata = cell.get("metadata", {}).get("papermill", {})
+        if "status" in papermill_metadata:
+            return papermill_metadata["status"] == "completed"
+        return cell.get("cell_type") != "code" or cell.get("execution_count") is not None
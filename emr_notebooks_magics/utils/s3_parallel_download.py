@@ -0,0 +1,180 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+DOWNLOAD_MANIFEST_SUFFIX = ".download-manifest.json"
+READ_CHUNK_SIZE = 256 * 1024
+PROGRESS_INTERVAL_SECS = 0.5
+
+
+class S3ObjectDownload:
+    """
+    Download of a S3 object into a local file, split into byte ranges of part_size bytes.
+    The completed parts are recorded in a manifest next to the file, so that an interrupted download can be resumed.
+    """
+
+    def __init__(self, s3_bucket, s3_key, size, etag, local_path, part_size):
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self.size = size
+        self.etag = etag
+        self.local_path = local_path
+        self.part_size = part_size
+        self.part_count = max(1, -(-size // part_size))
+        self.completed_parts = set()
+        self.fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def manifest_path(self):
+        return self.local_path + DOWNLOAD_MANIFEST_SUFFIX
+
+    def open(self):
+        """
+        Opens the local file, resuming a previous download of the same object version if there is one.
+        Returns the number of bytes that have already been downloaded.
+        """
+        manifest = self._read_manifest()
+        resume = manifest is not None and os.path.exists(self.local_path) and manifest.get("etag") == self.etag \
+            and manifest.get("size") == self.size and manifest.get("part_size") == self.part_size
+        if resume:
+            self.completed_parts = set(manifest["completed_parts"])
+
+        parent_dir = os.path.dirname(self.local_path)
+        if parent_dir:
+            os.makedirs(parent_dir, exist_ok=True)
+        self.fd = os.open(self.local_path, os.O_RDWR | os.O_CREAT)
+        if not resume:
+            os.ftruncate(self.fd, 0)
+            if self.size > 0 and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(self.fd, 0, self.size)
+                except OSError:
+                    os.ftruncate(self.fd, self.size)
+            else:
+                os.ftruncate(self.fd, self.size)
+            self._write_manifest()
+        return sum(self._get_part_length(part) for part in self.completed_parts)
+
+    def pending_parts(self):
+        return [part for part in range(self.part_count) if part not in self.completed_parts]
+
+    def download_part(self, s3_client, part, on_bytes):
+        if self.size == 0:
+            return
+        start = part * self.part_size
+        end = min(start + self.part_size, self.size) - 1
+        response = s3_client.get_object(Bucket=self.s3_bucket, Key=self.s3_key, IfMatch=self.etag,
+                                        Range="bytes={}-{}".format(start, end))
+        offset = start
+        for chunk in response["Body"].iter_chunks(READ_CHUNK_SIZE):
+            os.pwrite(self.fd, chunk, offset)
+            offset += len(chunk)
+            on_bytes(len(chunk))
+        if offset != end + 1:
+            raise IOError("Incomplete download of s3://{}/{} bytes {}-{}".format(self.s3_bucket, self.s3_key, start, end))
+
+        with self._lock:
+            self.completed_parts.add(part)
+            self._write_manifest()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if len(self.completed_parts) == self.part_count or self.size == 0:
+            try:
+                os.remove(self.manifest_path)
+            except FileNotFoundError:
+                pass
+
+    def _get_part_length(self, part):
+        return min(self.part_size, self.size - part * self.part_size)
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"etag": self.etag, "size": self.size, "part_size": self.part_size,
+                       "completed_parts": sorted(self.completed_parts)}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class S3ParallelDownloader:
+    """
+    Downloads S3 objects by fetching byte ranges of all objects concurrently from a single thread pool.
+    """
+
+    def __init__(self, s3_client, max_workers, on_progress=None):
+        self.s3_client = s3_client
+        self.max_workers = max_workers
+        self._on_progress = on_progress
+        self._lock = threading.Lock()
+        self._downloaded_bytes = 0
+        self._total_bytes = 0
+        self._last_progress_time = 0
+
+    def download(self, downloads):
+        self._total_bytes = sum(download.size for download in downloads)
+        self._downloaded_bytes = 0
+        try:
+            for download in downloads:
+                self._downloaded_bytes += download.open()
+            self._notify_progress(force=True)
+
+            pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            futures = []
+            try:
+                for download in downloads:
+                    for part in download.pending_parts():
+                        futures.append(pool.submit(download.download_part, self.s3_client, part,
+                                                   self._add_downloaded_bytes))
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+            finally:
+                # ThreadPoolExecutor.shutdown(cancel_futures=True) requires Python 3.9
+                for future in futures:
+                    future.cancel()
+                pool.shutdown(wait=True)
+            self._notify_progress(force=True)
+        finally:
+            for download in downloads:
+                download.close()
+
+    def _add_downloaded_bytes(self, num_bytes):
+        with self._lock:
+            self._downloaded_bytes += num_bytes
+        self._notify_progress()
+
+    def _notify_progress(self, force=False):
+        if self._on_progress is None:
+            return
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_progress_time < PROGRESS_INTERVAL_SECS:
+                return
+            self._last_progress_time = now
+            downloaded_bytes = self._downloaded_bytes
+        self._on_progress(downloaded_bytes, self._total_bytes)
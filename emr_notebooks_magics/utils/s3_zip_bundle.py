@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from .str_utils import remove_prefix
+
+# S3 requires every part of a multipart upload but the last one to be at least 5 MB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class S3MultipartUploadWriter:
+    """
+    Write-only, unseekable file object that uploads what is written to it as a S3 multipart upload.
+    Parts are uploaded concurrently, with at most max_workers parts buffered or in flight at any time.
+    """
+
+    def __init__(self, s3_client, s3_bucket, s3_key, part_size, max_workers, content_type="application/zip"):
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._parts = []
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._in_flight = threading.BoundedSemaphore(max_workers)
+        self._upload_id = s3_client.create_multipart_upload(Bucket=s3_bucket, Key=s3_key,
+                                                            ContentType=content_type)["UploadId"]
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            with memoryview(self._buffer) as view:
+                part = bytes(view[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(part)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def complete(self, overwrite=True):
+        """
+        Completes the upload. Unless overwrite is True, the upload fails with PreconditionFailed if the object exists.
+        """
+        try:
+            if self._buffer or not self._futures:
+                self._upload_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            for future in self._futures:
+                future.result()
+        finally:
+            self._pool.shutdown(wait=True)
+        self._parts.sort(key=lambda part: part["PartNumber"])
+        condition = {} if overwrite else {"IfNoneMatch": "*"}
+        self.s3_client.complete_multipart_upload(Bucket=self.s3_bucket, Key=self.s3_key, UploadId=self._upload_id,
+                                                 MultipartUpload={"Parts": self._parts}, **condition)
+
+    def abort(self):
+        # ThreadPoolExecutor.shutdown(cancel_futures=True) requires Python 3.9
+        for future in self._futures:
+            future.cancel()
+        self._pool.shutdown(wait=True)
+        self.s3_client.abort_multipart_upload(Bucket=self.s3_bucket, Key=self.s3_key, UploadId=self._upload_id)
+
+    def _upload_part(self, data):
+        # Blocks while max_workers parts are in flight, which bounds the memory used by the writer.
+        self._in_flight.acquire()
+        for future in self._futures:
+            if future.done():
+                # Surface upload errors early
+                future.result()
+        part_number = len(self._futures) + 1
+        self._futures.append(self._pool.submit(self._do_upload_part, part_number, data))
+
+    def _do_upload_part(self, part_number, data):
+        try:
+            response = self.s3_client.upload_part(Bucket=self.s3_bucket, Key=self.s3_key, UploadId=self._upload_id,
+                                                  PartNumber=part_number, Body=data)
+            self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        finally:
+            self._in_flight.release()
+
+
+def bundle_s3_objects(s3_client, s3_bucket, s3_objects, base_prefix, dest_bucket, dest_key, part_size, max_workers,
+                      compression=zipfile.ZIP_STORED, overwrite=True):
+    """
+    Streams the S3 objects into a zip archive that is uploaded to s3://dest_bucket/dest_key while it is written.
+    Entries are named after the object keys relative to base_prefix. Returns the size of the archive.
+    Unless overwrite is True, an existing s3://dest_bucket/dest_key is kept and the upload fails with
+    PreconditionFailed.
+    """
+    writer = S3MultipartUploadWriter(s3_client, dest_bucket, dest_key, part_size, max_workers)
+    try:
+        with zipfile.ZipFile(writer, mode="w", compression=compression, allowZip64=True) as zip_file:
+            for s3_object in s3_objects:
+                body = s3_client.get_object(Bucket=s3_bucket, Key=s3_object["Key"])["Body"]
+                try:
+                    with zip_file.open(remove_prefix(s3_object["Key"], base_prefix), mode="w",
+                                       force_zip64=True) as entry:
+                        for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+                            entry.write(chunk)
+                finally:
+                    body.close()
+        writer.complete(overwrite=overwrite)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.bytes_written
@@ -11,5 +11,54 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import re
+
+
 def remove_prefix(s, prefix):
     return s[len(prefix):] if s.startswith(prefix) else s
+
+
+def compile_path_glob(pattern):
+    """
+    Compiles a glob pattern of "/" separated paths into a regular expression. * and ? do not match "/", and a ** path
+    segment matches any number of directories.
+    """
+    regex = ""
+    segments = pattern.split("/")
+    for i, segment in enumerate(segments):
+        if segment == "**":
+            regex += ".*" if i == len(segments) - 1 else "(?:[^/]*/)*"
+            continue
+        j = 0
+        while j < len(segment):
+            char = segment[j]
+            # As in fnmatch, a "]" right after "[" is part of the character set
+            set_end = segment.find("]", j + 2) if char == "[" else -1
+            if char == "*":
+                regex += "[^/]*"
+            elif char == "?":
+                regex += "[^/]"
+            elif set_end >= 0:
+                char_set = segment[j + 1:set_end].replace("\\", "\\\\")
+                regex += "[^" + char_set[1:] + "]" if char_set.startswith("!") else "[" + char_set + "]"
+                j = set_end
+            else:
+                regex += re.escape(char)
+            j += 1
+        if i < len(segments) - 1:
+            regex += "/"
+    return re.compile(regex + r"\Z")
+
+
+def join_multiline(value):
+    # Multiline strings can be stored as a list of lines in notebook files.
+    if isinstance(value, list) and all(isinstance(line, str) for line in value):
+        return "".join(value)
+    return value
+
+
+def format_size(num_bytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if num_bytes < 1024 or unit == "TB":
+            return "{:d} {}".format(num_bytes, unit) if unit == "B" else "{:.1f} {}".format(num_bytes, unit)
+        num_bytes /= 1024
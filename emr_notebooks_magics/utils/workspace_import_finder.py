@@ -0,0 +1,179 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+
+DEFAULT_IMPORT_CACHE_DIR = os.path.join("~", ".emr_notebooks_magics", "import_cache")
+ETAGS_FILE_NAME = ".etags.json"
+
+
+class _NamespaceLoader(importlib.abc.Loader):
+    """
+    Loader of directories without __init__.py, which are imported as namespace packages.
+    """
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        pass
+
+
+class WorkspaceModuleFinder(importlib.abc.MetaPathFinder):
+    """
+    Finds the Python modules and packages of a Workspace directory from a single S3 listing, instead of looking up
+    candidate paths on a FUSE mount for every import.
+    Module sources are downloaded into a local cache that is checked against the S3 ETags, and are compiled to
+    bytecode next to the cached sources, so that unchanged modules are imported from the local disk.
+    """
+
+    def __init__(self, s3_client, s3_bucket, s3_prefix, cache_dir=DEFAULT_IMPORT_CACHE_DIR):
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix if s3_prefix.endswith("/") else s3_prefix + "/"
+        prefix_hash = hashlib.sha256("{}/{}".format(s3_bucket, self.s3_prefix).encode("utf-8")).hexdigest()[:16]
+        self.cache_dir = os.path.join(os.path.expanduser(cache_dir), prefix_hash)
+        self._modules = {}
+        self._namespace_packages = set()
+        self._cached_etags = None
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Lists the Workspace directory and rebuilds the index of modules. Returns the number of modules found.
+        """
+        modules = {}
+        namespace_packages = set()
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=self.s3_prefix):
+            for s3_object in page.get("Contents", []):
+                relative_path = s3_object["Key"][len(self.s3_prefix):]
+                if not relative_path.endswith(".py"):
+                    continue
+                parts = relative_path[:-len(".py")].split("/")
+                if not all(part.isidentifier() for part in parts):
+                    continue
+                is_package = parts[-1] == "__init__"
+                if is_package:
+                    parts = parts[:-1]
+                    if not parts:
+                        continue
+                modules[".".join(parts)] = (relative_path, s3_object["ETag"], is_package)
+                for i in range(1, len(parts)):
+                    namespace_packages.add(".".join(parts[:i]))
+
+        with self._lock:
+            self._modules = modules
+            self._namespace_packages = namespace_packages - set(modules)
+        return len(modules)
+
+    def invalidate_caches(self):
+        # Called by importlib.invalidate_caches() from any code, so the listing is deferred to the next import
+        # instead of running it here.
+        self._stale = True
+
+    def install(self):
+        """
+        Adds the finder to sys.meta_path just before the path based finder, as a sys.path entry would be, so that
+        builtin and frozen modules cannot be shadowed by files of the Workspace.
+        """
+        for i, finder in enumerate(sys.meta_path):
+            if finder is importlib.machinery.PathFinder:
+                sys.meta_path.insert(i, self)
+                return
+        sys.meta_path.append(self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None and not any(entry.startswith(self.cache_dir) for entry in path):
+            # Submodules of packages that are not imported from the Workspace
+            return None
+        if self._stale:
+            self._refresh_index()
+
+        module = self._modules.get(fullname)
+        if module is None:
+            if fullname not in self._namespace_packages:
+                return None
+            # As on sys.path, a namespace package only applies when there is no regular package or module of the
+            # same name, e.g. an installed package.
+            path_spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+            if path_spec is not None and path_spec.loader is not None:
+                return None
+            spec = importlib.machinery.ModuleSpec(fullname, _NamespaceLoader(), is_package=True)
+            spec.submodule_search_locations = [os.path.join(self.cache_dir, *fullname.split("."))]
+            return spec
+
+        relative_path, etag, is_package = module
+        local_path = self._get_cached_source(relative_path, etag)
+        return importlib.util.spec_from_file_location(
+            fullname, local_path, loader=importlib.machinery.SourceFileLoader(fullname, local_path),
+            submodule_search_locations=[os.path.dirname(local_path)] if is_package else None)
+
+    def _refresh_index(self):
+        self._stale = False
+        try:
+            self.refresh()
+        except Exception:
+            # Keep importing from the previous index, it is refreshed again on the next invalidate_caches().
+            pass
+
+    def _get_cached_source(self, relative_path, etag):
+        local_path = os.path.join(self.cache_dir, relative_path)
+        with self._lock:
+            if self._cached_etags is None:
+                self._cached_etags = self._read_cached_etags()
+            if self._cached_etags.get(relative_path) == etag and os.path.exists(local_path):
+                return local_path
+
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=self.s3_prefix + relative_path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix=".import-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(response["Body"].read())
+            os.replace(tmp_path, local_path)
+            # The bytecode is validated with the source mtime in seconds and size, which may not change when a
+            # module is updated quickly, so the bytecode of a replaced source is always dropped.
+            try:
+                os.remove(importlib.util.cache_from_source(local_path))
+            except OSError:
+                pass
+
+            self._cached_etags[relative_path] = response["ETag"]
+            self._write_cached_etags()
+            return local_path
+
+    def _read_cached_etags(self):
+        try:
+            with open(os.path.join(self.cache_dir, ETAGS_FILE_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cached_etags(self):
+        etags_path = os.path.join(self.cache_dir, ETAGS_FILE_NAME)
+        with open(etags_path + ".tmp", "w") as f:
+            json.dump(self._cached_etags, f)
+        os.replace(etags_path + ".tmp", etags_path)
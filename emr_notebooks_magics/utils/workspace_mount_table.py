@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import re
+
+from .locked_json_file import LockedJSONFile
+
+DEFAULT_MOUNT_TABLE_PATH = os.path.join("~", ".emr_notebooks_magics", "workspace_mounts.json")
+MOUNTINFO_PATH = "/proc/self/mountinfo"
+
+_MOUNTINFO_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def read_mountinfo(path=MOUNTINFO_PATH):
+    """
+    Returns the file system type of every mount point of the process, read from /proc/self/mountinfo instead of
+    running findmnt.
+    """
+    mounts = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                # The optional fields end with a single "-", followed by the file system type.
+                separator = fields.index("-", 6)
+                mount_point = _MOUNTINFO_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[4])
+                mounts[mount_point] = fields[separator + 1]
+    except (OSError, ValueError, IndexError):
+        pass
+    return mounts
+
+
+class WorkspaceMount:
+    """
+    A Workspace directory mounted or synced to a local directory.
+    """
+
+    def __init__(self, ws_path, mount_dir, fuse_type, params=None, profile=None, writable=False):
+        self.ws_path = ws_path
+        self.mount_dir = mount_dir
+        self.fuse_type = fuse_type
+        self.params = params
+        self.profile = profile
+        self.writable = writable
+
+    def to_dict(self):
+        return {"ws_path": self.ws_path, "mount_dir": self.mount_dir, "fuse_type": self.fuse_type,
+                "params": self.params, "profile": self.profile, "writable": self.writable}
+
+    @classmethod
+    def from_dict(cls, value):
+        return cls(value["ws_path"], value["mount_dir"], value["fuse_type"], value.get("params"), value.get("profile"),
+                   value.get("writable", False))
+
+    def __repr__(self):
+        return "WorkspaceMount(ws_path={}, mount_dir={}, fuse_type={})".format(
+            self.ws_path, self.mount_dir, self.fuse_type)
+
+
+class WorkspaceMountTable:
+    """
+    Keeps track of which Workspace directory is mounted where. FUSE mounts are shared by all kernels on the instance,
+    so the table is kept in a LockedJSONFile. Entries of FUSE mounts that are no longer in /proc/self/mountinfo,
+    e.g. after a reboot or a manual fusermount, are dropped when the table is read.
+    """
+
+    def __init__(self, path=DEFAULT_MOUNT_TABLE_PATH, mountinfo_path=MOUNTINFO_PATH):
+        self._file = LockedJSONFile(path)
+        self.path = self._file.path
+        self.mountinfo_path = mountinfo_path
+
+    def get_fs_type(self, mount_dir):
+        return read_mountinfo(self.mountinfo_path).get(os.path.normpath(mount_dir))
+
+    def is_fuse_mounted(self, mount_dir):
+        fs_type = self.get_fs_type(mount_dir)
+        return fs_type is not None and fs_type.startswith("fuse")
+
+    def list(self):
+        with self._file.locked():
+            return self._read_current()
+
+    def find(self, ws_path):
+        return next((mount for mount in self.list() if mount.ws_path == ws_path), None)
+
+    def get(self, mount_dir):
+        return next((mount for mount in self.list() if mount.mount_dir == mount_dir), None)
+
+    def add(self, mount):
+        with self._file.locked():
+            mounts = [current for current in self._read_current() if current.mount_dir != mount.mount_dir]
+            self._write(mounts + [mount])
+
+    def remove(self, mount_dir):
+        with self._file.locked():
+            self._write([mount for mount in self._read_current() if mount.mount_dir != mount_dir])
+
+    def _read_current(self):
+        mounts = self._read()
+        mountinfo = read_mountinfo(self.mountinfo_path)
+        current = [mount for mount in mounts if self._is_current(mount, mountinfo)]
+        if len(current) != len(mounts):
+            self._write(current)
+        return current
+
+    def _is_current(self, mount, mountinfo):
+        if mount.fuse_type == "sync":
+            return os.path.isdir(mount.mount_dir)
+        return mountinfo.get(mount.mount_dir, "").startswith("fuse")
+
+    def _read(self):
+        try:
+            return [WorkspaceMount.from_dict(value) for value in self._file.read([])]
+        except (KeyError, TypeError):
+            return []
+
+    def _write(self, mounts):
+        self._file.write([mount.to_dict() for mount in mounts])
@@ -0,0 +1,413 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+SYNC_MANIFEST_SUFFIX = ".sync-manifest.json"
+READ_CHUNK_SIZE = 1024 * 1024
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+WRITE_BACK_SCAN_SECS = 1.0
+WRITE_BACK_MAX_DELAY_SECS = 30.0
+# Local files and directories that are never written back to the Workspace
+WRITE_BACK_EXCLUDED_DIRS = ("__pycache__", ".ipynb_checkpoints")
+TMP_FILE_PREFIX = ".sync-"
+CONFLICT_ERROR_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+
+class SyncResult:
+    def __init__(self, listed, downloaded, downloaded_bytes, deleted):
+        self.listed = listed
+        self.downloaded = downloaded
+        self.downloaded_bytes = downloaded_bytes
+        self.deleted = deleted
+
+
+class WriteBackResult:
+    def __init__(self, uploaded, uploaded_bytes, conflicts):
+        self.uploaded = uploaded
+        self.uploaded_bytes = uploaded_bytes
+        self.conflicts = conflicts
+
+
+class WorkspaceSync:
+    """
+    Mirrors a S3 prefix into a local directory.
+    The ETags of the synced objects are kept in a manifest next to the directory, so that a sync only downloads the
+    objects that have changed since the previous one. Local files that were not synced from S3 are never deleted.
+
+    When the directory is not read only, the files changed locally are written back to S3 by flush. The manifest also
+    keeps the modification time and size of the synced files to find the local changes, and the uploads are
+    conditional on the ETag of the last synced version, so that changes made to the Workspace in the meantime are
+    reported as conflicts instead of being overwritten. Deleting local files is not written back.
+    """
+
+    def __init__(self, s3_client, s3_bucket, s3_prefix, local_dir, max_workers=16, read_only=True):
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix if s3_prefix.endswith("/") else s3_prefix + "/"
+        self.local_dir = local_dir
+        self.max_workers = max_workers
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_refresh = threading.Event()
+        self._write_back_thread = None
+        self._stop_write_back = threading.Event()
+        self._conflicts = {}
+        self._synced = False
+        self.last_error = None
+        self.last_write_back = None
+
+    @property
+    def manifest_path(self):
+        return self.local_dir.rstrip("/") + SYNC_MANIFEST_SUFFIX
+
+    @property
+    def conflicts(self):
+        return sorted(self._conflicts)
+
+    def sync(self):
+        with self._lock:
+            synced_etags, local_stats = self._read_manifest()
+            s3_objects = {}
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.s3_bucket, Prefix=self.s3_prefix):
+                for s3_object in page.get("Contents", []):
+                    if not s3_object["Key"].endswith("/"):
+                        s3_objects[s3_object["Key"][len(self.s3_prefix):]] = s3_object
+
+            changed = [relative_path for relative_path, s3_object in s3_objects.items()
+                       if synced_etags.get(relative_path) != s3_object["ETag"]
+                       or not os.path.exists(os.path.join(self.local_dir, relative_path))]
+            deleted = [relative_path for relative_path in synced_etags if relative_path not in s3_objects]
+
+            if not self.read_only:
+                # Local changes that are not written back yet are kept, and reported as conflicts
+                for relative_path in changed + deleted:
+                    stat = self._get_local_stat(relative_path)
+                    if stat is not None and stat != local_stats.get(relative_path):
+                        self._conflicts[relative_path] = stat
+                changed = [relative_path for relative_path in changed if relative_path not in self._conflicts]
+                deleted = [relative_path for relative_path in deleted if relative_path not in self._conflicts]
+
+            os.makedirs(self.local_dir, exist_ok=True)
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    for relative_path, etag in zip(changed, pool.map(self._download, changed)):
+                        synced_etags[relative_path] = etag
+                        local_stats[relative_path] = self._get_local_stat(relative_path)
+            finally:
+                for relative_path in deleted:
+                    try:
+                        os.remove(os.path.join(self.local_dir, relative_path))
+                    except FileNotFoundError:
+                        pass
+                    synced_etags.pop(relative_path, None)
+                    local_stats.pop(relative_path, None)
+                self._write_manifest(synced_etags, local_stats)
+
+            if not self.read_only and not self._synced:
+                # The files may have been synced read only before
+                for relative_path in synced_etags:
+                    local_path = os.path.join(self.local_dir, relative_path)
+                    if os.path.exists(local_path) and not os.access(local_path, os.W_OK):
+                        os.chmod(local_path, 0o644)
+            self._synced = True
+
+            return SyncResult(len(s3_objects), len(changed), sum(s3_objects[path]["Size"] for path in changed),
+                              len(deleted))
+
+    def start_refresh(self, interval_secs, on_error=None):
+        """
+        Syncs every interval_secs seconds in a background thread, until stop_refresh is called.
+        """
+        self.stop_refresh()
+        self._stop_refresh = threading.Event()
+
+        def refresh(stop_refresh):
+            while not stop_refresh.wait(interval_secs):
+                try:
+                    self.sync()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    if on_error is not None:
+                        on_error(e)
+
+        self._refresh_thread = threading.Thread(target=refresh, args=(self._stop_refresh,),
+                                                name="emr-workspace-sync", daemon=True)
+        self._refresh_thread.start()
+
+    def stop_refresh(self):
+        if self._refresh_thread is not None:
+            self._stop_refresh.set()
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def is_refreshing(self):
+        return self._refresh_thread is not None
+
+    def flush(self):
+        """
+        Uploads the files that have changed locally since they were synced or uploaded.
+        """
+        if self.read_only:
+            raise ValueError("The Workspace directory is synced read only")
+
+        with self._lock:
+            synced_etags, local_stats = self._read_manifest()
+            changed = {relative_path: stat for relative_path, stat in self._scan_local_changes(local_stats).items()
+                       if self._conflicts.get(relative_path) != stat}
+            uploaded, uploaded_bytes = 0, 0
+            # The first error that is not a conflict. The uploads that have already succeeded are still recorded
+            # and the multipart uploads that have not been completed are aborted before it is raised.
+            error = None
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    # Small files are uploaded in one request, the parts of large files are uploaded concurrently
+                    # on the same pool and completed once all of them are uploaded.
+                    pending = []
+                    try:
+                        for relative_path, stat in changed.items():
+                            condition = self._get_upload_condition(synced_etags.get(relative_path))
+                            if stat[1] >= MULTIPART_THRESHOLD:
+                                pending.append((relative_path, stat, self._start_multipart_upload(
+                                    pool, relative_path, stat[1], condition)))
+                            else:
+                                pending.append((relative_path, stat,
+                                                pool.submit(self._upload, relative_path, condition)))
+                    except Exception as e:
+                        error = e
+
+                    for relative_path, stat, upload in pending:
+                        if error is not None and isinstance(upload, _MultipartUpload):
+                            upload.abort()
+                            continue
+                        try:
+                            etag = upload.result()
+                        except Exception as e:
+                            if not self._is_conflict(e):
+                                error = error or e
+                                continue
+                            self._conflicts[relative_path] = stat
+                            continue
+                        self._conflicts.pop(relative_path, None)
+                        synced_etags[relative_path] = etag
+                        uploaded += 1
+                        uploaded_bytes += stat[1]
+                        # A file modified during its upload is uploaded again by the next flush
+                        if self._get_local_stat(relative_path) == stat:
+                            local_stats[relative_path] = stat
+            finally:
+                self._write_manifest(synced_etags, local_stats)
+            if error is not None:
+                raise error
+
+            self.last_write_back = WriteBackResult(uploaded, uploaded_bytes, self.conflicts)
+            return self.last_write_back
+
+    def start_write_back(self, delay_secs, on_error=None):
+        """
+        Flushes the local changes in a background thread, once no file has changed for delay_secs seconds, or at
+        most WRITE_BACK_MAX_DELAY_SECS seconds after the first change, so that files written in quick succession
+        are uploaded in one batch.
+        """
+        self.stop_write_back(flush=False)
+        self._stop_write_back = threading.Event()
+        scan_secs = min(WRITE_BACK_SCAN_SECS, max(delay_secs, 0.1))
+
+        def write_back(stop_write_back):
+            pending, changed_at, first_changed_at = None, None, None
+            while not stop_write_back.wait(scan_secs):
+                try:
+                    changes = {relative_path: stat for relative_path, stat
+                               in self._scan_local_changes(self._read_manifest()[1]).items()
+                               if self._conflicts.get(relative_path) != stat}
+                    if not changes:
+                        pending, first_changed_at = None, None
+                        continue
+                    now = time.monotonic()
+                    if changes != pending:
+                        pending, changed_at = changes, now
+                        first_changed_at = first_changed_at or now
+                    if now - changed_at >= delay_secs or now - first_changed_at >= WRITE_BACK_MAX_DELAY_SECS:
+                        self.flush()
+                        pending, first_changed_at = None, None
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = e
+                    if on_error is not None:
+                        on_error(e)
+
+        self._write_back_thread = threading.Thread(target=write_back, args=(self._stop_write_back,),
+                                                   name="emr-workspace-write-back", daemon=True)
+        self._write_back_thread.start()
+
+    def stop_write_back(self, flush=True):
+        """
+        Stops writing back the local changes in the background, and flushes the remaining ones.
+        """
+        if self._write_back_thread is not None:
+            self._stop_write_back.set()
+            self._write_back_thread.join()
+            self._write_back_thread = None
+        if flush and not self.read_only:
+            return self.flush()
+        return None
+
+    def is_writing_back(self):
+        return self._write_back_thread is not None
+
+    def _scan_local_changes(self, local_stats):
+        changes = {}
+        pending = [self.local_dir]
+        while pending:
+            try:
+                entries = list(os.scandir(pending.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in WRITE_BACK_EXCLUDED_DIRS:
+                        pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and not entry.name.startswith(TMP_FILE_PREFIX):
+                    relative_path = os.path.relpath(entry.path, self.local_dir).replace(os.sep, "/")
+                    stat = entry.stat(follow_symlinks=False)
+                    stat = [stat.st_mtime_ns, stat.st_size]
+                    if stat != local_stats.get(relative_path):
+                        changes[relative_path] = stat
+        return changes
+
+    def _get_local_stat(self, relative_path):
+        try:
+            stat = os.stat(os.path.join(self.local_dir, relative_path))
+        except FileNotFoundError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _get_upload_condition(self, synced_etag):
+        # Overwrite only the version that was synced, and never overwrite an object created in the meantime.
+        return {"IfMatch": synced_etag} if synced_etag is not None else {"IfNoneMatch": "*"}
+
+    def _upload(self, relative_path, condition):
+        with open(os.path.join(self.local_dir, relative_path), "rb") as f:
+            body = f.read()
+        response = self.s3_client.put_object(Bucket=self.s3_bucket, Key=self.s3_prefix + relative_path, Body=body,
+                                             **condition)
+        return response["ETag"]
+
+    def _start_multipart_upload(self, pool, relative_path, size, condition):
+        key = self.s3_prefix + relative_path
+        upload_id = self.s3_client.create_multipart_upload(Bucket=self.s3_bucket, Key=key)["UploadId"]
+        try:
+            parts = [pool.submit(self._upload_part, relative_path, upload_id, part_number, offset)
+                     for part_number, offset in enumerate(range(0, size, MULTIPART_PART_SIZE), start=1)]
+        except BaseException:
+            self.s3_client.abort_multipart_upload(Bucket=self.s3_bucket, Key=key, UploadId=upload_id)
+            raise
+        return _MultipartUpload(self.s3_client, self.s3_bucket, key, upload_id, parts, condition)
+
+    def _upload_part(self, relative_path, upload_id, part_number, offset):
+        with open(os.path.join(self.local_dir, relative_path), "rb") as f:
+            f.seek(offset)
+            body = f.read(MULTIPART_PART_SIZE)
+        response = self.s3_client.upload_part(Bucket=self.s3_bucket, Key=self.s3_prefix + relative_path,
+                                              PartNumber=part_number, UploadId=upload_id, Body=body)
+        return response["ETag"]
+
+    def _is_conflict(self, error):
+        response = getattr(error, "response", None) or {}
+        return response.get("Error", {}).get("Code") in CONFLICT_ERROR_CODES
+
+    def _download(self, relative_path):
+        local_path = os.path.join(self.local_dir, relative_path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=self.s3_prefix + relative_path)
+
+        # Write to a temporary file first, so that readers never see a partially written file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix=TMP_FILE_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response["Body"].iter_chunks(READ_CHUNK_SIZE):
+                    f.write(chunk)
+            os.chmod(tmp_path, 0o444 if self.read_only else 0o644)
+            os.replace(tmp_path, local_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return response["ETag"]
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        if manifest.get("s3_bucket") != self.s3_bucket or manifest.get("s3_prefix") != self.s3_prefix:
+            return {}, {}
+        return manifest.get("objects", {}), manifest.get("local_stats", {})
+
+    def _write_manifest(self, synced_etags, local_stats):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"s3_bucket": self.s3_bucket, "s3_prefix": self.s3_prefix, "objects": synced_etags,
+                       "local_stats": local_stats}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class _MultipartUpload:
+    """
+    Multipart upload of a file whose parts are being uploaded on a pool. It is either completed with result() once
+    all parts are uploaded, or aborted.
+    """
+
+    def __init__(self, s3_client, s3_bucket, key, upload_id, parts, condition):
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.key = key
+        self.upload_id = upload_id
+        self.parts = parts
+        self.condition = condition
+
+    def result(self):
+        """
+        Completes the upload and returns the ETag of the object. The upload is aborted if it cannot be completed.
+        """
+        try:
+            etags = [part.result() for part in self.parts]
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.s3_bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={"Parts": [{"PartNumber": part_number, "ETag": etag}
+                                           for part_number, etag in enumerate(etags, start=1)]},
+                **self.condition)
+        except BaseException:
+            self.abort()
+            raise
+        return response["ETag"]
+
+    def abort(self):
+        for part in self.parts:
+            part.cancel()
+        # A part that is still being uploaded when the upload is aborted may be stored anyway.
+        wait(self.parts)
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.s3_bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception:
+            # Incomplete multipart uploads are also removed by the lifecycle rules of the bucket, if any.
+            pass
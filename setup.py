@@ -12,6 +12,7 @@ setup(
     packages=["emr_notebooks_magics", "emr_notebooks_magics.utils"],
     install_requires=[
           'boto3',
+          'requests',
     ],
     author_email='emrnotebooks@amazon.com',
     scripts=['startup_script/001-setup-emr-notebook-magics.py'],
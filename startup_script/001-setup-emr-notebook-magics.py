@@ -11,15 +11,16 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import os
+
+
 def load_ipython_extension(ipython):
     try:
-        from emr_notebooks_magics import MountWorkspaceDirMagics, S3DownloadMagics, ExecuteNotebookMagics
-        mount_ws_dir_magics = MountWorkspaceDirMagics(ipython)
-        download_S3_magics = S3DownloadMagics(ipython)
-        execute_notebook_magics = ExecuteNotebookMagics(ipython)
-        ipython.register_magics(mount_ws_dir_magics)
-        ipython.register_magics(download_S3_magics)
-        ipython.register_magics(execute_notebook_magics)
+        import emr_notebooks_magics
+        # Magics are registered lazily by default, so that boto3 and IMDS lookups are only paid for
+        # the first time a magic is used. Set EMR_NOTEBOOKS_MAGICS_LAZY_LOAD=false to register eagerly.
+        lazy = os.environ.get("EMR_NOTEBOOKS_MAGICS_LAZY_LOAD", "true").lower() != "false"
+        emr_notebooks_magics.load_ipython_extension(ipython, lazy=lazy)
     except ImportError:
         pass
 
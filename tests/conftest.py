@@ -0,0 +1,101 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import itertools
+import threading
+
+import pytest
+
+from emr_notebooks_magics import execute_emr_notebook
+from emr_notebooks_magics.utils import notebook_execution_tracker
+
+WORKSPACE_ID = "e-TEST"
+WORKSPACE_BUCKET = "workspace-bucket"
+
+
+class FakeEMRClient:
+    """
+    EMR client whose notebook executions go through the given statuses, one per DescribeNotebookExecution call.
+    Entries of statuses that are exceptions are raised instead.
+    """
+
+    def __init__(self, statuses=("STARTING", "RUNNING", "FINISHED")):
+        self.statuses = list(statuses)
+        self.started = []
+        self.described = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._status_iterators = {}
+
+    def start_notebook_execution(self, **request):
+        with self._lock:
+            execution_id = "ex-{:05d}".format(next(self._ids))
+            self.started.append(request)
+            self._status_iterators[execution_id] = iter(self.statuses)
+        return {"NotebookExecutionId": execution_id}
+
+    def describe_notebook_execution(self, NotebookExecutionId):
+        with self._lock:
+            self.described.append(NotebookExecutionId)
+            status = next(self._status_iterators[NotebookExecutionId], self.statuses[-1])
+        if isinstance(status, Exception):
+            raise status
+        return {"NotebookExecution": {
+            "NotebookExecutionId": NotebookExecutionId,
+            "Status": status,
+            "OutputNotebookURI": "s3://{}/{}/executions/{}/output.ipynb".format(
+                WORKSPACE_BUCKET, WORKSPACE_ID, NotebookExecutionId),
+        }}
+
+
+class FakeS3Client:
+
+    def head_object(self, Bucket, Key):
+        return {"ETag": '"etag-of-{}"'.format(Key)}
+
+
+@pytest.fixture
+def workspace_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("KERNEL_WORKSPACE_ID", WORKSPACE_ID)
+    monkeypatch.setenv("KERNEL_WORKSPACE_DIR_S3_BUCKET", WORKSPACE_BUCKET)
+    monkeypatch.setenv("KERNEL_WORKSPACE_DIR_S3_LOCATION", WORKSPACE_ID + "/")
+    monkeypatch.setenv("KERNEL_WORKSPACE_DIR_S3_PREFIX", "s3://{}/{}/".format(WORKSPACE_BUCKET, WORKSPACE_ID))
+
+
+@pytest.fixture
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(notebook_execution_tracker, "STARTING_POLL_INTERVAL_SECS", 0.01)
+    monkeypatch.setattr(notebook_execution_tracker, "RUNNING_MIN_POLL_INTERVAL_SECS", 0.01)
+    monkeypatch.setattr(notebook_execution_tracker, "RUNNING_MAX_POLL_INTERVAL_SECS", 0.05)
+
+
+@pytest.fixture
+def displayed(monkeypatch):
+    """
+    The HTML displayed by the notebook execution magics, in display order.
+    """
+    texts = []
+    monkeypatch.setattr(execute_emr_notebook, "display_html", lambda text, display_id=None: texts.append(text))
+    monkeypatch.setattr(execute_emr_notebook, "update_display_html", lambda text, display_id: texts.append(text))
+    return texts
+
+
+@pytest.fixture
+def notebook_magics(workspace_env, fast_polling, displayed):
+    from IPython.core.interactiveshell import InteractiveShell
+
+    magics = execute_emr_notebook.ExecuteNotebookMagics(InteractiveShell.instance())
+    magics._emr = FakeEMRClient()
+    magics._s3 = FakeS3Client()
+    return magics
@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+import pytest
+
+from emr_notebooks_magics import generate_s3_presigned_url
+
+KEYS = ["data/2023-01/part.csv", "data/2023-02/part.csv", "data/2023-02/other.csv", "data/part.csv"]
+
+
+class FakeS3Client:
+
+    def get_paginator(self, operation_name):
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": key, "Size": 10, "ETag": '"etag"'} for key in KEYS if key.startswith(Prefix)]}
+        return Paginator()
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    downloads = []
+
+    class FakeDownloader:
+        def __init__(self, s3_client, max_workers, on_progress=None):
+            pass
+
+        def download(self, batch):
+            downloads.extend(batch)
+
+    monkeypatch.setattr(generate_s3_presigned_url, "S3ParallelDownloader", FakeDownloader)
+    monkeypatch.setattr(generate_s3_presigned_url, "display_html", lambda text, display_id=None: None)
+    return downloads
+
+
+@pytest.fixture
+def download_magics(monkeypatch):
+    from IPython.core.interactiveshell import InteractiveShell
+
+    magics = generate_s3_presigned_url.S3DownloadMagics(InteractiveShell.instance())
+    magics._s3_client = FakeS3Client()
+    monkeypatch.setattr(magics, "_get_transfer_client", lambda max_workers: None)
+    return magics
+
+
+def test_glob_in_a_directory_part(download_magics, downloads, tmp_path):
+    download_magics.download_s3("s3://bucket/data/*/part.csv --dest {}/".format(tmp_path))
+
+    assert sorted(download.local_path for download in downloads) == [
+        os.path.join(str(tmp_path), "2023-01", "part.csv"), os.path.join(str(tmp_path), "2023-02", "part.csv")]
+
+
+def test_glob_in_the_file_name(download_magics, downloads, tmp_path):
+    download_magics.download_s3("s3://bucket/data/2023-02/*.csv --dest {}/".format(tmp_path))
+
+    assert sorted(download.local_path for download in downloads) == [
+        os.path.join(str(tmp_path), "other.csv"), os.path.join(str(tmp_path), "part.csv")]
+
+
+@pytest.mark.parametrize("key_pattern, base_prefix", [
+    ("data/", "data/"), ("data/*/part.csv", "data/"), ("data/2023-0?/part.csv", "data/"),
+    ("data/2023-*", "data/"), ("da*/part.csv", ""), ("data/2023-02/part.csv", "data/2023-02/"),
+])
+def test_base_prefix(download_magics, key_pattern, base_prefix):
+    assert download_magics._get_base_prefix(key_pattern) == base_prefix
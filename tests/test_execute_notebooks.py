@@ -0,0 +1,67 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+
+@pytest.fixture
+def batches(notebook_magics, monkeypatch):
+    batches = []
+    monkeypatch.setattr(notebook_magics, "_run_batch", lambda tasks, *args, **kwargs: batches.append(tasks))
+    return batches
+
+
+@pytest.mark.parametrize("depends_on", ["report.ipynb:extract.ipynb", "./report.ipynb:./extract.ipynb",
+                                        "report.ipynb:./extract.ipynb", "./report.ipynb:extract.ipynb"])
+def test_depends_on_paths_are_normalized(notebook_magics, batches, depends_on):
+    notebook_magics.execute_notebooks("./extract.ipynb report.ipynb --cluster-id j-TEST --depends-on " + depends_on)
+
+    [tasks] = batches
+    assert [(task.notebook, task.dependencies) for task in tasks] == \
+        [("extract.ipynb", []), ("report.ipynb", ["extract.ipynb"])]
+
+
+class ListingS3Client:
+
+    def __init__(self, keys):
+        self.keys = keys
+
+    def get_paginator(self, operation_name):
+        keys = self.keys
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": Prefix + key} for key in keys]}
+        return Paginator()
+
+
+WORKSPACE_NOTEBOOKS = ["main.ipynb", "reports/daily.ipynb", "reports/weekly.ipynb", "reports/old/daily.ipynb",
+                       "executions/ex-00001/main.ipynb", "executions/ex-00002/reports/daily.ipynb"]
+
+
+@pytest.mark.parametrize("pattern, notebooks", [
+    ("*.ipynb", ["main.ipynb"]),
+    ("reports/*.ipynb", ["reports/daily.ipynb", "reports/weekly.ipynb"]),
+    ("reports/**/*.ipynb", ["reports/daily.ipynb", "reports/old/daily.ipynb", "reports/weekly.ipynb"]),
+    ("**/daily.ipynb", ["reports/daily.ipynb", "reports/old/daily.ipynb"]),
+    ("reports/[dw]*.ipynb", ["reports/daily.ipynb", "reports/weekly.ipynb"]),
+    ("reports/?????.ipynb", ["reports/daily.ipynb"]),
+    ("executions/*/main.ipynb", ["executions/ex-00001/main.ipynb"]),
+])
+def test_glob_patterns_match_path_segments(notebook_magics, batches, pattern, notebooks):
+    notebook_magics._s3 = ListingS3Client(WORKSPACE_NOTEBOOKS)
+
+    notebook_magics.execute_notebooks(pattern + " --cluster-id j-TEST")
+
+    [tasks] = batches
+    assert [task.notebook for task in tasks] == notebooks
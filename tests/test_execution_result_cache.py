@@ -0,0 +1,36 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+def test_immediate_rerun_hits_the_cache(notebook_magics, displayed):
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST --cache")
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST --cache")
+
+    assert len(notebook_magics.emr.started) == 1
+    assert any("reusing its output" in text for text in displayed)
+
+
+def test_rerun_with_other_params_is_not_cached(notebook_magics):
+    notebook_magics.execute_notebook("""notebook.ipynb --cluster-id j-TEST --cache --params '{"day": 1}'""")
+    notebook_magics.execute_notebook("""notebook.ipynb --cluster-id j-TEST --cache --params '{"day": 2}'""")
+
+    assert len(notebook_magics.emr.started) == 2
+
+
+def test_failed_execution_is_not_cached(notebook_magics):
+    notebook_magics._emr.statuses = ["STARTING", "RUNNING", "FAILED"]
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST --cache")
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST --cache")
+
+    assert len(notebook_magics.emr.started) == 2
@@ -0,0 +1,35 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+from emr_notebooks_magics.utils.locked_json_file import LockedJSONFile
+
+
+def test_missing_or_invalid_file_reads_as_default(tmp_path):
+    json_file = LockedJSONFile(str(tmp_path / "store" / "data.json"))
+    assert json_file.read({}) == {}
+
+    os.makedirs(str(tmp_path / "store"))
+    (tmp_path / "store" / "data.json").write_text("{not json")
+    assert json_file.read([]) == []
+
+
+def test_lock_is_reentrant_and_write_is_atomic(tmp_path):
+    json_file = LockedJSONFile(str(tmp_path / "store" / "data.json"))
+    with json_file.locked():
+        with json_file.locked():
+            json_file.write({"key": "value"})
+
+    assert json_file.read() == {"key": "value"}
+    assert sorted(os.listdir(str(tmp_path / "store"))) == ["data.json", "data.json.lock"]
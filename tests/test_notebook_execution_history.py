@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from datetime import datetime, timezone
+
+from emr_notebooks_magics.utils.notebook_execution_history import NotebookExecutionHistory
+
+SUMMARY = {
+    "NotebookExecutionId": "ex-OTHERKERNEL",
+    "EditorId": "e-TEST",
+    "NotebookExecutionName": "report.ipynb",
+    "Status": "FINISHED",
+    "StartTime": datetime(2023, 1, 31, 8, 0, tzinfo=timezone.utc),
+    "EndTime": datetime(2023, 1, 31, 8, 5, tzinfo=timezone.utc),
+    "ExecutionEngineId": "j-OTHERCLUSTER",
+}
+
+
+def _describe_unexpectedly(execution_id):
+    raise AssertionError("{} should not be described".format(execution_id))
+
+
+def test_summary_keeps_the_execution_engine(tmp_path):
+    history = NotebookExecutionHistory("e-TEST", lambda from_time: [SUMMARY], _describe_unexpectedly,
+                                       path=str(tmp_path / "history.json"))
+    history.refresh()
+
+    [entry] = history.list()
+    assert entry["ExecutionEngineId"] == "j-OTHERCLUSTER"
+    assert "HasDetails" not in entry
+
+
+def test_listing_without_details_shows_the_cluster(notebook_magics, displayed, monkeypatch):
+    monkeypatch.setattr(notebook_magics, "_list_notebook_executions", lambda from_time=None: [SUMMARY])
+    monkeypatch.setattr(notebook_magics, "_describe_notebook_execution", _describe_unexpectedly)
+
+    notebook_magics.list_notebook_executions("")
+
+    assert "<td>j-OTHERCLUSTER</td>" in displayed[-1]
+
+
+class ListingEMRClient:
+
+    def __init__(self):
+        self.requests = []
+
+    def get_paginator(self, operation_name):
+        requests = self.requests
+
+        class Paginator:
+            def paginate(self, **request):
+                requests.append(request)
+                yield {"NotebookExecutions": [SUMMARY]}
+        return Paginator()
+
+
+def test_full_refresh_lists_executions_older_than_30_days(notebook_magics, displayed):
+    notebook_magics._emr = ListingEMRClient()
+
+    notebook_magics.list_notebook_executions("--since 2023-01-01")
+    notebook_magics.list_notebook_executions("--full-refresh")
+
+    assert [request["From"] for request in notebook_magics.emr.requests] == \
+        [datetime(1970, 1, 1, tzinfo=timezone.utc)] * 2
+    assert all(request["EditorId"] == "e-TEST" for request in notebook_magics.emr.requests)
+    assert "ex-OTHERKERNEL" in displayed[0]
@@ -0,0 +1,115 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+import botocore.exceptions
+
+from emr_notebooks_magics import execute_emr_notebook
+from emr_notebooks_magics.utils.notebook_execution_tracker import NotebookExecution, NotebookExecutionTracker
+
+from .conftest import FakeEMRClient
+
+
+def _client_error(code, status_code):
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status_code}},
+        "DescribeNotebookExecution")
+
+
+def _track(emr, on_update=None):
+    tracker = NotebookExecutionTracker(
+        lambda execution_id: emr.describe_notebook_execution(NotebookExecutionId=execution_id)["NotebookExecution"])
+    execution_id = emr.start_notebook_execution()["NotebookExecutionId"]
+    return tracker.track(NotebookExecution(execution_id, "notebook.ipynb", "j-TEST", 60, on_update=on_update))
+
+
+def test_execute_notebook_displays_final_status_before_returning(notebook_magics, monkeypatch):
+    displayed = []
+
+    def slow_display_html(text, display_id=None):
+        # Displaying from the poller thread takes a while, as it does in a kernel
+        time.sleep(0.05)
+        displayed.append(text)
+
+    monkeypatch.setattr(execute_emr_notebook, "display_html", slow_display_html)
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST")
+
+    assert any(text.startswith("Execution completed. Status: FINISHED") for text in displayed)
+
+
+def test_final_update_runs_before_waiters_are_woken_up(fast_polling):
+    updates_before_done = []
+
+    def on_update(execution):
+        if execution.is_done():
+            updates_before_done.append(execution.wait(0))
+
+    execution = _track(FakeEMRClient(), on_update)
+
+    assert execution.wait(5)
+    assert updates_before_done == [False]
+
+
+def test_transient_errors_are_retried(fast_polling):
+    emr = FakeEMRClient(["STARTING", _client_error("ThrottlingException", 400),
+                         botocore.exceptions.EndpointConnectionError(endpoint_url="https://emr"),
+                         _client_error("InternalServerError", 500), "RUNNING", "FINISHED"])
+    execution = _track(emr)
+
+    assert execution.wait(5)
+    assert execution.error is None
+    assert execution.status == "FINISHED"
+
+
+def test_non_retryable_error_finishes_the_execution(fast_polling):
+    emr = FakeEMRClient(["STARTING", _client_error("AccessDeniedException", 400), "FINISHED"])
+    execution = _track(emr)
+
+    assert execution.wait(5)
+    assert execution.error is not None
+    assert len(emr.described) == 2
+
+
+def test_execution_fails_after_consecutive_transient_errors(fast_polling):
+    emr = FakeEMRClient(["STARTING"] + [_client_error("ThrottlingException", 400)] * 10)
+    execution = _track(emr)
+
+    assert execution.wait(5)
+    assert execution.error is not None
+    assert len(emr.described) == 6
+
+
+def test_interrupted_execution_only_updates_its_status_line(notebook_magics, monkeypatch):
+    displayed, updated = [], []
+    monkeypatch.setattr(execute_emr_notebook, "display_html",
+                        lambda text, display_id=None: displayed.append((text, display_id)))
+    monkeypatch.setattr(execute_emr_notebook, "update_display_html",
+                        lambda text, display_id: updated.append((text, display_id)))
+
+    def interrupted_wait(execution, timeout=None):
+        raise KeyboardInterrupt()
+
+    wait = NotebookExecution.wait
+    monkeypatch.setattr(NotebookExecution, "wait", interrupted_wait)
+    notebook_magics.execute_notebook("notebook.ipynb --cluster-id j-TEST")
+    displayed_by_magic = list(displayed)
+    [execution] = notebook_magics.tracker.list()
+    monkeypatch.setattr(NotebookExecution, "wait", wait)
+
+    assert execution.wait(5)
+    display_id = "emr-notebook-execution-{}".format(execution.execution_id)
+    assert displayed == displayed_by_magic
+    assert displayed[-1][1] == display_id
+    assert updated[-1] == (notebook_magics._get_execution_status_text(execution), display_id)
+    assert "completed. Status: FINISHED" in updated[-1][0]
@@ -0,0 +1,40 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from emr_notebooks_magics.utils import s3_parallel_download
+from emr_notebooks_magics.utils.s3_parallel_download import S3ObjectDownload, S3ParallelDownloader
+
+
+class Python37ThreadPoolExecutor(ThreadPoolExecutor):
+
+    def shutdown(self, wait=True):
+        super(Python37ThreadPoolExecutor, self).shutdown(wait=wait)
+
+
+class FailingS3Client:
+
+    def get_object(self, **request):
+        raise ConnectionResetError("connection reset")
+
+
+def test_download_errors_are_raised_without_cancel_futures(tmp_path, monkeypatch):
+    monkeypatch.setattr(s3_parallel_download, "ThreadPoolExecutor", Python37ThreadPoolExecutor)
+    downloads = [S3ObjectDownload("bucket", "data/part-{}.csv".format(i), 1024, '"etag"',
+                                  str(tmp_path / "part-{}.csv".format(i)), 256) for i in range(4)]
+
+    with pytest.raises(ConnectionResetError):
+        S3ParallelDownloader(FailingS3Client(), 2).download(downloads)
@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import io
+import threading
+
+import botocore.exceptions
+import botocore.response
+import pytest
+from IPython.core.error import UsageError
+
+from emr_notebooks_magics import generate_s3_presigned_url
+from emr_notebooks_magics.utils.s3_zip_bundle import S3MultipartUploadWriter
+
+
+class FakeS3Client:
+
+    def __init__(self, objects):
+        self.objects = dict(objects)
+        self.completed = []
+        self.aborted = []
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation_name):
+        objects = self.objects
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": key, "Size": len(body), "ETag": '"etag"'}
+                                    for key, body in sorted(objects.items()) if key.startswith(Prefix)]}
+        return Paginator()
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise botocore.exceptions.ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(self.objects[Key]), "ETag": '"etag"'}
+
+    def get_object(self, Bucket, Key):
+        body = botocore.response.StreamingBody(io.BytesIO(self.objects[Key]), len(self.objects[Key]))
+        return {"Body": body}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        return {"UploadId": "upload"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        return {"ETag": '"part-{}"'.format(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **condition):
+        if condition.get("IfNoneMatch") == "*" and Key in self.objects:
+            raise botocore.exceptions.ClientError({"Error": {"Code": "PreconditionFailed", "Message": "exists"}},
+                                                  "CompleteMultipartUpload")
+        self.completed.append((Key, condition))
+        self.objects[Key] = b"zip"
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return "https://example.com/" + Params["Key"]
+
+
+@pytest.fixture
+def bundle_magics(monkeypatch):
+    from IPython.core.interactiveshell import InteractiveShell
+
+    s3_client = FakeS3Client({"results/a.csv": b"a", "results/b.csv": b"b"})
+    magics = generate_s3_presigned_url.S3DownloadMagics(InteractiveShell.instance())
+    magics._s3_client = s3_client
+    monkeypatch.setattr(magics, "_get_transfer_client", lambda max_workers: s3_client)
+    monkeypatch.setattr(generate_s3_presigned_url, "display", lambda *args, **kwargs: None)
+    return magics
+
+
+def test_default_bundle_does_not_overwrite_an_existing_object(bundle_magics):
+    bundle_magics.s3_client.objects["results.zip"] = b"user data"
+
+    with pytest.raises(UsageError, match="already exists"):
+        bundle_magics.generate_s3_download_url("s3://bucket/results/ --bundle")
+
+    assert bundle_magics.s3_client.objects["results.zip"] == b"user data"
+    assert bundle_magics.s3_client.completed == []
+
+
+def test_default_bundle_is_written_only_if_absent(bundle_magics):
+    bundle_magics.generate_s3_download_url("s3://bucket/results/ --bundle")
+
+    assert bundle_magics.s3_client.completed == [("results.zip", {"IfNoneMatch": "*"})]
+
+
+def test_default_bundle_created_concurrently_is_kept(bundle_magics, monkeypatch):
+    # The object is created between the check and the end of the upload
+    monkeypatch.setattr(bundle_magics, "_head_s3_object", lambda s3_bucket, key: None)
+    bundle_magics.s3_client.objects["results.zip"] = b"user data"
+
+    with pytest.raises(UsageError, match="was created while"):
+        bundle_magics.generate_s3_download_url("s3://bucket/results/ --bundle")
+
+    assert bundle_magics.s3_client.objects["results.zip"] == b"user data"
+    assert bundle_magics.s3_client.aborted == ["results.zip"]
+
+
+def test_explicit_bundle_path_is_overwritten(bundle_magics):
+    bundle_magics.s3_client.objects["exports/results.zip"] = b"previous archive"
+
+    bundle_magics.generate_s3_download_url("s3://bucket/results/ --bundle s3://bucket/exports/results.zip")
+
+    assert bundle_magics.s3_client.completed == [("exports/results.zip", {})]
+
+
+def test_abort_does_not_require_cancel_futures():
+    s3_client = FakeS3Client({})
+    writer = S3MultipartUploadWriter(s3_client, "bucket", "bundle.zip", 0, 2)
+    shutdown = writer._pool.shutdown
+    # ThreadPoolExecutor.shutdown of Python < 3.9 has no cancel_futures argument
+    writer._pool.shutdown = lambda wait=True: shutdown(wait=wait)
+    writer.write(b"x" * (6 * 1024 * 1024))
+
+    writer.abort()
+
+    assert s3_client.aborted == ["bundle.zip"]
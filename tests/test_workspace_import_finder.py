@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import importlib
+import importlib.machinery
+import io
+import sys
+
+import pytest
+
+from emr_notebooks_magics.utils.workspace_import_finder import WorkspaceModuleFinder
+
+
+class FakeS3Client:
+
+    def __init__(self, files):
+        self.files = files
+
+    def get_paginator(self, operation_name):
+        files = self.files
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [{"Key": Prefix + path, "ETag": '"{}"'.format(hash(body))}
+                                    for path, body in files.items()]}
+        return Paginator()
+
+    def get_object(self, Bucket, Key):
+        body = self.files[Key.split("/", 1)[1]]
+        return {"Body": io.BytesIO(body), "ETag": '"{}"'.format(hash(body))}
+
+
+@pytest.fixture
+def install_finder(tmp_path):
+    finders = []
+
+    def install(files):
+        finder = WorkspaceModuleFinder(FakeS3Client(files), "bucket", "project", cache_dir=str(tmp_path))
+        finder.refresh()
+        finder.install()
+        finders.append(finder)
+        return finder
+
+    yield install
+    for finder in finders:
+        finder.uninstall()
+
+
+def test_finder_is_installed_before_the_path_finder(install_finder):
+    finder = install_finder({})
+
+    assert sys.meta_path.index(finder) == sys.meta_path.index(importlib.machinery.PathFinder) - 1
+    assert sys.meta_path.index(importlib.machinery.BuiltinImporter) < sys.meta_path.index(finder)
+
+
+def test_workspace_modules_are_imported(install_finder):
+    install_finder({"workspace_helpers.py": b"ANSWER = 42\n"})
+    try:
+        assert importlib.import_module("workspace_helpers").ANSWER == 42
+    finally:
+        sys.modules.pop("workspace_helpers", None)
+
+
+def test_builtin_modules_are_not_shadowed(install_finder):
+    name = next(name for name in sorted(sys.builtin_module_names) if name not in sys.modules and name != "sys")
+    install_finder({name + ".py": b"raise ImportError('shadowed')\n"})
+    try:
+        assert importlib.import_module(name).__spec__.origin == "built-in"
+    finally:
+        sys.modules.pop(name, None)
+
+
+def test_namespace_package_does_not_shadow_an_installed_package(install_finder, tmp_path, monkeypatch):
+    site_packages = tmp_path / "site-packages"
+    (site_packages / "installed_package").mkdir(parents=True)
+    (site_packages / "installed_package" / "__init__.py").write_text("INSTALLED = True\n")
+    monkeypatch.syspath_prepend(str(site_packages))
+    install_finder({"installed_package/examples.py": b"raise ImportError('shadowed')\n",
+                    "workspace_namespace/helpers.py": b"ANSWER = 42\n"})
+    try:
+        assert importlib.import_module("installed_package").INSTALLED
+        with pytest.raises(ImportError):
+            importlib.import_module("installed_package.examples")
+        assert importlib.import_module("workspace_namespace.helpers").ANSWER == 42
+    finally:
+        for name in ["installed_package", "installed_package.examples", "workspace_namespace",
+                     "workspace_namespace.helpers"]:
+            sys.modules.pop(name, None)
+
+
+def test_invalidate_caches_refreshes_lazily_and_ignores_errors(install_finder):
+    finder = install_finder({"workspace_helpers.py": b"ANSWER = 42\n"})
+    finder.s3_client.files = {"workspace_helpers.py": b"ANSWER = 42\n", "workspace_added.py": b"ADDED = True\n"}
+
+    def failing_get_paginator(operation_name):
+        raise ConnectionError("S3 is unreachable")
+
+    listing = finder.s3_client.get_paginator
+    finder.s3_client.get_paginator = failing_get_paginator
+    importlib.invalidate_caches()
+    assert finder.find_spec("workspace_added") is None
+
+    finder.s3_client.get_paginator = listing
+    importlib.invalidate_caches()
+    try:
+        assert importlib.import_module("workspace_added").ADDED
+    finally:
+        sys.modules.pop("workspace_added", None)
@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+
+import botocore.exceptions
+import pytest
+
+from emr_notebooks_magics.utils import workspace_sync
+from emr_notebooks_magics.utils.workspace_sync import WorkspaceSync
+
+
+class FakeS3Client:
+    """
+    S3 client whose uploads of the keys in failing_keys fail with an internal error.
+    """
+
+    def __init__(self, failing_keys=()):
+        self.failing_keys = set(failing_keys)
+        self.objects = {}
+        self.multipart_uploads = {}
+        self._lock = threading.Lock()
+
+    def _check(self, key, operation_name):
+        if key in self.failing_keys:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "InternalError", "Message": "internal error"},
+                 "ResponseMetadata": {"HTTPStatusCode": 500}}, operation_name)
+
+    def put_object(self, Bucket, Key, Body, **condition):
+        self._check(Key, "PutObject")
+        with self._lock:
+            self.objects[Key] = Body
+        return {"ETag": '"{}"'.format(len(Body))}
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self._lock:
+            upload_id = "upload-{}".format(len(self.multipart_uploads))
+            self.multipart_uploads[upload_id] = "started"
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+        return {"ETag": '"part-{}"'.format(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **condition):
+        self._check(Key, "CompleteMultipartUpload")
+        self.multipart_uploads[UploadId] = "completed"
+        return {"ETag": '"multipart"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.multipart_uploads[UploadId] = "aborted"
+
+
+@pytest.fixture
+def local_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace_sync, "MULTIPART_THRESHOLD", 1024)
+    monkeypatch.setattr(workspace_sync, "MULTIPART_PART_SIZE", 256)
+    local_dir = tmp_path / "project"
+    local_dir.mkdir()
+    for name in ["a.txt", "b.txt", "broken.txt"]:
+        (local_dir / name).write_text(name)
+    return local_dir
+
+
+def test_failed_flush_records_the_uploads_that_succeeded(local_dir):
+    s3_client = FakeS3Client(failing_keys=["project/broken.txt"])
+    sync = WorkspaceSync(s3_client, "bucket", "project", str(local_dir), read_only=False)
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        sync.flush()
+
+    s3_client.failing_keys.clear()
+    s3_client.objects.clear()
+    result = sync.flush()
+    assert sorted(s3_client.objects) == ["project/broken.txt"]
+    assert result.conflicts == []
+
+
+def test_failed_flush_leaves_no_multipart_upload_open(local_dir):
+    for i in range(4):
+        (local_dir / "large-{}.bin".format(i)).write_bytes(b"x" * 2048)
+    s3_client = FakeS3Client(failing_keys=["project/broken.txt", "project/large-1.bin"])
+    sync = WorkspaceSync(s3_client, "bucket", "project", str(local_dir), read_only=False, max_workers=2)
+
+    with pytest.raises(botocore.exceptions.ClientError):
+        sync.flush()
+
+    assert s3_client.multipart_uploads
+    assert "started" not in s3_client.multipart_uploads.values()